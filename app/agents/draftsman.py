@@ -1,65 +1,57 @@
 # app/agents/draftsman.py
-import matplotlib.pyplot as plt
+import matplotlib
 import matplotlib.patches as patches
+from matplotlib.collections import PatchCollection
+import numpy as np
+from matplotlib.figure import Figure
 from pathlib import Path
 from typing import Dict
 from app.schemas.layout import LayoutPlan  # ← Import Pydantic model
+from app.agents.flow_sim import simulate
+from app.agents.spatial_index import plan_index
+from app.state import as_plan
+import os
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
 
 ARTIFACT_DIR = Path("artifacts")
 ARTIFACT_DIR.mkdir(exist_ok=True)
 
-def draftsman_node(state: Dict) -> Dict:
-    """
-    Converts LayoutPlan (Pydantic model) → 2D PNG diagram.
-    """
-    # === 1. Reconstruct Pydantic model from dict ===
-    plan_dict = state["final_plan"]
-    try:
-        plan = LayoutPlan(**plan_dict)  # ← This gives you .dimensions_m, .zones, etc.
-    except Exception as e:
-        raise ValueError(f"Invalid layout plan: {e}") from e
+# Overlay the simulated shopper density on top of the zones (labels stay above it)
+FLOW_HEATMAP = os.getenv("DRAFTSMAN_FLOW_HEATMAP", "0") in ("1", "true", "True")
+# Above this many zones on a floor, only zones with room for a label get one
+LABEL_MAX_ZONES = int(os.getenv("DRAFTSMAN_LABEL_MAX_ZONES", "40"))
+LEGEND_MAX = 30
+# Diagrams kept in ARTIFACT_DIR; older ones are deleted (a finished layout redraws a missing one)
+MAX_DIAGRAMS = int(os.getenv("DRAFTSMAN_MAX_DIAGRAMS", "500"))
 
-    city = state["city"]
-    output_path = ARTIFACT_DIR / f"layout_{city.lower()}.png"
+def _prune_diagrams(keep: Path) -> None:
+    """Delete the oldest `layout_*.png` beyond MAX_DIAGRAMS, never the one just written."""
+    if MAX_DIAGRAMS <= 0:
+        return
+    diagrams = []
+    for path in ARTIFACT_DIR.glob("layout_*.png"):
+        try:
+            diagrams.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue  # pruned by a concurrent render
+    if len(diagrams) <= MAX_DIAGRAMS:
+        return
+    diagrams.sort()
+    for _, path in diagrams[:len(diagrams) - MAX_DIAGRAMS]:
+        if path != keep:
+            path.unlink(missing_ok=True)
 
-    # === 2. Plotting ===
-    fig, ax = plt.subplots(1, figsize=(12, 8))
-    ax.set_xlim(0, plan.dimensions_m[0])
-    ax.set_ylim(0, plan.dimensions_m[1])
-    ax.set_aspect('equal')
-    ax.set_title(f"{plan.store_name} - {plan.city}\nAdaptive Retail Layout", fontsize=14, pad=20)
-    ax.set_xlabel("Length (m)")
-    ax.set_ylabel("Width (m)")
-
-    # Color palette
-    colors = plt.cm.Set3.colors
-
-    for i, zone in enumerate(plan.zones):
-        color = colors[i % len(colors)]
-        rect = patches.Rectangle(
-            (zone.x, zone.y), zone.width, zone.height,
-            linewidth=2, edgecolor='black', facecolor=color, alpha=0.7,
-            label=zone.name
-        )
-        ax.add_patch(rect)
-
-        # Zone label
-        products = ', '.join(zone.products[:2]) if zone.products else "Empty"
-        ax.text(
-            zone.x + zone.width / 2,
-            zone.y + zone.height / 2,
-            f"{zone.name}\n{products}",
-            ha='center', va='center', fontsize=9, fontweight='bold',
-            color='black',
-            bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8)
-        )
-
-    # Entrance arrow
+def _entrance(ax, plan: LayoutPlan):
+    """Entrance arrow on the entrance-level panel."""
+    length, width = plan.floor_dimensions(0)
     entrance_map = {
-        "south": (plan.dimensions_m[0] / 2, 0),
-        "north": (plan.dimensions_m[0] / 2, plan.dimensions_m[1]),
-        "east": (plan.dimensions_m[0], plan.dimensions_m[1] / 2),
-        "west": (0, plan.dimensions_m[1] / 2)
+        "south": (length / 2, 0),
+        "north": (length / 2, width),
+        "east": (length, width / 2),
+        "west": (0, width / 2)
     }
     ex, ey = entrance_map[plan.entrance_side]
 
@@ -76,23 +68,103 @@ def draftsman_node(state: Dict) -> Dict:
         ha='center', va='center'
     )
 
+def draftsman_node(state: Dict) -> Dict:
+    """
+    Converts LayoutPlan (Pydantic model) → 2D PNG diagram.
+    """
+    # === 1. Plan arrives as a LayoutPlan by reference; dicts (scripts, old callers) are validated ===
+    try:
+        plan = as_plan(state["final_plan"])  # ← This gives you .dimensions_m, .zones, etc.
+    except Exception as e:
+        raise ValueError(f"Invalid layout plan: {e}") from e
+
+    # One file per run: concurrent requests for the same city must not overwrite each other's diagram
+    output_path = ARTIFACT_DIR / f"layout_{state.get('layout_id') or uuid.uuid4().hex}.png"
+
+    # === 2. Plotting ===
+    # Object API instead of pyplot: no global figure registry, so concurrent
+    # renders on worker threads don't race and nothing leaks if we raise.
+    # One panel per floor; zones on a floor come from the plan's spatial index.
+    index = plan_index(plan)
+    levels = plan.levels
+    fig = Figure(figsize=(12, 8 * len(levels)))
+    axes = fig.subplots(len(levels), 1, squeeze=False)[:, 0]
+    colors = matplotlib.colormaps["Set3"].colors
+    legend = {}
+
+    for ax, level in zip(axes, levels):
+        length, width = plan.floor_dimensions(level)
+        ax.set_xlim(0, length)
+        ax.set_ylim(0, width)
+        ax.set_aspect('equal')
+        floor_name = next((f.name for f in plan.floors if f.level == level and f.name), f"Level {level}")
+        title = f"{plan.store_name} - {plan.city}\nAdaptive Retail Layout"
+        ax.set_title(f"{title} - {floor_name}" if len(levels) > 1 else title, fontsize=14, pad=20)
+        ax.set_xlabel("Length (m)")
+        ax.set_ylabel("Width (m)")
+
+        if FLOW_HEATMAP and level == 0:
+            trends = (state.get("market_trends") or {}).get("payload", {}).get("signals")
+            try:
+                density = simulate(plan, trends).heatmap
+                ax.imshow(
+                    np.ma.masked_equal(density, 0), extent=(0, length, 0, width),
+                    origin="lower", cmap="hot_r", alpha=0.45, zorder=2, interpolation="bilinear"
+                )
+            except Exception as e:
+                logger.warning(f"Flow heatmap skipped: {e}")
+
+        # One collection per floor instead of a patch per zone: hundreds of zones stay cheap to draw
+        ids = index.zones.on_level(level)
+        zone_colors = [colors[i % len(colors)] for i in ids]
+        ax.add_collection(PatchCollection(
+            [patches.Rectangle((plan.zones[i].x, plan.zones[i].y), plan.zones[i].width, plan.zones[i].height) for i in ids],
+            facecolors=zone_colors, edgecolors='black', linewidths=2 if len(ids) <= LABEL_MAX_ZONES else 0.5, alpha=0.7,
+        ))
+        fixture_ids = index.fixtures.on_level(level)
+        if fixture_ids.size:
+            x, y, w, h = index.fixtures.rects[fixture_ids].T
+            ax.add_collection(PatchCollection(
+                [patches.Rectangle(xy, fw, fh) for xy, fw, fh in zip(zip(x, y), w, h)],
+                facecolors='dimgray', edgecolors='black', linewidths=0.3, alpha=0.8, zorder=3,
+            ))
+
+        # Zone labels; on crowded floors only for zones big enough to hold one
+        min_area = 0 if len(ids) <= LABEL_MAX_ZONES else length * width / LABEL_MAX_ZONES
+        for i, color in zip(ids, zone_colors):
+            zone = plan.zones[i]
+            legend.setdefault(zone.name, color)
+            if zone.width * zone.height < min_area:
+                continue
+            products = ', '.join(zone.products[:2]) if zone.products else "Empty"
+            ax.text(
+                zone.x + zone.width / 2,
+                zone.y + zone.height / 2,
+                f"{zone.name}\n{products}",
+                ha='center', va='center', fontsize=9, fontweight='bold',
+                color='black', zorder=4,
+                bbox=dict(boxstyle="round,pad=0.3", facecolor='white', alpha=0.8)
+            )
+
+        if level == 0:
+            _entrance(ax, plan)
+
     # Legend
-    handles, labels = ax.get_legend_handles_labels()
-    by_label = dict(zip(labels, handles))
-    ax.legend(by_label.values(), by_label.keys(), loc='upper left', bbox_to_anchor=(1, 1))
+    handles = [patches.Patch(facecolor=c, edgecolor='black', alpha=0.7, label=n) for n, c in list(legend.items())[:LEGEND_MAX]]
+    axes[0].legend(handles=handles, loc='upper left', bbox_to_anchor=(1, 1))
 
     # Compliance notes
     if plan.compliance_notes:
         notes = "\n".join(plan.compliance_notes[:3])
-        ax.text(0.02, 0.98, f"Compliance: {notes}", transform=ax.transAxes,
-                fontsize=8, verticalalignment='top',
-                bbox=dict(boxstyle="round", facecolor="lightgreen", alpha=0.9))
+        axes[0].text(0.02, 0.98, f"Compliance: {notes}", transform=axes[0].transAxes,
+                     fontsize=8, verticalalignment='top',
+                     bbox=dict(boxstyle="round", facecolor="lightgreen", alpha=0.9))
 
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close(fig)
+    fig.tight_layout()
+    fig.savefig(output_path, dpi=150, bbox_inches='tight')
+    _prune_diagrams(output_path)
 
-    print(f"Layout diagram saved: {output_path.resolve()}")
+    logger.info(f"Layout diagram saved: {output_path.resolve()}")
 
     return {
         "diagram_path": str(output_path.resolve()),
@@ -1,13 +1,161 @@
-CITY_TO_GEO = {
-    "surat":      {"geo": "IN", "sub_geo": "IN-GJ", "state": "Gujarat"},
-    "ahmedabad":  {"geo": "IN", "sub_geo": "IN-GJ", "state": "Gujarat"},
-    "mumbai":     {"geo": "IN", "sub_geo": "IN-MH", "state": "Maharashtra"},
-    "delhi":      {"geo": "IN", "sub_geo": "IN-DL", "state": "Delhi"},
-    "bangalore":  {"geo": "IN", "sub_geo": "IN-KA", "state": "Karnataka"},
-}
+# agents/geo_resolver.py
+"""
+City → Google Trends geo resolution backed by a gazetteer.
+
+The gazetteer is a CSV (`name,kind,geo,sub_geo,state,aliases`, aliases
+separated by `|`) loaded once per process. The bundled file covers every
+Indian state/UT, its major cities and district headquarters, historical
+names (Bombay, Madras, Baroda, ...) and a set of international metros; point
+`GEO_GAZETTEER_PATH` at a larger export in the same format to extend it.
+District names that exist in two states are listed once plainly and once
+qualified by state ("Aurangabad" is Maharashtra, "Aurangabad, Bihar" Bihar).
+
+Lookups go:
+    1. normalized-name hash index (names and aliases), O(1);
+    2. trigram index → candidate set → edit distance, for typos
+       ("Ahmadabad", "Banglore");
+and resolved results are memoized in an LRU.
+
+A typo match must be within GEO_FUZZY_MAX_EDITS edits (one for names under
+eight letters) and unambiguous: short Indian place names sit one or two
+letters apart (Etah / Etawah, Kolar / Akola, Mumbra / Mumbai), and serving
+another state's Trends data is worse than rejecting the city.
+
+Configuration (environment variables):
+    GEO_GAZETTEER_PATH      gazetteer CSV (default app/data/gazetteer.csv)
+    GEO_FUZZY_MAX_EDITS     edits allowed for a typo match of 8+ letters (default 2)
+"""
+import csv
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+GAZETTEER_PATH = Path(os.getenv(
+    "GEO_GAZETTEER_PATH",
+    Path(__file__).resolve().parents[1] / "data" / "gazetteer.csv",
+))
+FUZZY_MAX_EDITS = int(os.getenv("GEO_FUZZY_MAX_EDITS", "2"))
+SHORT_NAME = 8  # names shorter than this allow a single edit
+
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_SUFFIXES = (" city", " district", " metropolitan region")
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case, strip accents/punctuation and generic suffixes ("Pune City" → "pune")."""
+    text = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+    text = _NON_WORD.sub(" ", text.lower().replace("-", " "))
+    text = " ".join(text.split())
+    for suffix in _SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[: -len(suffix)]
+    return text
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Optimal-string-alignment distance: insertions, deletions, substitutions, adjacent swaps."""
+    prev2, prev = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if prev2 is not None and i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _max_edits(key: str) -> int:
+    return min(1, FUZZY_MAX_EDITS) if len(key) < SHORT_NAME else FUZZY_MAX_EDITS
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+class Gazetteer:
+    """Hash index over names/aliases plus a trigram index for fuzzy lookup."""
+
+    def __init__(self, records: List[Dict]):
+        self.records = records
+        self.by_name: Dict[str, int] = {}
+        self.trigram_index: Dict[str, List[int]] = defaultdict(list)
+        self._keys: List[tuple] = []  # (normalized name, record id)
+
+        # States first so a same-named city (Delhi, Chandigarh) wins the slot
+        order = sorted(range(len(records)), key=lambda i: records[i].get("kind") != "state")
+        for rid in order:
+            rec = records[rid]
+            names = [rec["name"]] + [a for a in rec.get("aliases", "").split("|") if a]
+            for name in names:
+                key = normalize_name(name)
+                if not key:
+                    continue
+                self.by_name[key] = rid
+                self._keys.append((key, rid))
+
+        for kid, (key, _) in enumerate(self._keys):
+            for tri in set(_trigrams(key)):
+                self.trigram_index[tri].append(kid)
+
+    @classmethod
+    def from_csv(cls, path: Path) -> "Gazetteer":
+        with Path(path).open("r", encoding="utf-8", newline="") as f:
+            return cls([dict(row) for row in csv.DictReader(f)])
+
+    def exact(self, name: str) -> Optional[Dict]:
+        rid = self.by_name.get(normalize_name(name))
+        return None if rid is None else self.records[rid]
+
+    def fuzzy(self, name: str, max_edits: Optional[int] = None, candidates: int = 20) -> Optional[Dict]:
+        """Closest name within `max_edits`, or None if there is none or two places tie."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        limit = _max_edits(key) if max_edits is None else max_edits
+        grams = _trigrams(key)
+        counts = Counter(kid for tri in set(grams) for kid in self.trigram_index.get(tri, ()))
+        best: Dict[int, set] = defaultdict(set)  # distance → sub_geos at that distance
+        best_rid = {}
+        for kid, _ in counts.most_common(candidates):
+            cand, rid = self._keys[kid]
+            if abs(len(cand) - len(key)) > limit:
+                continue
+            dist = edit_distance(key, cand)
+            if dist <= limit:
+                best[dist].add(self.records[rid]["sub_geo"])
+                best_rid.setdefault(dist, rid)
+        if not best:
+            return None
+        closest = min(best)
+        return self.records[best_rid[closest]] if len(best[closest]) == 1 else None
+
+    def lookup(self, name: str) -> Optional[Dict]:
+        return self.exact(name) or self.fuzzy(name)
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    return Gazetteer.from_csv(GAZETTEER_PATH)
+
+
+@lru_cache(maxsize=4096)
+def _resolve(city_key: str) -> Optional[tuple]:
+    rec = get_gazetteer().lookup(city_key)
+    if rec is None:
+        return None
+    return (rec["geo"], rec["sub_geo"], rec["state"], rec["name"])
+
 
 def resolve_geo(city: str):
     city = city.strip().lower()
-    if city not in CITY_TO_GEO:
+    hit = _resolve(city)
+    if hit is None:
         raise ValueError(f"Unsupported city: {city}")
-    return CITY_TO_GEO[city]
\ No newline at end of file
+    geo, sub_geo, state, name = hit
+    return {"geo": geo, "sub_geo": sub_geo, "state": state, "city": name}
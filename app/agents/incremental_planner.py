@@ -0,0 +1,230 @@
+# agents/incremental_planner.py
+"""
+Incremental re-planning when only market trends change.
+
+Zones such as the entrance, checkout and decompression zone depend on the
+floorplate and code constraints, not on trends. Given the previous
+`LayoutPlan` and the `package_signals` output it was planned against, this
+module diffs the old and new signals, picks the merchandise zones whose
+assortment is affected, and asks the LLM to re-assign `products`/`fixtures`
+for those zones only. Every other zone, and all geometry, is carried over
+and verified unchanged. A previous plan for a different city or entrance
+side is rejected with `PlanMismatch` rather than re-stocked.
+"""
+import json
+import re
+from typing import Dict, List, Optional, Set
+
+from langchain_core.messages import HumanMessage
+from pydantic import BaseModel, Field, ValidationError
+
+from app.rate_limiter import get_rate_limiter, estimate_tokens
+from app.resilience import breaker
+from app.schemas.layout import LayoutPlan
+
+# Zones whose placement and content come from the floorplate / code, never from trends
+STRUCTURAL_ZONE_RE = re.compile(
+    r"entrance|entry|exit|checkout|cash|billing|pos\b|decompression|storage|stock|back ?office|fitting|restroom|service",
+    re.IGNORECASE,
+)
+SCORE_CHANGE_THRESHOLD = 10.0
+SIGNAL_SERIES = ("interest_over_time_national", "interest_over_time_state")
+
+REASSIGN_PROMPT = """
+You are updating an existing retail layout for {store_name} in {city}. The
+floorplate, zone geometry and structural zones stay exactly as they are.
+
+Market trends changed:
+{trend_diff}
+
+Current top trends:
+{trends_summary}
+
+Re-assign products and fixtures for ONLY these zones (geometry is fixed):
+{zones}
+
+Call the `ZoneAssignments` tool with one entry per zone listed above.
+"""
+
+
+class PlanMismatch(ValueError):
+    """The previous plan was made for another site than the one requested."""
+
+
+class ZoneAssignment(BaseModel):
+    name: str
+    products: List[str] = Field(default_factory=list)
+    fixtures: List[str] = Field(default_factory=list)
+
+
+class ZoneAssignments(BaseModel):
+    """New merchandise for the listed zones, matched by zone name."""
+    zones: List[ZoneAssignment] = Field(default_factory=list)
+
+
+# === Diff ===
+def _scores(signals: dict) -> Dict[str, float]:
+    scores: Dict[str, float] = {}
+    for series in SIGNAL_SERIES:
+        for item in (signals or {}).get(series, []) or []:
+            kw = item["keyword"].strip().lower()
+            scores[kw] = max(scores.get(kw, 0.0), float(item["score"]))
+    return scores
+
+
+def diff_signals(old: dict, new: dict, threshold: float = SCORE_CHANGE_THRESHOLD) -> Dict:
+    """Keywords added, removed, or whose score moved by at least `threshold`."""
+    before, after = _scores(old), _scores(new)
+    changed = {
+        kw: (before[kw], after[kw])
+        for kw in before.keys() & after.keys()
+        if abs(after[kw] - before[kw]) >= threshold
+    }
+    return {
+        "added": sorted(after.keys() - before.keys()),
+        "removed": sorted(before.keys() - after.keys()),
+        "changed": changed,
+    }
+
+
+def is_empty(diff: Dict) -> bool:
+    return not (diff["added"] or diff["removed"] or diff["changed"])
+
+
+# === Affected zones ===
+def is_structural(zone_name: str) -> bool:
+    return bool(STRUCTURAL_ZONE_RE.search(zone_name))
+
+
+def affected_zones(plan: LayoutPlan, diff: Dict) -> List[str]:
+    """
+    Merchandise zones to re-assign: those stocking a removed/changed keyword,
+    plus, when new keywords appeared, the weakest-stocked merchandise zones
+    so the newcomers have somewhere to go.
+    """
+    touched = set(diff["removed"]) | set(diff["changed"])
+    # Whole-word match, so "phones" does not pull in a zone stocking "headphones"
+    touched_re = [re.compile(rf"\b{re.escape(kw)}\b") for kw in touched]
+    merch = [z for z in plan.zones if not is_structural(z.name)]
+    names: List[str] = []
+    for zone in merch:
+        stock = " | ".join(zone.products + zone.fixtures).lower()
+        if any(r.search(stock) for r in touched_re):
+            names.append(zone.name)
+    if diff["added"]:
+        spare = sorted((z for z in merch if z.name not in names), key=lambda z: len(z.products))
+        names.extend(z.name for z in spare[: len(diff["added"])])
+    return names
+
+
+# === Apply ===
+def _norm(value: Optional[str]) -> str:
+    return " ".join((value or "").split()).casefold()
+
+
+def check_site(plan: LayoutPlan, city: str, entrance_side: str) -> None:
+    """Raise `PlanMismatch` unless `plan` was made for this city and entrance side."""
+    if _norm(plan.city) != _norm(city):
+        raise PlanMismatch(f"previous plan is for '{plan.city}', not '{city}'")
+    if _norm(plan.entrance_side) != _norm(entrance_side):
+        raise PlanMismatch(f"previous plan has its entrance on the {plan.entrance_side}, not the {entrance_side}")
+
+
+def apply_assignments(plan: LayoutPlan, targets: List[str], assignments: ZoneAssignments) -> LayoutPlan:
+    """New plan with only `targets` re-stocked; raises if anything else would change."""
+    by_name = {a.name: a for a in assignments.zones if a.name in targets}
+    updated = plan.model_copy(deep=True)
+    for zone in updated.zones:
+        a = by_name.get(zone.name)
+        if a is not None:
+            zone.products = a.products
+            zone.fixtures = a.fixtures
+
+    # Geometry and untouched zones must be carried over exactly
+    for before, after in zip(plan.zones, updated.zones):
+        same_shape = (before.name, before.floor, before.x, before.y, before.width, before.height) == (
+            after.name, after.floor, after.x, after.y, after.width, after.height
+        )
+        if not same_shape or (before.name not in targets and before != after):
+            raise ValueError(f"Incremental re-plan changed fixed zone '{before.name}'")
+    return updated
+
+
+def _prompt(plan: LayoutPlan, targets: Set[str], diff: Dict, signals: dict) -> str:
+    trends_summary = "\n".join(
+        f"- {item['keyword']}: {item['score']}"
+        for item in (signals or {}).get("interest_over_time_national", [])[:5]
+    )
+    zones = [
+        {"name": z.name, "width_m": z.width, "height_m": z.height, "products": z.products, "fixtures": z.fixtures}
+        for z in plan.zones if z.name in targets
+    ]
+    return REASSIGN_PROMPT.format(
+        store_name=plan.store_name,
+        city=plan.city,
+        trend_diff=json.dumps(diff, separators=(",", ":")),
+        trends_summary=trends_summary,
+        zones=json.dumps(zones, separators=(",", ":")),
+    )
+
+
+def parse_assignments(message) -> Optional[ZoneAssignments]:
+    for call in getattr(message, "tool_calls", None) or []:
+        if call.get("name") == "ZoneAssignments":
+            try:
+                return ZoneAssignments.model_validate(call.get("args") or {})
+            except ValidationError:
+                return None
+    return None
+
+
+class IncrementalPlanner:
+    """Re-assigns merchandise for trend-affected zones of an existing plan."""
+
+    def __init__(self, llm):
+        self.llm = llm.bind_tools([ZoneAssignments], tool_choice="ZoneAssignments")
+        self.limiter = get_rate_limiter()
+        self.breaker = breaker("llm")
+
+    def _prepare(self, previous: LayoutPlan, old_signals: dict, new_signals: dict):
+        diff = diff_signals(old_signals, new_signals)
+        if is_empty(diff):
+            return diff, []
+        return diff, affected_zones(previous, diff)
+
+    def _invoke(self, prompt: str):
+        with self.limiter.reserve(estimate_tokens(prompt)) as settle:
+            reply = self.llm.invoke([HumanMessage(content=prompt)])
+            settle(reply)
+        return reply
+
+    async def _ainvoke(self, prompt: str):
+        async with self.limiter.areserve(estimate_tokens(prompt)) as settle:
+            reply = await self.llm.ainvoke([HumanMessage(content=prompt)])
+            settle(reply)
+        return reply
+
+    def replan(self, previous: LayoutPlan, old_signals: dict, new_signals: dict,
+               city: str, entrance_side: str) -> Optional[LayoutPlan]:
+        """Updated plan, the previous plan if nothing relevant changed, or None on failure."""
+        check_site(previous, city, entrance_side)
+        diff, targets = self._prepare(previous, old_signals, new_signals)
+        if not targets:
+            return previous
+        prompt = _prompt(previous, set(targets), diff, new_signals)
+        assignments = parse_assignments(self.breaker.call(self._invoke, prompt))
+        if assignments is None:
+            return None
+        return apply_assignments(previous, targets, assignments)
+
+    async def areplan(self, previous: LayoutPlan, old_signals: dict, new_signals: dict,
+                      city: str, entrance_side: str) -> Optional[LayoutPlan]:
+        check_site(previous, city, entrance_side)
+        diff, targets = self._prepare(previous, old_signals, new_signals)
+        if not targets:
+            return previous
+        prompt = _prompt(previous, set(targets), diff, new_signals)
+        assignments = parse_assignments(await self.breaker.acall(self._ainvoke, prompt))
+        if assignments is None:
+            return None
+        return apply_assignments(previous, targets, assignments)
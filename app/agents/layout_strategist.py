@@ -2,60 +2,166 @@
 from typing import TypedDict, Annotated, Literal
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-import operator
-from langchain_openai import AzureChatOpenAI
+from langgraph.config import get_stream_writer
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langchain_core.output_parsers import PydanticOutputParser
-from app.tools.rag_tool import rag_tool, RAGInput
-from app.schemas.layout import LayoutPlan
+from app.tools.rag_tool import rag_structured_tool, RAGInput
+from app.schemas.layout import LayoutPlan, Zone
+from app.agents.structured_planner import StructuredPlanner, FORMAT_INSTRUCTIONS
+from app.agents.incremental_planner import IncrementalPlanner
+from app.agents.packed_planner import PackedPlanner
+from app.agents.zone_packer import try_pack_zones, default_dimensions, merchandise_specs, FALLBACK_MERCH_ZONE
+from app.agents.flow_sim import simulate, FLOW_SIM_ENABLED
+from app.agents.spatial_index import validate_plan
 import json
 from app.utils import load_env_file
 from app.prompt_loader import PromptManager
+from app.clients import get_llm, run_blocking
+from app.state import bounded_messages, as_plan
+from app.resilience import breaker, Hedger, hedged, time_left, CircuitOpenError
+from app.rate_limiter import get_rate_limiter, estimate_tokens
+from app.llm_cache import build_llm_cache, prompt_scope
+from app.profiling import instrumented_node
+from app.structured_logging import log_event
+from app.context_builder import build_context, compact_json, count_tokens, PLANNER_CONTEXT_TOKENS, REVIEWER_CONTEXT_TOKENS
+from app.constraint_digests import render_constraints, known_city
 import os
+import logging
 # from langfuse.decorators import observe
 
 # === Load Environment ===
 load_env_file()
+logger = logging.getLogger(__name__)
 
 # === LLM Setup ===
-llm = AzureChatOpenAI(
-    azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
-    temperature=0
+# Shared client: pooled keep-alive transport from app.clients
+llm = get_llm()
+
+# === Prompts ===
+# Rendered from the compiled bundle at call time, so a hot reload applies to
+# the next request; looked up here so a missing prompt fails at import.
+PLANNER_PROMPT = "layout_strategist"
+REVIEWER_PROMPT = "reviewer"
+for _name in (PLANNER_PROMPT, REVIEWER_PROMPT):
+    PromptManager.compiled(_name)
+
+# === Completion cache (exact + optional semantic, see app.llm_cache) ===
+llm_cache = build_llm_cache()
+
+# === Resilience: shared breaker for Azure OpenAI, p95 hedging on async calls ===
+llm_breaker = breaker("llm")
+llm_hedger = Hedger("llm")
+# Skip the reviewer when less than this is left of the strategist budget
+REVIEW_MIN_S = float(os.getenv("REVIEW_MIN_S", "15"))
+
+# === Deployment TPM/RPM limiter, shared by every concurrent request ===
+llm_limiter = get_rate_limiter()
+
+def _limited(call, prompt: str):
+    tokens = estimate_tokens(prompt)
+    with llm_limiter.reserve(tokens) as settle:
+        response = call(prompt)
+        settle(response)
+    return response
+
+async def _alimited(acall, prompt: str):
+    tokens = estimate_tokens(prompt)
+    async with llm_limiter.areserve(tokens) as settle:
+        response = await acall(prompt)
+        settle(response)
+    return response
+
+def _scope(prompt_name: str, state) -> tuple:
+    # Per site, so a semantic hit can't return another city's plan
+    return prompt_scope(prompt_name, state["city"], state["entrance_side"])
+
+def _invoke_cached(prompt: str, scope, call=None):
+    """Returns (response, from_cache). `call` overrides the plain LLM call on a miss."""
+    if llm_cache is not None:
+        cached = llm_cache.get(prompt, scope)
+        if cached is not None:
+            return AIMessage(content=cached), True
+    if call is None:
+        call = lambda p: llm.invoke([HumanMessage(content=p)])
+    return llm_breaker.call(_limited, call, prompt), False
+
+async def _ainvoke_cached(prompt: str, scope, acall=None, hedge: bool = True):
+    """`hedge=False` for streaming calls, whose side effects (zone previews) must not run twice."""
+    if llm_cache is not None:
+        cached = await llm_cache.aget(prompt, scope)
+        if cached is not None:
+            return AIMessage(content=cached), True
+    if acall is None:
+        acall = lambda p: llm.ainvoke([HumanMessage(content=p)])
+    if hedge:
+        # Each hedge is a real request, so each one takes from the limiter
+        return await llm_breaker.acall(hedged, lambda: _alimited(acall, prompt), llm_hedger), False
+    return await llm_breaker.acall(_alimited, acall, prompt), False
+
+# === Structured-output planner (streams and validates zone by zone) ===
+def _repair_guard(call, prompt: str):
+    # Repairs run inside the planner's `llm_breaker.call`, so their failures already
+    # count; a nested breaker call would be refused during a half-open probe.
+    if llm_breaker.state == "open":
+        raise CircuitOpenError("llm circuit opened mid-plan; skipping zone repair")
+    return _limited(call, prompt)
+
+async def _arepair_guard(acall, prompt: str):
+    if llm_breaker.state == "open":
+        raise CircuitOpenError("llm circuit opened mid-plan; skipping zone repair")
+    return await _alimited(acall, prompt)
+
+structured_planner = (
+    StructuredPlanner(llm, guard=_repair_guard, aguard=_arepair_guard)
+    if os.getenv("PLANNER_STRUCTURED_OUTPUT", "1") not in ("0", "false", "False")
+    else None
 )
 
-# Test connection
-try:
-    llm.invoke("hello")
-    print("LLM connected successfully.")
-except Exception as e:
-    print(f"LLM connection failed: {e}")
+# === Geometry mode: "packer" (deterministic zones, LLM assigns merchandise) or "llm" ===
+packed_planner = (
+    PackedPlanner(llm)
+    if os.getenv("PLANNER_GEOMETRY", "packer") == "packer"
+    else None
+)
 
-# === Prompts ===
-PLANNER_PROMPT = PromptManager.get("layout_strategist")
-REVIEWER_PROMPT = PromptManager.get("reviewer")
+def _emit_zone_preview(index: int, zone: Zone):
+    """Push each validated zone to `stream_mode="custom"` consumers as it arrives."""
+    try:
+        writer = get_stream_writer()
+    except Exception:
+        return  # not running inside a graph (scripts, tests)
+    writer({"type": "zone_preview", "index": index, "zone": zone.model_dump()})
 
 # === Parser ===
 parser = PydanticOutputParser(pydantic_object=LayoutPlan)
 
 # === Tools ===
-tools = [rag_tool]
+tools = [rag_structured_tool]
 
 # === Enriched ToolNode to populate `retrieved` ===
 class RetrievalEnrichedToolNode(ToolNode):
-    def __call__(self, state: 'StrategistState'):
-        result = super().__call__(state)
+    """ToolNode that also copies the retrieved chunks into `state["retrieved"]`.
+
+    Overrides `invoke`/`ainvoke` (what LangGraph actually calls) so the
+    enrichment runs on both the sync and async graph paths.
+    """
+    @staticmethod
+    def _enrich(result: dict) -> dict:
         tool_msg = next((m for m in result["messages"] if isinstance(m, ToolMessage)), None)
         if tool_msg:
             try:
                 output = json.loads(tool_msg.content)
-                result["retrieved"] = output.get("retrieved", [])
+                result["retrieved"] = output.get("retrieved", output.get("retrieved_chunks", []))
             except:
                 result["retrieved"] = []
         return result
 
+    def invoke(self, input, config=None, **kwargs):
+        return self._enrich(super().invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return self._enrich(await super().ainvoke(input, config, **kwargs))
+
 tool_node = RetrievalEnrichedToolNode(tools)
 
 # === State ===
@@ -64,36 +170,39 @@ class StrategistState(TypedDict):
     city: str
     trends: dict
     entrance_side: str
-    messages: Annotated[list, operator.add]
+    messages: Annotated[list, bounded_messages]
     retrieved: list
-    draft_plan: dict
+    deadline: float  # time.time() by which the loop should return a layout
+    draft_plan: LayoutPlan
     review: dict
     final_plan: LayoutPlan
     iteration: int
+    dimensions_m: tuple
+    # Incremental mode: the plan to update and the signals it was built from
+    previous_plan: LayoutPlan
+    previous_trends: dict
 
 # === Nodes ===
 
-# @observe(name="RAG Node")
-def rag_node(state: StrategistState):
-    """Builds RAG query and triggers tool call."""
+def _rag_query(state: StrategistState) -> str:
     if state.get("iteration", 0) == 0:
-        query = (
+        return (
             f"Blue Retail store layout constraints for {state['city']}: "
             "north wall, accessibility, fixture catalog, brand guidelines, "
             "decompression zone, aisle width, customer flow, leasing agreement"
         )
-    else:
-        issues = state["review"].get("issues", [])
-        suggestions = state["review"].get("suggestions", [])
-        problems = issues + suggestions
-        query = (
-            f"Fix layout issues in {state['city']}: {'; '.join(problems[:3])}"
-            if problems
-            else f"Improve best practices for {state['city']} store layout"
-        )
+    issues = state["review"].get("issues", [])
+    suggestions = state["review"].get("suggestions", [])
+    problems = issues + suggestions
+    return (
+        f"Fix layout issues in {state['city']}: {'; '.join(problems[:3])}"
+        if problems
+        else f"Improve best practices for {state['city']} store layout"
+    )
 
+def _rag_tool_call_prompt(query: str) -> str:
     # Trigger tool call via LLM (ensures ToolNode runs)
-    tool_call_prompt = f"""
+    return f"""
 You need more context. CALL `rag_tool` with:
 
 Query: {query}
@@ -101,8 +210,8 @@ Top-K: 10
 
 Respond **only** with a tool call.
 """
-    response = llm.invoke([HumanMessage(content=tool_call_prompt)])
 
+def _rag_result(state: StrategistState, query: str, response) -> dict:
     if response.tool_calls:
         return {
             "messages": [response],
@@ -124,25 +233,144 @@ Respond **only** with a tool call.
             "iteration": state.get("iteration", 0) + 1
         }
 
-# @observe(name="Planner Node")
-def planner_node(state: StrategistState):
+# @observe(name="RAG Node")
+def rag_node(state: StrategistState):
+    """Builds RAG query and triggers tool call."""
+    query = _rag_query(state)
+    call = lambda p: llm.invoke([HumanMessage(content=p)])
+    try:
+        response = llm_breaker.call(_limited, call, _rag_tool_call_prompt(query))
+    except Exception as e:
+        # The query is known either way: fall through to the forced tool call
+        logger.warning(f"RAG routing call failed: {e}")
+        response = AIMessage(content="")
+    return _rag_result(state, query, response)
+
+async def arag_node(state: StrategistState):
+    """Async variant of `rag_node`."""
+    query = _rag_query(state)
+    acall = lambda p: llm.ainvoke([HumanMessage(content=p)])
+    try:
+        response = await llm_breaker.acall(_alimited, acall, _rag_tool_call_prompt(query))
+    except Exception as e:
+        logger.warning(f"RAG routing call failed: {e}")
+        response = AIMessage(content="")
+    return _rag_result(state, query, response)
+
+def _dimensions(state: StrategistState) -> tuple:
+    return tuple(state.get("dimensions_m") or default_dimensions())
+
+def _packed_zones(state: StrategistState):
+    # Memoized in zone_packer, so prompt and call share one packing; None if the floorplate can't be packed
+    return try_pack_zones(_dimensions(state), state["entrance_side"], state["trends"])
+
+def _use_packer(state: StrategistState) -> bool:
+    """Packed geometry when configured and the floorplate packs; otherwise the LLM draws zones."""
+    return packed_planner is not None and _packed_zones(state) is not None
+
+def _context(state: StrategistState, budget: int) -> str:
+    """
+    Distilled constraints for the city first, retrieved chunks in what's left of the budget.
+    A city with a site digest gets the digest alone: its chunks are the passages the digest
+    was extracted from, so they would repeat it.
+    """
+    if known_city(state["city"]):
+        return render_constraints(state["city"], budget)
+    digest = render_constraints(state["city"], budget // 2)
+    remaining = budget - count_tokens(digest) if digest else budget
+    retrieved = build_context(state.get("retrieved", []), remaining)
+    return "\n\n".join(part for part in (digest, retrieved) if part)
+
+def _review_feedback(state: StrategistState) -> str:
+    # Without a retrieval round in between, the previous review is what changes the next draft
+    review = state.get("review") or {}
+    problems = review.get("issues", []) + review.get("suggestions", [])
+    if not problems:
+        return ""
+    return "Previous draft review, address these:\n" + "\n".join(f"- {p}" for p in problems[:8])
+
+def _planner_prompt(state: StrategistState) -> str:
     trends_summary = "\n".join([
         f"- {item['keyword']}: {item['score']}"
         for item in state["trends"].get("interest_over_time_national", [])[:3]
     ])
-    context = "\n\n".join([c["text"] for c in state.get("retrieved", [])[:5]])
+    context = _context(state, PLANNER_CONTEXT_TOKENS)
+    feedback = _review_feedback(state)
+    if feedback:
+        context = f"{context}\n\n{feedback}" if context else feedback
+
+    if _use_packer(state):
+        return packed_planner.prompt(
+            store_name=state["store_name"],
+            city=state["city"],
+            entrance_side=state["entrance_side"],
+            dims=_dimensions(state),
+            zones=_packed_zones(state),
+            trends_summary=trends_summary,
+            context=context,
+        )
 
-    prompt = PLANNER_PROMPT.format(
+    if packed_planner is not None:
+        # Packer configured but the floorplate didn't pack: the LLM needs the size it is drawing on
+        length, width = _dimensions(state)
+        context += f"\n\nFloorplate: {length:g} m x {width:g} m (dimensions_m); keep every zone inside it."
+
+    return PromptManager.render(
+        PLANNER_PROMPT,
         store_name=state["store_name"],
         city=state["city"],
         entrance_side=state["entrance_side"],
         trends_summary=trends_summary,
         context=context,
-        format_instructions=parser.get_format_instructions()
+        format_instructions=FORMAT_INSTRUCTIONS if structured_planner else parser.get_format_instructions()
     )
 
-    response = llm.invoke([HumanMessage(content=prompt)])
-
+def _planner_defaults(state: StrategistState) -> dict:
+    return {
+        "store_name": f"{state['store_name']} - {state['city']}",
+        "city": state["city"],
+        "entrance_side": state["entrance_side"],
+        "compliance_notes": [],
+        "best_practice_score": 0.0,
+    }
+
+def _structured_call(state: StrategistState):
+    """Planner call that streams a `LayoutPlan` tool call; returns the plan as compact JSON."""
+    def call(prompt: str):
+        plan = structured_planner.plan(prompt, _planner_defaults(state), on_zone=_emit_zone_preview)
+        return AIMessage(content=plan.model_dump_json() if plan else "")
+    return call
+
+def _astructured_call(state: StrategistState):
+    async def acall(prompt: str):
+        plan = await structured_planner.aplan(prompt, _planner_defaults(state), on_zone=_emit_zone_preview)
+        return AIMessage(content=plan.model_dump_json() if plan else "")
+    return acall
+
+def _packed_call(state: StrategistState):
+    """Planner call that only assigns merchandise to packed zones; returns the plan as compact JSON."""
+    def call(prompt: str):
+        plan = packed_planner.plan(prompt, _packed_zones(state), _dimensions(state), _planner_defaults(state))
+        return AIMessage(content=plan.model_dump_json() if plan else "")
+    return call
+
+def _apacked_call(state: StrategistState):
+    async def acall(prompt: str):
+        plan = await packed_planner.aplan(prompt, _packed_zones(state), _dimensions(state), _planner_defaults(state))
+        return AIMessage(content=plan.model_dump_json() if plan else "")
+    return acall
+
+def _planner_call(state: StrategistState):
+    if _use_packer(state):
+        return _packed_call(state)
+    return _structured_call(state) if structured_planner else None
+
+def _aplanner_call(state: StrategistState):
+    if _use_packer(state):
+        return _apacked_call(state)
+    return _astructured_call(state) if structured_planner else None
+
+def _planner_result(state: StrategistState, response) -> dict:
     try:
         content = response.content.strip()
         if content.startswith("```"):
@@ -155,13 +383,7 @@ def planner_node(state: StrategistState):
         if "store_layout" in data:
             data = data["store_layout"]
 
-        # Normalize dimensions
-        dims = data.get("dimensions_m")
-        if isinstance(dims, dict):
-            data["dimensions_m"] = (dims.get("length", 20), dims.get("width", 12))
-        elif isinstance(dims, (list, tuple)):
-            data["dimensions_m"] = tuple(dims[:2])
-
+        # Dimensions are normalized by LayoutPlan's validator
         # Defaults
         data.setdefault("store_name", f"{state['store_name']} - {state['city']}")
         data.setdefault("city", state["city"])
@@ -171,61 +393,254 @@ def planner_node(state: StrategistState):
 
         plan = LayoutPlan(**data)
         return {
-            "draft_plan": plan.model_dump(),
+            "draft_plan": plan,
             "messages": [response]
         }
     except Exception as e:
-        print(f"Planner parse error: {e}")
-        print(f"Raw response: {response.content[:500]}")
+        log_event(logger, f"Planner parse error: {e}", {"raw_response": response.content[:500]},
+                  agent="planner", level=logging.WARNING, verbose=True)
         return {"messages": [response]}
 
-# @observe(name="Reviewer Node")
-def reviewer_node(state: StrategistState):
-    context = "\n\n".join([c["text"] for c in state.get("retrieved", [])])
-    prompt = REVIEWER_PROMPT.format(
-        layout_json=json.dumps(state["draft_plan"], indent=2),
+class PlannerOutputError(ValueError):
+    """The planner answered, but with nothing that parses into a `LayoutPlan`."""
+
+def _degraded_planner_result(state: StrategistState, error: Exception) -> dict:
+    """LLM unavailable or unusable: keep the current draft, else packed zones stocked with their own keyword."""
+    logger.warning(f"Planner degraded: {error}")
+    if state.get("draft_plan"):
+        plan = as_plan(state["draft_plan"])
+    else:
+        merch = {spec.name for spec in merchandise_specs(state["trends"])}
+        length, width = _dimensions(state)
+        # One open sales floor when the floorplate is too small to pack
+        zones = _packed_zones(state) or [Zone(name=FALLBACK_MERCH_ZONE, x=0.0, y=0.0, width=length, height=width)]
+        for zone in zones:
+            if zone.name in merch:
+                zone.products = [zone.name]
+        plan = LayoutPlan(**_planner_defaults(state), dimensions_m=_dimensions(state), zones=zones)
+    return {
+        "draft_plan": plan,
+        "messages": [AIMessage(content=f"Planner degraded ({type(error).__name__}); using fallback layout.")]
+    }
+
+# @observe(name="Planner Node")
+def planner_node(state: StrategistState):
+    scope = _scope(PLANNER_PROMPT, state)  # once per call: a hot reload mid-node mustn't split it
+    prompt = _planner_prompt(state)
+    call = _planner_call(state)
+    try:
+        response, cached = _invoke_cached(prompt, scope, call)
+    except Exception as e:
+        return _degraded_planner_result(state, e)
+    result = _planner_result(state, response)
+    if "draft_plan" not in result:
+        # The reviewer needs a draft: an unparseable or empty answer degrades like an outage
+        return _degraded_planner_result(state, PlannerOutputError("planner returned no usable plan"))
+    # Only completions that parsed get here, so a bad answer is never replayed from cache
+    if llm_cache is not None and not cached:
+        llm_cache.put(prompt, scope, response.content)
+    return result
+
+async def aplanner_node(state: StrategistState):
+    """Async variant of `planner_node`."""
+    scope = _scope(PLANNER_PROMPT, state)
+    prompt = _planner_prompt(state)
+    acall = _aplanner_call(state)
+    # The streaming structured planner emits zone previews, so it isn't hedged
+    hedge = _use_packer(state) or structured_planner is None
+    try:
+        response, cached = await _ainvoke_cached(prompt, scope, acall, hedge=hedge)
+    except Exception as e:
+        return _degraded_planner_result(state, e)
+    result = _planner_result(state, response)
+    if "draft_plan" not in result:
+        return _degraded_planner_result(state, PlannerOutputError("planner returned no usable plan"))
+    if llm_cache is not None and not cached:
+        await llm_cache.aput(prompt, scope, response.content)
+    return result
+
+def _flow_metrics(state: StrategistState):
+    """Simulated customer flow for the draft, or None if disabled or the plan can't be simulated."""
+    if not FLOW_SIM_ENABLED:
+        return None
+    try:
+        return simulate(as_plan(state["draft_plan"]), state["trends"])
+    except Exception as e:
+        logger.warning(f"Flow simulation skipped: {e}")
+        return None
+
+def _reviewer_prompt(state: StrategistState, metrics=None) -> str:
+    context = _context(state, REVIEWER_CONTEXT_TOKENS)
+    problems = validate_plan(as_plan(state["draft_plan"]))
+    if problems:
+        extra = f" (+{len(problems) - 10} more)" if len(problems) > 10 else ""
+        context += "\n\nGeometry check failed: " + "; ".join(problems[:10]) + extra
+    if metrics is not None:
+        context += f"\n\nSimulated customer flow ({metrics.shoppers} shoppers): {metrics.summary()}"
+    return PromptManager.render(
+        REVIEWER_PROMPT,
+        layout_json=compact_json(state["draft_plan"]),
         context=context
     )
-    response = llm.invoke([HumanMessage(content=prompt)])
+
+def _reviewer_result(response, metrics=None) -> dict:
     try:
         review = json.loads(response.content.strip().split("```")[0])
-        return {"review": review, "messages": [AIMessage(content=f"Review: {review}")]}
+        if not isinstance(review, dict):
+            raise ValueError(f"review is a {type(review).__name__}, not an object")
+        result = {"review": review, "messages": [AIMessage(content=f"Review: {review}")]}
     except:
-        return {
+        result = {
             "review": {"is_compliant": False, "best_practice_score": 0},
             "messages": [response]
         }
+    if metrics is not None:
+        result["review"]["flow_metrics"] = metrics.as_dict()
+    return result
+
+def _review_skip_reason(state: StrategistState):
+    if llm_breaker.state == "open":
+        return "LLM circuit open"
+    if time_left(state.get("deadline")) < REVIEW_MIN_S:
+        return "strategist time budget spent"
+    return None
+
+def _skipped_review(reason: str, metrics=None) -> dict:
+    """Degraded mode: the decider accepts the draft as is, noting it wasn't reviewed."""
+    review = {"skipped": reason, "is_compliant": False, "best_practice_score": 0}
+    if metrics is not None:
+        review["flow_metrics"] = metrics.as_dict()
+    return {"review": review, "messages": [AIMessage(content=f"Review skipped: {reason}")]}
+
+# @observe(name="Reviewer Node")
+def reviewer_node(state: StrategistState):
+    metrics = _flow_metrics(state)
+    reason = _review_skip_reason(state)
+    if reason:
+        return _skipped_review(reason, metrics)
+    scope = _scope(REVIEWER_PROMPT, state)
+    prompt = _reviewer_prompt(state, metrics)
+    try:
+        response, cached = _invoke_cached(prompt, scope)
+    except Exception as e:
+        return _skipped_review(f"reviewer unavailable ({type(e).__name__})", metrics)
+    result = _reviewer_result(response, metrics)
+    # A parsed review replaces the raw response in `messages`
+    if llm_cache is not None and not cached and result["messages"][0] is not response:
+        llm_cache.put(prompt, scope, response.content)
+    return result
+
+async def areviewer_node(state: StrategistState):
+    """Async variant of `reviewer_node`."""
+    # Up to ~100 ms of NumPy on a large floor: keep it off the event loop
+    metrics = await run_blocking(_flow_metrics, state)
+    reason = _review_skip_reason(state)
+    if reason:
+        return _skipped_review(reason, metrics)
+    scope = _scope(REVIEWER_PROMPT, state)
+    prompt = _reviewer_prompt(state, metrics)
+    try:
+        response, cached = await _ainvoke_cached(prompt, scope)
+    except Exception as e:
+        return _skipped_review(f"reviewer unavailable ({type(e).__name__})", metrics)
+    result = _reviewer_result(response, metrics)
+    if llm_cache is not None and not cached and result["messages"][0] is not response:
+        await llm_cache.aput(prompt, scope, response.content)
+    return result
 
 # @observe(name="Decider Node")
 def decider_node(state: StrategistState):
     review = state["review"]
+    if review.get("skipped"):
+        plan = as_plan(state["draft_plan"]).model_copy(update={
+            "compliance_notes": [f"Not reviewed: {review['skipped']}"],
+        })
+        return {"final_plan": plan}
     if review.get("is_compliant") and review.get("best_practice_score", 0) >= 8.5:
-        plan = state["draft_plan"].copy()
-        plan["best_practice_score"] = review["best_practice_score"]
-        plan["compliance_notes"] = review.get("issues", []) + review.get("suggestions", [])
-        return {"final_plan": LayoutPlan(**plan)}
+        plan = as_plan(state["draft_plan"]).model_copy(update={
+            "best_practice_score": review["best_practice_score"],
+            "compliance_notes": review.get("issues", []) + review.get("suggestions", []),
+        })
+        return {"final_plan": plan}
     else:
         return {"messages": [AIMessage(content="Refining layout...")]}
 
+async def adecider_node(state: StrategistState):
+    # Pure CPU; awaitable so the async graph doesn't hop to a worker thread
+    return decider_node(state)
+
+# === Incremental re-plan (trends changed, floorplate didn't) ===
+incremental_planner = IncrementalPlanner(llm)
+
+def _previous_plan(state: StrategistState) -> LayoutPlan:
+    return as_plan(state["previous_plan"])
+
+def _incremental_result(plan) -> dict:
+    if plan is None:
+        return {"messages": [AIMessage(content="Incremental re-plan failed; planning from scratch.")]}
+    return {
+        "draft_plan": plan,
+        "messages": [AIMessage(content="Incremental re-plan: re-assigned trend-affected zones.")]
+    }
+
+def incremental_node(state: StrategistState):
+    try:
+        plan = incremental_planner.replan(
+            _previous_plan(state), state.get("previous_trends") or {}, state["trends"],
+            city=state["city"], entrance_side=state["entrance_side"],
+        )
+    except Exception as e:
+        logger.info(f"Incremental re-plan rejected: {e}")
+        plan = None
+    return _incremental_result(plan)
+
+async def aincremental_node(state: StrategistState):
+    try:
+        plan = await incremental_planner.areplan(
+            _previous_plan(state), state.get("previous_trends") or {}, state["trends"],
+            city=state["city"], entrance_side=state["entrance_side"],
+        )
+    except Exception as e:
+        logger.info(f"Incremental re-plan rejected: {e}")
+        plan = None
+    return _incremental_result(plan)
+
 # === Routing ===
+def route_entry(state: StrategistState):
+    return "incremental" if state.get("previous_plan") else "planner"
+
+def route_incremental(state: StrategistState):
+    return "reviewer" if state.get("draft_plan") else "planner"
+
 def route(state: StrategistState):
     if state.get("final_plan"):
         return END
     if state.get("review", {}).get("is_compliant"):
         return END
+    # A known city's digest already holds what retrieval would find: re-plan directly
+    if known_city(state["city"]):
+        return "planner"
     return "rag"
 
 # === Build Subgraph ===
 subgraph = StateGraph(StrategistState)
+# Each node carries a sync and an async implementation, so the compiled
+# subgraph serves both `invoke` and `ainvoke` without thread offloading.
+# `instrumented_node` records memory / timings for tracked or profiled requests.
+# Retrieval is two steps: the query node asks for a `rag_tool` call, the tool node runs it
+subgraph.add_node("rag_query", instrumented_node("rag_query", rag_node, arag_node))
 subgraph.add_node("rag", tool_node)
-subgraph.add_node("planner", planner_node)
-subgraph.add_node("reviewer", reviewer_node)
-subgraph.add_node("decider", decider_node)
+subgraph.add_node("planner", instrumented_node("planner", planner_node, aplanner_node))
+subgraph.add_node("reviewer", instrumented_node("reviewer", reviewer_node, areviewer_node))
+subgraph.add_node("decider", instrumented_node("decider", decider_node, adecider_node))
+subgraph.add_node("incremental", instrumented_node("incremental", incremental_node, aincremental_node))
 
-subgraph.set_entry_point("planner")
+subgraph.set_conditional_entry_point(route_entry, {"incremental": "incremental", "planner": "planner"})
+subgraph.add_conditional_edges("incremental", route_incremental, {"reviewer": "reviewer", "planner": "planner"})
 subgraph.add_edge("planner", "reviewer")
 subgraph.add_edge("reviewer", "decider")
-subgraph.add_conditional_edges("decider", route, {"rag": "rag", END: END})
+subgraph.add_conditional_edges("decider", route, {"rag": "rag_query", "planner": "planner", END: END})
+subgraph.add_edge("rag_query", "rag")
 subgraph.add_edge("rag", "planner")
 
 strategist_subgraph = subgraph.compile()
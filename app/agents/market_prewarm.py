@@ -0,0 +1,303 @@
+# agents/market_prewarm.py
+"""
+Background pre-warming of market signals.
+
+Traffic is dominated by a few dozen (city, product) combinations, yet the
+Google Trends fetch sits on the critical path of every request. This module
+keeps:
+
+    - `signal_store`: the latest `run_market_analyst` result per
+      (geo, sub_geo, keywords, timeframe, gprop); the request path reads it
+      first and only fetches on a miss or when the entry is too old. It
+      lives on the shared cache backend (`app.cache`, namespace "trends"),
+      so a signal fetched or pre-warmed by one worker serves them all;
+    - `request_history`: decayed hit counts per key, fed by the request path;
+    - `PrewarmScheduler`: an asyncio task that, during off-peak hours,
+      refreshes the hottest keys before they go stale, spending at most a
+      fixed number of Trends requests per hour.
+
+Every worker runs a scheduler over the hot keys it has seen, but they draw
+on one `TrendsBudget` kept on the shared cache backend, so N workers spend
+the hourly budget once, not N times; a key one worker refreshed is fresh in
+`signal_store` for the others. Each analysis reserves
+TRENDS_REQUESTS_PER_ANALYSIS up front and is settled to the requests it
+actually sent: a fully stored history costs only related queries, and
+retries or per-range downloads cost more.
+
+Configuration (environment variables):
+    PREWARM_ENABLED            "1"/"0" (default 1)
+    PREWARM_INTERVAL_S         seconds between scheduler passes (default 900)
+    PREWARM_TOP_N              hottest keys considered per pass (default 30)
+    PREWARM_OFFPEAK_HOURS      local-hour window, e.g. "0-7" or "22-6" (default "0-7")
+    PREWARM_TZ_OFFSET_MIN      offset of the local clock from UTC (default 330, IST)
+    PREWARM_REFRESH_AGE_S      refresh entries older than this (default 6h)
+    MARKET_SIGNAL_MAX_AGE_S    request path serves entries younger than this (default 24h)
+    TRENDS_BUDGET_PER_HOUR     Trends requests all schedulers together may spend per hour (default 60)
+    MARKET_SIGNAL_RETAIN_S     how long stored signals are kept at all (default 7 days)
+    MARKET_SIGNAL_MAX_ENTRIES  stored signals before LRU eviction (default 4096)
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.cache import NamespaceCache, get_cache
+from app.clients import run_blocking
+from app.tools.run_market_analyst import run_market_analyst, count_trends_requests
+
+logger = logging.getLogger(__name__)
+
+SignalKey = Tuple[str, str, Tuple[str, ...], str, str]
+
+# Reserved per analysis (interest over time, state interest, related queries),
+# then settled to the count actually sent
+TRENDS_REQUESTS_PER_ANALYSIS = 3
+
+
+def signal_key(keywords, geo: str, sub_geo: str, timeframe: str = "today 3-m", gprop: str = "froogle") -> SignalKey:
+    """Order- and case-insensitive key for a market analysis."""
+    kws = tuple(sorted({k.strip().lower() for k in keywords if k and k.strip()}))
+    return (geo, sub_geo, kws, timeframe, gprop)
+
+
+# === Store ===
+class MarketSignalStore:
+    """Latest analysis result per key, with its fetch time."""
+
+    def __init__(self, retain_s: float, max_entries: int):
+        self._cache = get_cache("trends", retain_s, max_entries)
+
+    def _entry(self, key: SignalKey) -> Optional[dict]:
+        return self._cache.get(key)
+
+    @staticmethod
+    def _fresh(entry: Optional[dict], max_age_s: float) -> Optional[dict]:
+        if entry is None or time.time() - entry["fetched_at"] > max_age_s:
+            return None
+        return entry["result"]
+
+    @staticmethod
+    def _new_entry(result: dict, keywords: Optional[List[str]]) -> dict:
+        return {"result": result, "fetched_at": time.time(), "keywords": keywords}
+
+    def get(self, key: SignalKey, max_age_s: float) -> Optional[dict]:
+        return self._fresh(self._entry(key), max_age_s)
+
+    async def aget(self, key: SignalKey, max_age_s: float) -> Optional[dict]:
+        """`get` for the async request path: a SQLite/Redis read runs off the event loop."""
+        return self._fresh(await self._cache.aget(key), max_age_s)
+
+    def age(self, key: SignalKey) -> Optional[float]:
+        entry = self._entry(key)
+        return None if entry is None else time.time() - entry["fetched_at"]
+
+    def keywords(self, key: SignalKey) -> Optional[List[str]]:
+        """Keywords as the request that produced the entry spelled and ordered them."""
+        entry = self._entry(key)
+        return None if entry is None else entry.get("keywords")
+
+    def put(self, key: SignalKey, result: dict, keywords: Optional[List[str]] = None) -> None:
+        self._cache.set(key, self._new_entry(result, keywords))
+
+    async def aput(self, key: SignalKey, result: dict, keywords: Optional[List[str]] = None) -> None:
+        await self._cache.aset(key, self._new_entry(result, keywords))
+
+
+# === Request history ===
+class RequestHistory:
+    """Hit counts per key with exponential decay, so yesterday's spike fades."""
+
+    def __init__(self, half_life_s: float = 24 * 3600):
+        self.half_life_s = half_life_s
+        self._scores: Dict[SignalKey, Tuple[float, float]] = {}
+        # Latest request's keyword list per key: the key itself is lowercased and sorted
+        self._keywords: Dict[SignalKey, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def _decayed(self, score: float, since: float, now: float) -> float:
+        return score * 0.5 ** ((now - since) / self.half_life_s)
+
+    def record(self, key: SignalKey, keywords: Optional[List[str]] = None) -> None:
+        now = time.time()
+        with self._lock:
+            score, since = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, since, now) + 1.0, now)
+            if keywords:
+                self._keywords[key] = list(keywords)
+
+    def keywords(self, key: SignalKey) -> Optional[List[str]]:
+        with self._lock:
+            return self._keywords.get(key)
+
+    def top(self, n: int) -> List[SignalKey]:
+        now = time.time()
+        with self._lock:
+            ranked = sorted(
+                self._scores.items(),
+                key=lambda kv: self._decayed(kv[1][0], kv[1][1], now),
+                reverse=True,
+            )
+        return [key for key, _ in ranked[:n]]
+
+
+# === Budget ===
+class TrendsBudget:
+    """
+    Token bucket of Google Trends requests, refilled continuously per hour.
+
+    The level lives on the shared cache backend (namespace "prewarm"), so
+    every worker (and, with Redis, every host) draws on the same budget.
+    Updates are read-modify-write under a process lock: two workers spending
+    in the same instant can both read the old level, which the schedulers'
+    staggered passes make rare and which overspends by one analysis at most.
+    """
+
+    KEY = "trends_budget"
+
+    def __init__(self, per_hour: int, cache: Optional[NamespaceCache] = None):
+        self.capacity = float(per_hour)
+        self._cache = cache if cache is not None else get_cache("prewarm", 7 * 24 * 3600, 16)
+        self._lock = threading.Lock()
+
+    def _level(self, now: float) -> float:
+        state = self._cache.get(self.KEY)
+        if state is None:
+            return self.capacity
+        refill = max(0.0, now - state["updated"]) * self.capacity / 3600
+        return min(self.capacity, state["tokens"] + refill)
+
+    def _store(self, tokens: float, now: float) -> None:
+        self._cache.set(self.KEY, {"tokens": tokens, "updated": now})
+
+    @property
+    def tokens(self) -> float:
+        return self._level(time.time())
+
+    def try_spend(self, n: int) -> bool:
+        with self._lock:
+            now = time.time()
+            tokens = self._level(now)
+            if tokens < n:
+                return False
+            self._store(tokens - n, now)
+            return True
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct a `try_spend(reserved)` to what was sent; overspending leaves the bucket in debt."""
+        if used == reserved:
+            return
+        with self._lock:
+            now = time.time()
+            self._store(self._level(now) + reserved - used, now)
+
+
+signal_store = MarketSignalStore(
+    retain_s=float(os.getenv("MARKET_SIGNAL_RETAIN_S", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("MARKET_SIGNAL_MAX_ENTRIES", "4096")),
+)
+request_history = RequestHistory()
+MARKET_SIGNAL_MAX_AGE_S = float(os.getenv("MARKET_SIGNAL_MAX_AGE_S", str(24 * 3600)))
+
+
+def _in_window(hour: int, window: str) -> bool:
+    start, end = (int(h) for h in window.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+# === Scheduler ===
+@dataclass
+class PrewarmScheduler:
+    interval_s: float = float(os.getenv("PREWARM_INTERVAL_S", "900"))
+    top_n: int = int(os.getenv("PREWARM_TOP_N", "30"))
+    offpeak_hours: str = os.getenv("PREWARM_OFFPEAK_HOURS", "0-7")
+    tz_offset_min: int = int(os.getenv("PREWARM_TZ_OFFSET_MIN", "330"))
+    refresh_age_s: float = float(os.getenv("PREWARM_REFRESH_AGE_S", str(6 * 3600)))
+    budget_per_hour: int = int(os.getenv("TRENDS_BUDGET_PER_HOUR", "60"))
+
+    def __post_init__(self):
+        self.budget = TrendsBudget(self.budget_per_hour)
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.skipped_budget = 0
+
+    def is_offpeak(self, now: Optional[datetime] = None) -> bool:
+        now = now or datetime.now(timezone.utc)
+        local = now + timedelta(minutes=self.tz_offset_min)
+        return _in_window(local.hour, self.offpeak_hours)
+
+    def due(self) -> List[SignalKey]:
+        """Hottest keys whose stored signals are missing or older than the refresh age."""
+        due = []
+        for key in request_history.top(self.top_n):
+            age = signal_store.age(key)
+            if age is None or age > self.refresh_age_s:
+                due.append(key)
+        return due
+
+    async def run_once(self) -> int:
+        """One pass: refresh due keys while the Trends budget lasts."""
+        refreshed = 0
+        # Store reads may hit SQLite/Redis: keep them off the event loop
+        for key in await run_blocking(self.due):
+            if not await run_blocking(self.budget.try_spend, TRENDS_REQUESTS_PER_ANALYSIS):
+                self.skipped_budget += 1
+                break
+            geo, sub_geo, normalized, timeframe, gprop = key
+            # Replay the request's own labels and order: the payload (and mock ranking) follow them
+            keywords = request_history.keywords(key) or await run_blocking(signal_store.keywords, key) or list(normalized)
+            with count_trends_requests() as sent:
+                try:
+                    result = await run_blocking(
+                        run_market_analyst,
+                        keywords=keywords,
+                        geo=geo,
+                        sub_geo=sub_geo,
+                        timeframe=timeframe,
+                        gprop=gprop,
+                    )
+                except Exception as e:
+                    logger.warning(f"Pre-warm failed for {key}: {e}")
+                    result = None
+                finally:
+                    await run_blocking(self.budget.settle, TRENDS_REQUESTS_PER_ANALYSIS, sent[0])
+            if result is None:
+                continue
+            await signal_store.aput(key, result, keywords)
+            refreshed += 1
+        self.refreshed += refreshed
+        return refreshed
+
+    async def _loop(self) -> None:
+        # Workers start together: stagger their passes so they rarely touch the budget at once
+        await asyncio.sleep(random.uniform(0, self.interval_s))
+        while True:
+            try:
+                if self.is_offpeak():
+                    n = await self.run_once()
+                    if n:
+                        logger.info(f"Pre-warmed market signals for {n} key(s)")
+            except Exception:
+                logger.exception("Market pre-warm pass failed")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def prewarm_enabled() -> bool:
+    return os.getenv("PREWARM_ENABLED", "1") not in ("0", "false", "False")
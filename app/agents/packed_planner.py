@@ -0,0 +1,90 @@
+# agents/packed_planner.py
+"""
+Planner mode where geometry comes from `zone_packer` and the LLM only maps
+products and fixtures onto the packed zones (`PLANNER_GEOMETRY=packer`).
+
+The LLM is bound to `ZoneAssignments` as a forced tool, so its output is a
+short list of names and merchandise instead of a full plan, and no review
+loop is ever spent on overlapping or out-of-bounds rectangles.
+"""
+import json
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from app.agents.incremental_planner import ZoneAssignments, apply_assignments, parse_assignments
+from app.agents.zone_packer import describe_position
+from app.schemas.layout import LayoutPlan, Zone
+
+ASSIGN_PROMPT = """
+You are a retail layout strategist for {store_name} in {city}.
+
+The floorplate ({length} m x {width} m, entrance on the {entrance_side}) is
+already divided into the zones below. Their geometry is fixed.
+
+{zones}
+
+Top market trends:
+{trends_summary}
+
+Constraints and best practices:
+{context}
+
+Assign products and fixtures to EVERY zone listed above, keeping names
+exactly as given. Put high-trend products in merchandise zones named after
+them, impulse items at checkout, and keep the decompression zone open (signage
+and promotions only). Call the `ZoneAssignments` tool with one entry per zone.
+"""
+
+
+def _zones_block(zones: List[Zone], dims: Tuple[float, float], entrance_side: str) -> str:
+    rows = [
+        {"name": z.name, "area_m2": round(z.width * z.height, 1), "position": describe_position(z, dims, entrance_side)}
+        for z in zones
+    ]
+    return json.dumps(rows, separators=(",", ":"))
+
+
+class PackedPlanner:
+    """Fills a packed floorplate with merchandise via one forced tool call."""
+
+    def __init__(self, llm):
+        self.llm = llm.bind_tools([ZoneAssignments], tool_choice="ZoneAssignments")
+
+    @staticmethod
+    def prompt(
+        store_name: str,
+        city: str,
+        entrance_side: str,
+        dims: Tuple[float, float],
+        zones: List[Zone],
+        trends_summary: str,
+        context: str,
+    ) -> str:
+        return ASSIGN_PROMPT.format(
+            store_name=store_name,
+            city=city,
+            length=dims[0],
+            width=dims[1],
+            entrance_side=entrance_side,
+            zones=_zones_block(zones, dims, entrance_side),
+            trends_summary=trends_summary,
+            context=context,
+        )
+
+    @staticmethod
+    def _plan(reply, zones: List[Zone], dims: Tuple[float, float], defaults: Dict) -> Optional[LayoutPlan]:
+        assignments = parse_assignments(reply)
+        if assignments is None:
+            return None
+        base = LayoutPlan(**{**defaults, "dimensions_m": dims, "zones": zones})
+        return apply_assignments(base, [z.name for z in zones], assignments)
+
+    def plan(self, prompt: str, zones: List[Zone], dims: Tuple[float, float], defaults: Dict) -> Optional[LayoutPlan]:
+        """The packed plan with merchandise assigned, or None if the tool call is unusable."""
+        reply = self.llm.invoke([HumanMessage(content=prompt)])
+        return self._plan(reply, zones, dims, defaults)
+
+    async def aplan(self, prompt: str, zones: List[Zone], dims: Tuple[float, float], defaults: Dict) -> Optional[LayoutPlan]:
+        reply = await self.llm.ainvoke([HumanMessage(content=prompt)])
+        return self._plan(reply, zones, dims, defaults)
@@ -0,0 +1,216 @@
+# agents/spatial_index.py
+"""
+Uniform-grid spatial index over a plan's zones and placed fixtures.
+
+Plan checks used to compare every zone with every other one, which is fine
+for the dozen zones of a high-street shop and not for a multi-floor
+hypermarket with hundreds of zones and thousands of fixtures. Here each
+rectangle is bucketed into the grid cells it covers (one grid per floor,
+cells about the size of a typical rectangle), so overlap, adjacency and
+point queries only compare rectangles that share a cell. A rectangle
+covering more than MAX_CELLS_PER_RECT cells (a hypermarket's one big sales
+floor zone among small kiosks) isn't bucketed: it sits in a short
+"oversized" list that every query and overlap check also scans, so it
+neither fills thousands of buckets nor forces coarse cells on the rest.
+
+A uniform grid rather than an R-tree: layouts are tiles of similar-sized
+rectangles, where a grid is as selective, builds in one pass and needs
+nothing beyond NumPy.
+
+`plan_index(plan)` builds the zone and fixture indexes once per plan
+geometry (memoized, so the reviewer, validators and draftsman share them);
+`validate_plan(plan)` lists geometry problems by zone name.
+
+Configuration (environment variables):
+    SPATIAL_INDEX_CELL_M    fixed grid cell in metres (default: median rectangle size)
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.schemas.layout import LayoutPlan
+
+CELL_M = float(os.getenv("SPATIAL_INDEX_CELL_M", "0")) or None
+MIN_CELL_M = 0.25
+MAX_CELLS_PER_AXIS = 1024
+MAX_CELLS_PER_RECT = 64
+TOL = 1e-6
+
+
+class SpatialIndex:
+    """Axis-aligned rectangles (n, 4) [x, y, w, h], each on a floor level."""
+
+    def __init__(self, rects: np.ndarray, levels: Optional[np.ndarray] = None, cell_m: Optional[float] = CELL_M):
+        self.rects = np.asarray(rects, dtype=float).reshape(-1, 4)
+        n = len(self.rects)
+        self.levels = np.zeros(n, dtype=int) if levels is None else np.asarray(levels, dtype=int)
+        x, y, w, h = self.rects.T
+        self.x0, self.y0, self.x1, self.y1 = x, y, x + w, y + h
+        if cell_m is None:
+            sizes = np.maximum(w, h)
+            cell_m = float(np.median(sizes[sizes > 0])) if (sizes > 0).any() else 1.0
+        # Bounded cells per axis, so one stray huge rectangle can't blow up the grid
+        extent = max(float(np.ptp(np.r_[self.x0, self.x1])), float(np.ptp(np.r_[self.y0, self.y1]))) if n else 0.0
+        self.cell = max(cell_m, MIN_CELL_M, extent / MAX_CELLS_PER_AXIS)
+
+        # Cell ranges per rectangle; oversized ones are kept aside
+        c0, c1 = self._cells(self.x0), self._cells(self.x1)
+        r0, r1 = self._cells(self.y0), self._cells(self.y1)
+        span_c, span_r = c1 - c0 + 1, r1 - r0 + 1
+        oversized = span_c * span_r > MAX_CELLS_PER_RECT
+        self._oversized = np.flatnonzero(oversized)
+
+        # One (level, column, row) entry per covered cell of every other rectangle, grouped into buckets
+        small = np.flatnonzero(~oversized)
+        counts = (span_c * span_r)[small]
+        ids = np.repeat(small, counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = np.column_stack([self.levels[ids], c0[ids] + k // span_r[ids], r0[ids] + k % span_r[ids]])
+        order = np.lexsort(cells.T[::-1])
+        cells, ids = cells[order], ids[order]
+        starts = np.flatnonzero(np.r_[True, (cells[1:] != cells[:-1]).any(axis=1)]) if len(ids) else np.zeros(0, int)
+        self._buckets: Dict[Tuple[int, int, int], np.ndarray] = dict(
+            zip(map(tuple, cells[starts].tolist()), np.split(ids, starts[1:]))
+        )
+
+    def __len__(self) -> int:
+        return len(self.rects)
+
+    def _cells(self, v) -> np.ndarray:
+        return np.floor(np.asarray(v) / self.cell).astype(int)
+
+    def on_level(self, level: int) -> np.ndarray:
+        return np.flatnonzero(self.levels == level)
+
+    # === Queries ===
+    def _candidates(self, level: int, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        c0, c1 = self._cells([x0, x1])
+        r0, r1 = self._cells([y0, y1])
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > MAX_CELLS_PER_RECT:
+            # A box this large would visit more buckets than it saves comparisons
+            return self.on_level(level)
+        found = [self._oversized[self.levels[self._oversized] == level]]
+        for c in range(c0, c1 + 1):
+            for r in range(r0, r1 + 1):
+                bucket = self._buckets.get((level, c, r))
+                if bucket is not None:
+                    found.append(bucket)
+        return np.unique(np.concatenate(found))
+
+    def query(self, level: int, x0: float, y0: float, x1: float, y1: float, pad: float = 0.0) -> np.ndarray:
+        """Rectangles on `level` within `pad` metres of the box (touching counts)."""
+        ids = self._candidates(level, x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+        ix = np.minimum(self.x1[ids], x1) - np.maximum(self.x0[ids], x0)
+        iy = np.minimum(self.y1[ids], y1) - np.maximum(self.y0[ids], y0)
+        return ids[(ix >= -pad - TOL) & (iy >= -pad - TOL)]
+
+    def at_point(self, level: int, x: float, y: float) -> np.ndarray:
+        """Rectangles on `level` containing the point (edges included)."""
+        return self.query(level, x, y, x, y)
+
+    def neighbours(self, i: int, gap: float = 0.0) -> np.ndarray:
+        """Rectangles on the same floor within `gap` metres of rectangle `i`."""
+        ids = self.query(int(self.levels[i]), self.x0[i], self.y0[i], self.x1[i], self.y1[i], pad=gap)
+        return ids[ids != i]
+
+    def overlapping_pairs(self, tol: float = TOL) -> List[Tuple[int, int]]:
+        """(i, j), i < j, of same-floor rectangles sharing more than `tol` in both axes."""
+        n = len(self)
+        keys = []
+        for members in self._buckets.values():
+            if len(members) > 1:
+                a, b = np.triu_indices(len(members), k=1)
+                keys.append(members[a] * n + members[b])
+        # Oversized rectangles against everything else on their floor
+        for i in self._oversized:
+            others = self.on_level(int(self.levels[i]))
+            others = others[others != i]
+            keys.append(np.minimum(others, i) * n + np.maximum(others, i))
+        if not keys:
+            return []
+        pairs = np.unique(np.concatenate(keys))
+        i, j = pairs // n, pairs % n
+        ix = np.minimum(self.x1[i], self.x1[j]) - np.maximum(self.x0[i], self.x0[j])
+        iy = np.minimum(self.y1[i], self.y1[j]) - np.maximum(self.y0[i], self.y0[j])
+        hit = (ix > tol) & (iy > tol)
+        return list(zip(i[hit].tolist(), j[hit].tolist()))
+
+    def outside(self, bounds: np.ndarray, tol: float = TOL) -> np.ndarray:
+        """Rectangles not inside `bounds` (n, 4) [x0, y0, x1, y1] (one row per rectangle), or degenerate."""
+        bx0, by0, bx1, by1 = np.asarray(bounds, dtype=float).reshape(-1, 4).T
+        w, h = self.rects[:, 2], self.rects[:, 3]
+        bad = (
+            (self.x0 < bx0 - tol) | (self.y0 < by0 - tol) | (self.x1 > bx1 + tol) | (self.y1 > by1 + tol)
+            | (w <= 0) | (h <= 0)
+        )
+        return np.flatnonzero(bad)
+
+
+# === Plan indexes ===
+@dataclass(frozen=True)
+class PlanIndex:
+    zones: SpatialIndex
+    fixtures: SpatialIndex
+    fixture_zone: np.ndarray  # owning zone per fixture
+    floor_dims: Dict[int, Tuple[float, float]]
+
+
+def _geometry(plan: LayoutPlan):
+    zones = tuple((z.floor, z.x, z.y, z.width, z.height) for z in plan.zones)
+    fixtures = tuple(
+        (i, p.x, p.y, p.width, p.height) for i, z in enumerate(plan.zones) for p in z.placements
+    )
+    floors = tuple((level, plan.floor_dimensions(level)) for level in plan.levels)
+    return zones, fixtures, floors
+
+
+@lru_cache(maxsize=64)
+def _build(zones: Sequence, fixtures: Sequence, floors: Sequence) -> PlanIndex:
+    zone_arr = np.array(zones, dtype=float).reshape(-1, 5)
+    fixture_arr = np.array(fixtures, dtype=float).reshape(-1, 5)
+    owner = fixture_arr[:, 0].astype(int)
+    return PlanIndex(
+        zones=SpatialIndex(zone_arr[:, 1:], zone_arr[:, 0]),
+        fixtures=SpatialIndex(fixture_arr[:, 1:], zone_arr[owner, 0] if len(owner) else None),
+        fixture_zone=owner,
+        floor_dims=dict(floors),
+    )
+
+
+def plan_index(plan: LayoutPlan) -> PlanIndex:
+    """Zone and fixture indexes for the plan, built once per distinct geometry."""
+    return _build(*_geometry(plan))
+
+
+# === Validation ===
+def validate_plan(plan: LayoutPlan) -> List[str]:
+    """Zones off their floorplate or overlapping; fixtures outside their zone or overlapping."""
+    index = plan_index(plan)
+    zones, fixtures = index.zones, index.fixtures
+    names = [z.name for z in plan.zones]
+    problems = []
+
+    floor_bounds = np.array([[0.0, 0.0, *index.floor_dims[int(level)]] for level in zones.levels]).reshape(-1, 4)
+    problems.extend(
+        f"zone '{names[i]}' outside floor {zones.levels[i]}" for i in zones.outside(floor_bounds)
+    )
+    problems.extend(
+        f"zones '{names[i]}' and '{names[j]}' overlap on floor {zones.levels[i]}"
+        for i, j in zones.overlapping_pairs()
+    )
+
+    if len(fixtures):
+        owner = index.fixture_zone
+        codes = [p.code for z in plan.zones for p in z.placements]
+        zone_bounds = np.column_stack([zones.x0[owner], zones.y0[owner], zones.x1[owner], zones.y1[owner]])
+        problems.extend(
+            f"fixture {codes[k]} outside zone '{names[owner[k]]}'" for k in fixtures.outside(zone_bounds)
+        )
+        problems.extend(
+            f"fixtures {codes[a]} and {codes[b]} overlap in zone '{names[owner[a]]}'"
+            for a, b in fixtures.overlapping_pairs()
+        )
+    return problems
@@ -0,0 +1,240 @@
+# agents/structured_planner.py
+"""
+Structured-output planner.
+
+The planner LLM is bound to the `LayoutPlan` schema as a forced tool call,
+and the tool-call arguments are parsed incrementally while the completion
+streams in. Each zone is validated as soon as its closing brace arrives (or
+the stream ends), so callers can preview zones before the plan is finished.
+
+If the finished plan has malformed zones, only those zones are sent back to
+the model for repair and spliced into place; the rest of the plan is kept.
+Repair calls go through the `guard`/`aguard` the caller passes in, so they
+take from the same rate limiter (and breaker) as the plan call itself.
+"""
+import json
+import logging
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, Field, ValidationError
+
+from app.schemas.layout import LayoutPlan, Zone
+
+logger = logging.getLogger(__name__)
+
+ZoneCallback = Callable[[int, Zone], None]
+# Wraps one LLM call: guard(call, prompt) -> response (rate limiting, breaker)
+CallGuard = Callable[[Callable[[str], Any], str], Any]
+AsyncCallGuard = Callable[[Callable[[str], Awaitable[Any]], str], Awaitable[Any]]
+
+_ZONES_KEY_RE = re.compile(r'"zones"\s*:\s*$')
+
+FORMAT_INSTRUCTIONS = "Return the layout by calling the `LayoutPlan` tool. Do not reply with plain text."
+
+REPAIR_PROMPT = """
+These zones of a retail layout plan failed schema validation:
+
+{broken}
+
+Return corrected versions, in the same order, by calling the `ZoneRepair` tool.
+Keep each zone's intent; fix only what the errors describe.
+"""
+
+
+class ZoneRepair(BaseModel):
+    """Corrected zones, in the order they were requested."""
+    zones: List[Zone] = Field(default_factory=list)
+
+
+class _StreamState:
+    """Accumulates streamed tool-call arguments and validates zones as they close.
+
+    The arguments are scanned once, character by character, tracking nesting
+    and string state. When a zone object in the top-level `zones` array closes,
+    only that object's text is parsed, so a long plan costs O(length) rather
+    than one full partial-JSON parse per chunk.
+    """
+
+    def __init__(self, on_zone: Optional[ZoneCallback] = None):
+        self.buffer = ""
+        self.on_zone = on_zone
+        self.zones: Dict[int, Zone] = {}
+        self.errors: Dict[int, str] = {}
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._in_zones = False
+        self._zone_start: Optional[int] = None
+        self._closed = 0
+
+    def feed(self, chunk) -> None:
+        args = "".join(tc.get("args") or "" for tc in getattr(chunk, "tool_call_chunks", None) or [])
+        self.buffer += args
+        self._advance()
+
+    def _advance(self) -> None:
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+                if c == "[" and self._depth == 2:
+                    self._in_zones = _ZONES_KEY_RE.search(buffer, max(0, i - 32), i) is not None
+                elif c == "{" and self._depth == 3 and self._in_zones:
+                    self._zone_start = i
+            elif c in "}]":
+                if c == "}" and self._depth == 3 and self._zone_start is not None:
+                    self._close_zone(buffer[self._zone_start:i + 1])
+                    self._zone_start = None
+                elif c == "]" and self._depth == 2:
+                    self._in_zones = False
+                self._depth -= 1
+        self._pos = len(buffer)
+
+    def _close_zone(self, text: str) -> None:
+        index = self._closed
+        self._closed += 1
+        try:
+            raw = json.loads(text)
+        except ValueError as e:
+            self.errors[index] = str(e)
+            return
+        self._validate(index, raw)
+
+    def _validate(self, index: int, raw) -> None:
+        try:
+            zone = Zone.model_validate(raw)
+        except ValidationError as e:
+            self.errors[index] = str(e)
+            return
+        self.zones[index] = zone
+        if self.on_zone:
+            self.on_zone(index, zone)
+
+    def finish(self) -> Optional[dict]:
+        """Parse the whole buffer once; a zone cut off by the end of the stream is validated here."""
+        data = parse_partial_json(self.buffer) if self.buffer else None
+        if not isinstance(data, dict):
+            return None
+        for i, raw in enumerate(data.get("zones") or []):
+            if i not in self.zones and i not in self.errors:
+                self._validate(i, raw)
+        return data
+
+
+def _assemble(data: dict, stream: _StreamState, defaults: dict) -> Tuple[Optional[LayoutPlan], List[int]]:
+    """Build the plan from validated zones; returns (plan, indexes still broken)."""
+    broken = sorted(stream.errors)
+    if broken:
+        return None, broken
+    payload = {k: v for k, v in data.items() if k != "zones"}
+    for key, value in defaults.items():
+        payload.setdefault(key, value)
+    payload["zones"] = [stream.zones[i] for i in sorted(stream.zones)]
+    try:
+        return LayoutPlan.model_validate(payload), []
+    except ValidationError as e:
+        logger.warning(f"Planner plan-level validation error: {e}")
+        return None, []
+
+
+def _repair_prompt(data: dict, stream: _StreamState, broken: List[int]) -> str:
+    raw_zones = data.get("zones") or []
+    items = [
+        {"zone": raw_zones[i], "error": stream.errors[i]}
+        for i in broken
+    ]
+    return REPAIR_PROMPT.format(broken=json.dumps(items, separators=(",", ":")))
+
+
+def _apply_repair(stream: _StreamState, broken: List[int], repair: Optional[ZoneRepair]) -> None:
+    if repair is None:
+        return
+    for i, zone in zip(broken, repair.zones):
+        stream.zones[i] = zone
+        stream.errors.pop(i, None)
+        if stream.on_zone:
+            stream.on_zone(i, zone)
+
+
+def _parse_repair(message) -> Optional[ZoneRepair]:
+    for call in getattr(message, "tool_calls", None) or []:
+        if call.get("name") == "ZoneRepair":
+            try:
+                return ZoneRepair.model_validate(call.get("args") or {})
+            except ValidationError:
+                return None
+    return None
+
+
+def _unguarded(call, prompt: str):
+    return call(prompt)
+
+
+async def _aunguarded(acall, prompt: str):
+    return await acall(prompt)
+
+
+class StructuredPlanner:
+    """Streams a `LayoutPlan` tool call from the LLM and validates it zone by zone."""
+
+    def __init__(self, llm, max_repairs: int = 1,
+                 guard: CallGuard = _unguarded, aguard: AsyncCallGuard = _aunguarded):
+        self.plan_llm = llm.bind_tools([LayoutPlan], tool_choice="LayoutPlan")
+        self.repair_llm = llm.bind_tools([ZoneRepair], tool_choice="ZoneRepair")
+        self.max_repairs = max_repairs
+        self.guard = guard
+        self.aguard = aguard
+
+    def _repair(self, prompt: str):
+        return self.repair_llm.invoke([HumanMessage(content=prompt)])
+
+    async def _arepair(self, prompt: str):
+        return await self.repair_llm.ainvoke([HumanMessage(content=prompt)])
+
+    def plan(self, prompt: str, defaults: dict, on_zone: Optional[ZoneCallback] = None) -> Optional[LayoutPlan]:
+        stream = _StreamState(on_zone)
+        for chunk in self.plan_llm.stream([HumanMessage(content=prompt)]):
+            stream.feed(chunk)
+        data = stream.finish()
+        if data is None:
+            return None
+
+        plan, broken = _assemble(data, stream, defaults)
+        for _ in range(self.max_repairs):
+            if not broken:
+                break
+            reply = self.guard(self._repair, _repair_prompt(data, stream, broken))
+            _apply_repair(stream, broken, _parse_repair(reply))
+            plan, broken = _assemble(data, stream, defaults)
+        return plan
+
+    async def aplan(self, prompt: str, defaults: dict, on_zone: Optional[ZoneCallback] = None) -> Optional[LayoutPlan]:
+        stream = _StreamState(on_zone)
+        async for chunk in self.plan_llm.astream([HumanMessage(content=prompt)]):
+            stream.feed(chunk)
+        data = stream.finish()
+        if data is None:
+            return None
+
+        plan, broken = _assemble(data, stream, defaults)
+        for _ in range(self.max_repairs):
+            if not broken:
+                break
+            reply = await self.aguard(self._arepair, _repair_prompt(data, stream, broken))
+            _apply_repair(stream, broken, _parse_repair(reply))
+            plan, broken = _assemble(data, stream, defaults)
+        return plan
@@ -0,0 +1,219 @@
+# agents/zone_packer.py
+"""
+Deterministic zone geometry.
+
+Instead of asking the LLM for every zone's x/y/width/height, the planner
+packs the floorplate here and the LLM only assigns merchandise. Packing is
+done in an entrance-relative frame (u along the entrance wall, v into the
+store) and rotated onto the real `entrance_side` at the end:
+
+    front band   checkout | entrance decompression      (v = 0 .. front)
+    middle       merchandise zones, squarified treemap, areas weighted by
+                 trend score, inset by half an aisle on internal edges
+    back band    storage                                (v = depth - back .. depth)
+
+The result is non-overlapping and inside the floorplate by construction;
+`validate_zones` checks both (overlaps through `spatial_index`) so callers
+can assert it.
+
+Configuration (environment variables):
+    STORE_DIMENSIONS_M      default floorplate "LxW" in metres (default "20x12")
+    PACKER_AISLE_M          aisle width between merchandise zones (default 1.2)
+    PACKER_MAX_MERCH_ZONES  trend-driven merchandise zones (default 6)
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.agents.spatial_index import SpatialIndex
+from app.schemas.layout import Zone
+
+AISLE_M = float(os.getenv("PACKER_AISLE_M", "1.2"))
+MAX_MERCH_ZONES = int(os.getenv("PACKER_MAX_MERCH_ZONES", "6"))
+MIN_MERCH_SHARE = 0.08  # no trend gets less than this share of the sales floor
+
+# Front/back band depth as a share of store depth, clamped to sensible metres
+FRONT_BAND = (0.15, 1.5, 4.0)
+BACK_BAND = (0.12, 1.5, 3.0)
+CHECKOUT_SHARE = 0.3  # of the entrance wall
+
+DECOMPRESSION_ZONE = "Entrance Decompression"
+CHECKOUT_ZONE = "Checkout"
+STORAGE_ZONE = "Storage"
+FALLBACK_MERCH_ZONE = "General Merchandise"
+
+
+def default_dimensions() -> Tuple[float, float]:
+    length, width = os.getenv("STORE_DIMENSIONS_M", "20x12").lower().split("x")
+    return float(length), float(width)
+
+
+@dataclass(frozen=True)
+class ZoneSpec:
+    name: str
+    weight: float
+
+
+# === Specs ===
+def merchandise_specs(trends: dict, max_zones: int = MAX_MERCH_ZONES) -> List[ZoneSpec]:
+    """One merchandise zone per top national keyword, weighted by its score."""
+    best: Dict[str, float] = {}
+    for item in (trends or {}).get("interest_over_time_national", []) or []:
+        name = item["keyword"].strip().title()
+        best[name] = max(best.get(name, 0.0), float(item.get("score") or 0.0))
+    ranked = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:max_zones]
+    if not ranked:
+        return [ZoneSpec(FALLBACK_MERCH_ZONE, 1.0)]
+    scores = np.array([s for _, s in ranked], dtype=float)
+    weights = scores / scores.sum() if scores.sum() > 0 else np.full(len(ranked), 1.0 / len(ranked))
+    # Floor every share, then renormalize, so a weak trend still gets a workable zone
+    floor = min(MIN_MERCH_SHARE, 1.0 / len(ranked))
+    weights = np.maximum(weights, floor)
+    weights /= weights.sum()
+    return [ZoneSpec(name, float(w)) for (name, _), w in zip(ranked, weights)]
+
+
+# === Squarified treemap ===
+def _worst(row: np.ndarray, side: float) -> float:
+    s = row.sum()
+    return max(side * side * row.max() / (s * s), (s * s) / (side * side * row.min()))
+
+
+def squarify(areas: Sequence[float], x: float, y: float, w: float, h: float) -> np.ndarray:
+    """Rectangles (n, 4) as [x, y, w, h] tiling (x, y, w, h) with the given areas, in order."""
+    areas = np.asarray(areas, dtype=float)
+    areas = areas * (w * h) / areas.sum()
+    rects = np.zeros((len(areas), 4))
+    i = 0
+    while i < len(areas):
+        side = min(w, h)
+        j = i + 1
+        while j < len(areas) and _worst(areas[i:j + 1], side) <= _worst(areas[i:j], side):
+            j += 1
+        row = areas[i:j]
+        thickness = row.sum() / side
+        offsets = np.concatenate(([0.0], np.cumsum(row / thickness)[:-1]))
+        lengths = row / thickness
+        if w >= h:  # lay the row along the left edge, stacked vertically
+            rects[i:j] = np.column_stack([np.full(len(row), x), y + offsets, np.full(len(row), thickness), lengths])
+            x, w = x + thickness, w - thickness
+        else:  # lay the row along the bottom edge, side by side
+            rects[i:j] = np.column_stack([x + offsets, np.full(len(row), y), lengths, np.full(len(row), thickness)])
+            y, h = y + thickness, h - thickness
+        i = j
+    return rects
+
+
+# === Frame ===
+def _band(depth: float, spec: Tuple[float, float, float]) -> float:
+    share, lo, hi = spec
+    return float(np.clip(share * depth, lo, hi))
+
+
+def _to_plan_frame(rects: np.ndarray, dims: Tuple[float, float], entrance_side: str) -> np.ndarray:
+    """Entrance-relative [u, v, du, dv] → floorplate [x, y, width, height]."""
+    length, width = dims
+    u, v, du, dv = rects.T
+    if entrance_side == "south":
+        out = (u, v, du, dv)
+    elif entrance_side == "north":
+        out = (u, width - v - dv, du, dv)
+    elif entrance_side == "west":
+        out = (v, u, dv, du)
+    else:  # east
+        out = (length - v - dv, u, dv, du)
+    return np.column_stack(out)
+
+
+# === Validation ===
+def validate_zones(rects: np.ndarray, dims: Tuple[float, float], tol: float = 1e-6) -> List[str]:
+    """Problems with (n, 4) [x, y, w, h] rectangles: out of bounds or pairwise overlap."""
+    problems = []
+    x, y, w, h = rects.T
+    out = (x < -tol) | (y < -tol) | (x + w > dims[0] + tol) | (y + h > dims[1] + tol) | (w <= 0) | (h <= 0)
+    problems.extend(f"zone {i} outside floorplate" for i in np.flatnonzero(out))
+    # Grid-bucketed, so only zones sharing a cell are compared
+    problems.extend(f"zones {i} and {j} overlap" for i, j in SpatialIndex(rects).overlapping_pairs(tol))
+    return problems
+
+
+# === Packing ===
+@lru_cache(maxsize=256)
+def _pack(dims: Tuple[float, float], entrance_side: str, specs: Tuple[ZoneSpec, ...], aisle: float):
+    length, width = dims
+    frontage, depth = (length, width) if entrance_side in ("south", "north") else (width, length)
+    front, back = _band(depth, FRONT_BAND), _band(depth, BACK_BAND)
+
+    checkout_w = CHECKOUT_SHARE * frontage
+    names = [CHECKOUT_ZONE, DECOMPRESSION_ZONE, STORAGE_ZONE]
+    fixed = np.array([
+        [0.0, 0.0, checkout_w, front],
+        [checkout_w, 0.0, frontage - checkout_w, front],
+        [0.0, depth - back, frontage, back],
+    ])
+
+    # Sales floor between the bands, with a cross aisle on either side
+    floor_v, floor_h = front + aisle, depth - back - front - 2 * aisle
+    if floor_h <= aisle:
+        raise ValueError(f"Floorplate {dims} too shallow to pack merchandise zones")
+    merch = squarify([s.weight for s in specs], 0.0, floor_v, frontage, floor_h)
+    # Half an aisle off every internal edge; zones on the outer walls keep their wall shelving
+    half = aisle / 2
+    at_left = merch[:, 0] <= 1e-9
+    at_right = merch[:, 0] + merch[:, 2] >= frontage - 1e-9
+    at_front = merch[:, 1] <= floor_v + 1e-9
+    at_back = merch[:, 1] + merch[:, 3] >= floor_v + floor_h - 1e-9
+    merch[:, 0] += np.where(at_left, 0.0, half)
+    merch[:, 2] -= np.where(at_left, 0.0, half) + np.where(at_right, 0.0, half)
+    merch[:, 1] += np.where(at_front, 0.0, half)
+    merch[:, 3] -= np.where(at_front, 0.0, half) + np.where(at_back, 0.0, half)
+
+    rects = _to_plan_frame(np.vstack([fixed, merch]), dims, entrance_side).round(2) + 0.0  # no -0.0
+    names += [s.name for s in specs]
+    return tuple(names), rects
+
+
+def pack_zones(
+    dims: Tuple[float, float],
+    entrance_side: str,
+    trends: dict,
+    aisle: float = AISLE_M,
+) -> List[Zone]:
+    """Valid, non-overlapping zones for the floorplate; products/fixtures left empty."""
+    specs = tuple(merchandise_specs(trends))
+    names, rects = _pack(tuple(float(d) for d in dims), entrance_side, specs, aisle)
+    problems = validate_zones(rects, dims)
+    if problems:
+        raise ValueError(f"Zone packing produced invalid geometry: {problems}")
+    return [
+        Zone(name=name, x=float(x), y=float(y), width=float(w), height=float(h))
+        for name, (x, y, w, h) in zip(names, rects)
+    ]
+
+
+def try_pack_zones(
+    dims: Tuple[float, float],
+    entrance_side: str,
+    trends: dict,
+    aisle: float = AISLE_M,
+) -> Optional[List[Zone]]:
+    """`pack_zones`, or None for a floorplate too shallow or narrow to pack; callers fall back to LLM geometry."""
+    try:
+        return pack_zones(dims, entrance_side, trends, aisle)
+    except ValueError:
+        return None
+
+
+def describe_position(zone: Zone, dims: Tuple[float, float], entrance_side: str) -> str:
+    """'front' / 'middle' / 'back' relative to the entrance, for the assignment prompt."""
+    cx, cy = zone.x + zone.width / 2, zone.y + zone.height / 2
+    depth_frac = {
+        "south": cy / dims[1],
+        "north": 1 - cy / dims[1],
+        "west": cx / dims[0],
+        "east": 1 - cx / dims[0],
+    }[entrance_side]
+    return "front" if depth_frac < 0.34 else "middle" if depth_frac < 0.67 else "back"
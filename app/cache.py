@@ -0,0 +1,430 @@
+# app/cache.py
+"""
+Pluggable cache backends shared by the LLM, trends, embedding and
+retrieval caches.
+
+With several uvicorn workers, in-process dicts are duplicated per worker
+and each starts cold. Every cache in the app therefore goes through a
+`CacheBackend`, selected once per process:
+
+    - `memory`: per-process, the previous behaviour;
+    - `sqlite`: one WAL-mode SQLite file shared by every worker on the host;
+    - `redis`:  any Redis-protocol server (Redis, or a local stand-in such as
+      KeyDB / Dragonfly), shared across hosts. Needs the `redis` package.
+
+All backends behave the same way:
+
+    - values are serialized as JSON, so a hit returns a fresh copy and a
+      value written by one worker reads back identically in another;
+    - each namespace ("llm", "trends", "embeddings", "retrieval") has its
+      own TTL and entry cap; expired entries are misses, and past the cap
+      the least recently *read or written* entries are evicted;
+    - a backend error is logged and treated as a miss / skipped write, so
+      a broken cache never fails a request.
+
+SQLite and Redis calls block on disk or the network, so async code paths use
+`NamespaceCache.aget` / `aset`, which run them on the shared I/O executor
+(`app.clients.run_blocking`); the memory backend is called inline.
+
+Callers use `get_cache(namespace, ttl_s, max_entries)` and string or tuple
+keys; `make_key` hashes tuples into fixed-length keys.
+
+Configuration (environment variables):
+    CACHE_BACKEND           "memory" | "sqlite" | "redis" (default memory)
+    CACHE_SQLITE_PATH       SQLite file (default <repo>/artifacts/cache.sqlite)
+    CACHE_SQLITE_TOUCH_S    how long SQLite read touches are batched in memory
+                            before being written (default 30)
+    CACHE_REDIS_URL         e.g. redis://localhost:6379/0
+    CACHE_REDIS_PREFIX      key prefix on a shared server (default "retail")
+"""
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from app.clients import run_blocking
+
+logger = logging.getLogger(__name__)
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+CACHE_SQLITE_PATH = Path(os.getenv("CACHE_SQLITE_PATH", str(REPO_DIR / "artifacts" / "cache.sqlite")))
+CACHE_SQLITE_TOUCH_S = float(os.getenv("CACHE_SQLITE_TOUCH_S", "30"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_REDIS_PREFIX = os.getenv("CACHE_REDIS_PREFIX", "retail")
+
+Key = Union[str, Tuple]
+
+
+def make_key(*parts) -> str:
+    """Stable fixed-length key for any JSON-serializable parts."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def encode(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def decode(raw: bytes) -> Any:
+    return json.loads(raw)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    expired: int = 0
+    evictions: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+# === Backends ===
+class CacheBackend:
+    """Raw byte storage by (namespace, key) with absolute expiry and a per-namespace LRU cap."""
+
+    name = "base"
+    # Calls wait on disk or the network: async callers go through the I/O executor
+    blocking = True
+
+    def __init__(self):
+        self.stats: Dict[str, CacheStats] = {}
+        self._stats_lock = threading.Lock()
+
+    def _stat(self, namespace: str, field: str, n: int = 1) -> None:
+        with self._stats_lock:
+            stats = self.stats.setdefault(namespace, CacheStats())
+            setattr(stats, field, getattr(stats, field) + n)
+
+    # Implemented by backends; `expires_at` is wall-clock so it means the same in every process
+    def _get(self, namespace: str, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _set(self, namespace: str, key: str, raw: bytes, expires_at: float, max_entries: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self, namespace: str) -> None:
+        raise NotImplementedError
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        try:
+            raw = self._get(namespace, key)
+            value = None if raw is None else decode(raw)
+        except Exception as e:
+            logger.warning(f"{self.name} cache read failed ({namespace}): {e}")
+            self._stat(namespace, "errors")
+            value = None
+        self._stat(namespace, "misses" if value is None else "hits")
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl_s: float, max_entries: int) -> None:
+        try:
+            self._set(namespace, key, encode(value), time.time() + ttl_s, max_entries)
+            self._stat(namespace, "writes")
+        except Exception as e:
+            logger.warning(f"{self.name} cache write failed ({namespace}): {e}")
+            self._stat(namespace, "errors")
+
+    def status(self) -> Dict:
+        with self._stats_lock:
+            return {"backend": self.name, "namespaces": {ns: s.as_dict() for ns, s in self.stats.items()}}
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process OrderedDicts; LRU order is the dict order."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self):
+        super().__init__()
+        self._data: Dict[str, "OrderedDict[str, Tuple[bytes, float]]"] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, namespace, key):
+        with self._lock:
+            entries = self._data.get(namespace)
+            entry = entries.get(key) if entries else None
+            if entry is None:
+                return None
+            if entry[1] < time.time():
+                del entries[key]
+                self._stat(namespace, "expired")
+                return None
+            entries.move_to_end(key)
+            return entry[0]
+
+    def _set(self, namespace, key, raw, expires_at, max_entries):
+        with self._lock:
+            entries = self._data.setdefault(namespace, OrderedDict())
+            entries[key] = (raw, expires_at)
+            entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+                self._stat(namespace, "evictions")
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._data.pop(namespace, None)
+
+
+class SQLiteBackend(CacheBackend):
+    """One WAL-mode file per host: concurrent readers in every worker, one writer at a time.
+
+    A hit doesn't write: its access time is kept in memory and written with
+    the next `set` (which evicts by it) or, on a read-only workload, in one
+    batch every `touch_s`. Expired rows found by a read are deleted the same
+    way. LRU order across workers is therefore approximate to within `touch_s`.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path = CACHE_SQLITE_PATH, touch_s: float = CACHE_SQLITE_TOUCH_S):
+        super().__init__()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.touch_s = touch_s
+        self._conn = sqlite3.connect(str(path), timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (ns, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (ns, accessed_at)")
+        self._lock = threading.Lock()
+        # Pending writes from reads: (ns, key) -> access time, and expired (ns, key) pairs
+        self._touched: Dict[Tuple[str, str], float] = {}
+        self._expired: Dict[Tuple[str, str], float] = {}
+        self._flushed_at = time.monotonic()
+
+    def _write_pending(self) -> None:
+        """Write batched touches / expiries; caller holds the lock (and may hold a transaction)."""
+        if self._touched:
+            # MAX: a `set` from another worker since the read may already be newer
+            self._conn.executemany(
+                "UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE ns = ? AND key = ?",
+                [(at, ns, key) for (ns, key), at in self._touched.items()],
+            )
+        if self._expired:
+            # Only if still expired: another worker may have rewritten it
+            self._conn.executemany(
+                "DELETE FROM cache WHERE ns = ? AND key = ? AND expires_at < ?",
+                [(ns, key, at) for (ns, key), at in self._expired.items()],
+            )
+        self._touched.clear()
+        self._expired.clear()
+        self._flushed_at = time.monotonic()
+
+    def _flush_if_due(self) -> None:
+        if (self._touched or self._expired) and time.monotonic() - self._flushed_at >= self.touch_s:
+            try:
+                self._write_pending()
+            except sqlite3.Error as e:
+                # Busy writer: keep serving reads, retry next interval
+                logger.debug(f"sqlite cache touch flush deferred: {e}")
+                self._flushed_at = time.monotonic()
+
+    def _get(self, namespace, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE ns = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                hit = None
+            elif row[1] < now:
+                self._expired[(namespace, key)] = now
+                self._touched.pop((namespace, key), None)
+                self._stat(namespace, "expired")
+                hit = None
+            else:
+                self._touched[(namespace, key)] = now
+                hit = row[0]
+            self._flush_if_due()
+            return hit
+
+    def _set(self, namespace, key, raw, expires_at, max_entries):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Already writing: apply batched read touches first, so eviction sees them
+                self._write_pending()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (ns, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, raw, expires_at, now),
+                )
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM cache WHERE ns = ?", (namespace,)).fetchone()
+                excess = count - max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE ns = ? AND key IN "
+                        "(SELECT key FROM cache WHERE ns = ? ORDER BY accessed_at LIMIT ?)",
+                        (namespace, namespace, excess),
+                    )
+                    self._stat(namespace, "evictions", excess)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._touched.pop((namespace, key), None)
+            self._conn.execute("DELETE FROM cache WHERE ns = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace):
+        with self._lock:
+            self._touched = {k: v for k, v in self._touched.items() if k[0] != namespace}
+            self._conn.execute("DELETE FROM cache WHERE ns = ?", (namespace,))
+
+
+class RedisBackend(CacheBackend):
+    """
+    Values under `<prefix>:<ns>:<key>` with a PX expiry; a sorted set
+    `<prefix>:<ns>:lru` scored by access time gives the same LRU cap as the
+    other backends. Only GET/SET/DEL/Z* commands, so any Redis-protocol
+    server will do.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = CACHE_REDIS_URL, prefix: str = CACHE_REDIS_PREFIX, client=None):
+        super().__init__()
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+            client.ping()
+        self._r = client
+        self.prefix = prefix
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _lru(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}:lru"
+
+    def _get(self, namespace, key):
+        raw = self._r.get(self._key(namespace, key))
+        if raw is None:
+            # Expired entries vanish server-side; drop them from the LRU index too
+            self._r.zrem(self._lru(namespace), key)
+            return None
+        self._r.zadd(self._lru(namespace), {key: time.time()})
+        return raw
+
+    def _set(self, namespace, key, raw, expires_at, max_entries):
+        ttl_ms = max(1, int((expires_at - time.time()) * 1000))
+        lru = self._lru(namespace)
+        pipe = self._r.pipeline()
+        pipe.set(self._key(namespace, key), raw, px=ttl_ms)
+        pipe.zadd(lru, {key: time.time()})
+        pipe.zcard(lru)
+        count = pipe.execute()[-1]
+        excess = count - max_entries
+        if excess > 0:
+            oldest = [k.decode() if isinstance(k, bytes) else k for k in self._r.zrange(lru, 0, excess - 1)]
+            pipe = self._r.pipeline()
+            pipe.delete(*[self._key(namespace, k) for k in oldest])
+            pipe.zrem(lru, *oldest)
+            pipe.execute()
+            self._stat(namespace, "evictions", len(oldest))
+
+    def delete(self, namespace, key):
+        self._r.delete(self._key(namespace, key))
+        self._r.zrem(self._lru(namespace), key)
+
+    def clear(self, namespace):
+        lru = self._lru(namespace)
+        keys = [k.decode() if isinstance(k, bytes) else k for k in self._r.zrange(lru, 0, -1)]
+        if keys:
+            self._r.delete(*[self._key(namespace, k) for k in keys])
+        self._r.delete(lru)
+
+
+@lru_cache(maxsize=None)
+def get_cache_backend() -> CacheBackend:
+    """The process-wide backend; falls back to memory if the configured one is unavailable."""
+    kind = os.getenv("CACHE_BACKEND", "memory").lower()
+    try:
+        if kind == "sqlite":
+            return SQLiteBackend()
+        if kind == "redis":
+            if importlib.util.find_spec("redis") is None:
+                raise ImportError("the `redis` package is not installed")
+            return RedisBackend()
+    except Exception as e:
+        logger.warning(f"Cache backend {kind!r} unavailable, using memory: {e}")
+    return MemoryBackend()
+
+
+# === Namespaced view ===
+class NamespaceCache:
+    """One cache (e.g. "trends") on the shared backend, with its own TTL and size cap."""
+
+    def __init__(self, namespace: str, ttl_s: float, max_entries: int, backend: Optional[CacheBackend] = None):
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.backend = backend or get_cache_backend()
+
+    @staticmethod
+    def _k(key: Key) -> str:
+        return key if isinstance(key, str) else make_key(*key)
+
+    def get(self, key: Key) -> Optional[Any]:
+        return self.backend.get(self.namespace, self._k(key))
+
+    def set(self, key: Key, value: Any, ttl_s: Optional[float] = None) -> None:
+        ttl_s = self.ttl_s if ttl_s is None else ttl_s
+        self.backend.set(self.namespace, self._k(key), value, ttl_s, self.max_entries)
+
+    async def aget(self, key: Key) -> Optional[Any]:
+        if not self.backend.blocking:
+            return self.get(key)
+        return await run_blocking(self.get, key)
+
+    async def aset(self, key: Key, value: Any, ttl_s: Optional[float] = None) -> None:
+        if not self.backend.blocking:
+            return self.set(key, value, ttl_s)
+        await run_blocking(self.set, key, value, ttl_s)
+
+    def delete(self, key: Key) -> None:
+        self.backend.delete(self.namespace, self._k(key))
+
+    def clear(self) -> None:
+        self.backend.clear(self.namespace)
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.status()["namespaces"].get(self.namespace, CacheStats().as_dict())
+
+
+def get_cache(namespace: str, ttl_s: float, max_entries: int) -> NamespaceCache:
+    return NamespaceCache(namespace, ttl_s, max_entries)
+
+
+def cache_status() -> Dict:
+    return get_cache_backend().status()
@@ -0,0 +1,244 @@
+# app/checkpoints.py
+"""
+SQLite-backed LangGraph checkpointing, keyed by layout id.
+
+With a checkpointer the main graph saves its state after every node
+(market → strategist → draftsman) under `thread_id = layout_id`. A request
+that failed part-way can be retried with the same `layout_id`: the graph
+resumes from the last completed node, so a draftsman failure no longer
+re-runs market analysis and every strategist LLM call.
+
+Checkpoints are per main-graph node: the strategist subgraph (planner,
+reviewer, refinement loop) is one node here, so a failure inside it re-runs
+the whole strategist on retry; only market analysis is saved.
+
+Each checkpoint carries a fingerprint of the request that created it (city,
+keywords, previous plan and signals). Resuming a `layout_id` with a
+different payload raises `CheckpointMismatch` instead of replaying someone
+else's run. A finished run whose diagram file is gone is redrawn from its
+checkpointed plan.
+
+Runs of one `layout_id` are serialised across workers by a lease row in the
+same database: a second request for a layout that is being generated waits
+for the first to finish (then resumes or serves its result) instead of
+running the same nodes twice. The lease expires on its own if a worker dies.
+
+Threads not used for CHECKPOINT_TTL_S, and the least recently used beyond
+CHECKPOINT_MAX_THREADS, are deleted by `prune_checkpoints`, which the app
+runs at startup and every CHECKPOINT_PRUNE_INTERVAL_S.
+
+Needs `langgraph-checkpoint-sqlite` (and `aiosqlite` for the async saver);
+without them checkpointing is simply off.
+
+Configuration (environment variables):
+    CHECKPOINTS_ENABLED     "1"/"0" (default 1)
+    CHECKPOINT_DB           SQLite file (default artifacts/checkpoints.sqlite)
+    CHECKPOINT_TTL_S        delete threads idle for this long (default 7 days)
+    CHECKPOINT_MAX_THREADS  keep at most this many threads (default 10000)
+    CHECKPOINT_PRUNE_INTERVAL_S  seconds between prunes (default 3600)
+    CHECKPOINT_LEASE_S      a run's lease on its layout_id (default 600)
+    CHECKPOINT_LEASE_WAIT_S how long a second request waits for it (default 120)
+"""
+import asyncio
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DB = Path(os.getenv("CHECKPOINT_DB", "artifacts/checkpoints.sqlite"))
+CHECKPOINT_TTL_S = float(os.getenv("CHECKPOINT_TTL_S", str(7 * 24 * 3600)))
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "10000"))
+PRUNE_INTERVAL_S = float(os.getenv("CHECKPOINT_PRUNE_INTERVAL_S", "3600"))
+LEASE_S = float(os.getenv("CHECKPOINT_LEASE_S", "600"))
+LEASE_WAIT_S = float(os.getenv("CHECKPOINT_LEASE_WAIT_S", "120"))
+LEASE_POLL_S = 0.5
+
+# Last use and current lease of each thread, next to LangGraph's own tables
+THREADS_TABLE = """
+CREATE TABLE IF NOT EXISTS layout_threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# App models stored in graph state; the serializer only revives allow-listed types
+STATE_TYPES = [
+    ("app.schemas.layout", "LayoutPlan"),
+    ("app.schemas.layout", "Floor"),
+    ("app.schemas.layout", "Zone"),
+    ("app.schemas.layout", "FixturePlacement"),
+]
+
+
+class CheckpointMismatch(ValueError):
+    """A layout_id re-posted with a different request than the one it was created for."""
+
+
+class LayoutBusy(RuntimeError):
+    """Another request is still generating this layout_id."""
+
+
+def checkpoints_enabled() -> bool:
+    if os.getenv("CHECKPOINTS_ENABLED", "1") in ("0", "false", "False"):
+        return False
+    return all(importlib.util.find_spec(m) is not None for m in ("langgraph.checkpoint.sqlite", "aiosqlite"))
+
+
+def request_fingerprint(
+    city: str,
+    keywords: List[str],
+    previous_plan: Optional[Dict[str, Any]] = None,
+    previous_trends: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Stable hash of the inputs a run was started with."""
+    payload = json.dumps([city, keywords, previous_plan, previous_trends], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def thread_config(layout_id: str) -> dict:
+    return {"configurable": {"thread_id": layout_id}}
+
+
+async def open_checkpointer(path: Path = CHECKPOINT_DB):
+    """An `AsyncSqliteSaver` on a WAL-mode database, or None if checkpointing is off."""
+    if not checkpoints_enabled():
+        return None
+    import aiosqlite
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = await aiosqlite.connect(str(path))
+    # Readers (resume lookups) shouldn't block the writer of another request
+    await conn.execute("PRAGMA journal_mode=WAL")
+    saver = AsyncSqliteSaver(conn, serde=JsonPlusSerializer(allowed_msgpack_modules=STATE_TYPES))
+    await saver.setup()
+    await conn.execute(THREADS_TABLE)
+    await conn.commit()
+    logger.info(f"Graph checkpoints at {path.resolve()}")
+    return saver
+
+
+async def close_checkpointer(saver) -> None:
+    if saver is not None:
+        await saver.conn.close()
+
+
+async def resume_point(graph, layout_id: str, fingerprint: str) -> Optional[tuple]:
+    """
+    Nodes still to run for a checkpointed layout: `None` if there is no
+    checkpoint, `()` if the run already finished. Raises `CheckpointMismatch`
+    if the checkpoint was created by a request with another fingerprint.
+    """
+    snapshot = await graph.aget_state(thread_config(layout_id))
+    if not snapshot.values:
+        return None
+    if snapshot.values.get("request_fingerprint") != fingerprint:
+        raise CheckpointMismatch(
+            f"layout_id {layout_id} belongs to a different request; omit layout_id to start a new layout"
+        )
+    return tuple(snapshot.next)
+
+
+# === Per-layout leases ===
+async def _try_claim(saver, layout_id: str, owner: str, now: float) -> bool:
+    async with saver.lock:
+        cursor = await saver.conn.execute(
+            "INSERT INTO layout_threads (thread_id, updated_at, lease_owner, lease_until) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at, "
+            " lease_owner = excluded.lease_owner, lease_until = excluded.lease_until "
+            "WHERE layout_threads.lease_until < excluded.updated_at",
+            (layout_id, now, owner, now + LEASE_S),
+        )
+        await saver.conn.commit()
+        return cursor.rowcount > 0
+
+
+async def _release(saver, layout_id: str, owner: str) -> None:
+    async with saver.lock:
+        await saver.conn.execute(
+            "UPDATE layout_threads SET lease_owner = NULL, lease_until = 0, updated_at = ? "
+            "WHERE thread_id = ? AND lease_owner = ?",
+            (time.time(), layout_id, owner),
+        )
+        await saver.conn.commit()
+
+
+@asynccontextmanager
+async def layout_lease(saver, layout_id: str, wait_s: float = LEASE_WAIT_S):
+    """
+    Hold `layout_id` for the enclosed run, in every worker sharing the
+    database. Waits up to `wait_s` for a run already holding it, then raises
+    `LayoutBusy`. A no-op without a checkpointer.
+    """
+    if saver is None:
+        yield
+        return
+    owner = uuid.uuid4().hex
+    deadline = time.monotonic() + wait_s
+    while not await _try_claim(saver, layout_id, owner, time.time()):
+        if time.monotonic() >= deadline:
+            raise LayoutBusy(f"layout_id {layout_id} is still being generated; retry later")
+        await asyncio.sleep(LEASE_POLL_S)
+    try:
+        yield
+    finally:
+        # A cancelled request must still give the layout back
+        await asyncio.shield(_release(saver, layout_id, owner))
+
+
+# === Retention ===
+async def prune_checkpoints(
+    saver, ttl_s: float = CHECKPOINT_TTL_S, max_threads: int = CHECKPOINT_MAX_THREADS
+) -> int:
+    """Delete idle threads (and threads from before lease tracking); returns how many."""
+    now = time.time()
+    async with saver.lock:
+        rows = await saver.conn.execute_fetchall(
+            "SELECT thread_id FROM layout_threads WHERE lease_until < ? AND ("
+            " updated_at < ? OR thread_id IN ("
+            "  SELECT thread_id FROM layout_threads ORDER BY updated_at DESC LIMIT -1 OFFSET ?))",
+            (now, now - ttl_s, max_threads),
+        )
+        untracked = await saver.conn.execute_fetchall(
+            "SELECT DISTINCT thread_id FROM checkpoints "
+            "WHERE thread_id NOT IN (SELECT thread_id FROM layout_threads)"
+        )
+    stale = [r[0] for r in rows] + [r[0] for r in untracked]
+    pruned = 0
+    for thread_id in stale:
+        async with saver.lock:
+            # Re-checked under the lock: a request may have claimed the thread since the select
+            leased = await saver.conn.execute_fetchall(
+                "SELECT 1 FROM layout_threads WHERE thread_id = ? AND lease_until >= ?", (thread_id, time.time())
+            )
+            if leased:
+                continue
+            # The tables `AsyncSqliteSaver.adelete_thread` clears, plus our row, in one transaction
+            for table in ("checkpoints", "writes", "layout_threads"):
+                await saver.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            await saver.conn.commit()
+            pruned += 1
+    if pruned:
+        logger.info(f"Pruned {pruned} checkpoint thread(s)")
+    return pruned
+
+
+async def prune_periodically(saver, interval_s: float = PRUNE_INTERVAL_S) -> None:
+    """Run `prune_checkpoints` now and every `interval_s` until cancelled."""
+    while True:
+        try:
+            await prune_checkpoints(saver)
+        except Exception as e:
+            logger.warning(f"Checkpoint pruning failed: {e}")
+        await asyncio.sleep(interval_s)
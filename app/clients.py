@@ -0,0 +1,190 @@
+# app/clients.py
+"""
+Shared client factory for every external dependency.
+
+All agents get their Azure OpenAI, embeddings, Pinecone and Google Trends
+clients from here instead of building their own at import time. The Azure
+clients share one pooled keep-alive ``httpx`` transport (sync and async), so
+TLS handshakes are amortized across requests and the number of open
+connections stays bounded under concurrency.
+
+Tuning (environment variables):
+    HTTP_MAX_CONNECTIONS        total pooled connections per client (default 50)
+    HTTP_MAX_KEEPALIVE          idle keep-alive connections kept open (default 20)
+    HTTP_KEEPALIVE_EXPIRY_S     seconds an idle connection is kept (default 30)
+    HTTP_CONNECT_TIMEOUT_S      connect timeout (default 5)
+    HTTP_READ_TIMEOUT_S         read timeout, covers slow completions (default 60)
+    TRENDS_READ_TIMEOUT_S       Google Trends read timeout (default 25)
+    HTTP2_ENABLED               "1"/"0", HTTP/2 when the `h2` package is present (default 1)
+    PINECONE_POOL_THREADS       Pinecone connection pool size (default 8)
+    IO_EXECUTOR_WORKERS         threads for blocking SDK calls made from async code (default 32)
+"""
+import asyncio
+import contextvars
+import importlib.util
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+import httpx
+
+from app.utils import load_env_file
+
+load_env_file()
+
+PINECONE_INDEX_NAME = "retail-copilot"
+EMBEDDING_DEPLOYMENT = "text-embedding-3-small"
+EMBEDDING_API_VERSION = "2023-05-15"
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+# === HTTP transport ===
+def http2_supported() -> bool:
+    """HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive."""
+    enabled = os.getenv("HTTP2_ENABLED", "1") not in ("0", "false", "False")
+    return enabled and importlib.util.find_spec("h2") is not None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_env_int("HTTP_MAX_CONNECTIONS", 50),
+        max_keepalive_connections=_env_int("HTTP_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY_S", 30.0),
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        _env_float("HTTP_READ_TIMEOUT_S", 60.0),
+        connect=_env_float("HTTP_CONNECT_TIMEOUT_S", 5.0),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Process-wide pooled sync HTTP client."""
+    return httpx.Client(limits=_limits(), timeout=_timeout(), http2=http2_supported())
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled async HTTP client."""
+    return httpx.AsyncClient(limits=_limits(), timeout=_timeout(), http2=http2_supported())
+
+
+# === Azure OpenAI ===
+@lru_cache(maxsize=None)
+def get_llm(temperature: float = 0):
+    """Shared AzureChatOpenAI bound to the pooled transports."""
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(
+        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+        temperature=temperature,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Shared AzureOpenAIEmbeddings bound to the pooled transports."""
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_deployment=EMBEDDING_DEPLOYMENT,
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        openai_api_version=EMBEDDING_API_VERSION,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    )
+
+
+# === Pinecone ===
+@lru_cache(maxsize=None)
+def get_pinecone():
+    """Shared Pinecone client; its urllib3 pool is sized by PINECONE_POOL_THREADS."""
+    from pinecone import Pinecone
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise ValueError("❌ Missing PINECONE_API_KEY environment variable.")
+    return Pinecone(api_key=api_key, pool_threads=_env_int("PINECONE_POOL_THREADS", 8))
+
+
+@lru_cache(maxsize=None)
+def get_pinecone_index(index_name: str = PINECONE_INDEX_NAME):
+    """Shared handle on a Pinecone index (one connection pool per index)."""
+    pc = get_pinecone()
+    if not pc.has_index(index_name):
+        raise ValueError(f"❌ Pinecone index '{index_name}' not found.")
+    return pc.Index(index_name, pool_threads=_env_int("PINECONE_POOL_THREADS", 8))
+
+
+# === Google Trends ===
+_trends_local = threading.local()
+
+
+def get_trends_client():
+    """
+    Reuse one TrendReq per thread.
+
+    TrendReq keeps per-request state (`build_payload`) so it cannot be shared
+    across threads, but re-creating it per call repeats the cookie handshake
+    with Google on every analysis.
+    """
+    client = getattr(_trends_local, "client", None)
+    if client is None:
+        from pytrends.request import TrendReq
+
+        client = TrendReq(
+            hl="en-US",
+            tz=330,
+            timeout=(_env_float("HTTP_CONNECT_TIMEOUT_S", 5.0), _env_float("TRENDS_READ_TIMEOUT_S", 25.0)),
+        )
+        _trends_local.client = client
+    return client
+
+
+# === Blocking calls from async code ===
+@lru_cache(maxsize=None)
+def get_io_executor() -> ThreadPoolExecutor:
+    """Bounded pool for SDKs without an async API (pytrends, Pinecone REST)."""
+    return ThreadPoolExecutor(
+        max_workers=_env_int("IO_EXECUTOR_WORKERS", 32),
+        thread_name_prefix="io",
+    )
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on the shared I/O executor without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()  # keep request-scoped contextvars in the worker
+    return await loop.run_in_executor(get_io_executor(), partial(ctx.run, fn, *args, **kwargs))
+
+
+def close_clients() -> None:
+    """Close the pooled sync transport."""
+    if get_http_client.cache_info().currsize:
+        get_http_client().close()
+    get_http_client.cache_clear()
+
+
+async def aclose_clients() -> None:
+    """Close both pooled transports (FastAPI shutdown)."""
+    if get_async_http_client.cache_info().currsize:
+        await get_async_http_client().aclose()
+    get_async_http_client.cache_clear()
+    close_clients()
@@ -0,0 +1,134 @@
+# app/constraint_digests.py
+"""
+Pre-distilled layout constraints, per source and city.
+
+`python -m data_ingestion.build_constraint_digests` condenses the building
+code, brand book, fixture catalog, best practices and each city's leasing
+agreement into short rules and fixture dimensions. The planner and reviewer
+put `render_constraints(city, budget)` at the top of their context instead
+of raw chunks of those documents, and for a known city (one with its own
+site digest) a failed review goes straight back to the planner: the
+digest already holds what retrieval would have found.
+
+Without a store (not built yet) every city is unknown and the strategist
+retrieves as before.
+
+Configuration (environment variables):
+    CONSTRAINT_DIGESTS          store path (default app/constraint_digests.json)
+    DIGEST_CONTEXT_TOKENS       cap on the rendered digest per prompt (default 900)
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional
+
+from app.context_builder import count_tokens
+from app.schemas.constraints import DigestBundle, SourceDigest
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent
+DIGESTS_PATH = Path(os.getenv("CONSTRAINT_DIGESTS", APP_DIR / "constraint_digests.json"))
+DIGEST_CONTEXT_TOKENS = int(os.getenv("DIGEST_CONTEXT_TOKENS", "900"))
+
+# Rendering order: what shapes the floor plan first
+CATEGORY_ORDER = ["walls", "entrance", "circulation", "accessibility", "fixtures", "services", "brand"]
+# Memoized renders kept (per known city and budget; unknown cities share one)
+RENDER_MEMO_SIZE = 256
+
+
+def _city_key(city: Optional[str]) -> str:
+    return (city or "").strip().casefold()
+
+
+class DigestStore:
+    """The digest store, loaded once; renders are memoized per (known city, budget) in a bounded LRU."""
+
+    def __init__(self, path: Path = DIGESTS_PATH):
+        self.path = path
+        self._bundle: Optional[DigestBundle] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._rendered: "OrderedDict[tuple, str]" = OrderedDict()
+        self._rendered_lock = threading.Lock()
+
+    def bundle(self) -> Optional[DigestBundle]:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    try:
+                        self._bundle = DigestBundle.model_validate_json(self.path.read_text(encoding="utf-8"))
+                        logger.info(f"Loaded constraint digests for {len(self._bundle.sources)} source(s) from {self.path}")
+                    except FileNotFoundError:
+                        logger.info(f"No constraint digests at {self.path}; strategist relies on retrieval")
+                    except Exception as e:
+                        logger.warning(f"Constraint digests at {self.path} unreadable, ignored: {e}")
+                    self._loaded = True
+        return self._bundle
+
+    def for_city(self, city: Optional[str]) -> List[SourceDigest]:
+        """The city's own digests first, then those that apply everywhere."""
+        bundle = self.bundle()
+        if bundle is None:
+            return []
+        key = _city_key(city)
+        own = [d for d in bundle.sources if d.city and _city_key(d.city) == key]
+        return own + [d for d in bundle.sources if not d.city]
+
+    def known_city(self, city: Optional[str]) -> bool:
+        """True when the city has a site-specific digest (e.g. its leasing agreement)."""
+        return any(d.city for d in self.for_city(city))
+
+    def render(self, city: Optional[str], max_tokens: int = DIGEST_CONTEXT_TOKENS) -> str:
+        # Cities without a site digest all render the same; keying them apart would let
+        # arbitrary request cities grow the memo
+        key = (_city_key(city) if self.known_city(city) else "", max_tokens)
+        with self._rendered_lock:
+            if key in self._rendered:
+                self._rendered.move_to_end(key)
+                return self._rendered[key]
+        text = self._render(city, max_tokens)
+        with self._rendered_lock:
+            self._rendered[key] = text
+            while len(self._rendered) > RENDER_MEMO_SIZE:
+                self._rendered.popitem(last=False)
+        return text
+
+    def _render(self, city: Optional[str], max_tokens: int) -> str:
+        lines: List[str] = []
+        remaining = max_tokens
+        # One pass per category across sources, so a long brand book can't crowd out wall rules
+        entries = []
+        for category in CATEGORY_ORDER:
+            for digest in self.for_city(city):
+                label = f"{digest.source}·{digest.city}" if digest.city else digest.source
+                for rule in digest.constraints:
+                    if rule.category == category:
+                        entries.append(f"- [{label}] {category}: {rule.text}")
+                if category == "fixtures" and digest.fixtures:
+                    sizes = "; ".join(
+                        f"{f.code} {f.name} {'×'.join(f'{v:g}' for v in f.dimensions_mm.values())}".strip()
+                        for f in digest.fixtures if f.dimensions_mm
+                    )
+                    if sizes:
+                        entries.append(f"- [{label}] fixture sizes (mm): {sizes}")
+        for entry in entries:
+            cost = count_tokens(entry) + 1
+            if cost > remaining:
+                continue
+            lines.append(entry)
+            remaining -= cost
+        return ("Site and brand constraints:\n" + "\n".join(lines)) if lines else ""
+
+
+digest_store = DigestStore()
+
+
+def render_constraints(city: Optional[str], max_tokens: int = DIGEST_CONTEXT_TOKENS) -> str:
+    return digest_store.render(city, min(max_tokens, DIGEST_CONTEXT_TOKENS))
+
+
+def known_city(city: Optional[str]) -> bool:
+    return digest_store.known_city(city)
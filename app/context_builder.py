@@ -0,0 +1,140 @@
+# app/context_builder.py
+"""
+Prompt context assembly for the planner and reviewer.
+
+Retrieved chunks come from a 1000/200-char `RecursiveCharacterTextSplitter`,
+so neighbouring chunks of one document repeat up to ~200 characters and the
+same passage often comes back for several queries. This module:
+
+    1. drops exact and contained duplicates,
+    2. stitches adjacent chunks of the same source back together on their
+       overlap,
+    3. packs the result by relevance under a token budget, and
+    4. serializes plans as compact JSON.
+
+Token counts use `tiktoken` when it is installed (it ships with
+langchain-openai) and fall back to a 4-chars-per-token estimate.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List
+
+PLANNER_CONTEXT_TOKENS = int(os.getenv("PLANNER_CONTEXT_TOKENS", "1500"))
+REVIEWER_CONTEXT_TOKENS = int(os.getenv("REVIEWER_CONTEXT_TOKENS", "2000"))
+
+# The splitter's chunk_overlap is 200 chars, but it cuts on separators so
+# the shared span can run slightly longer.
+MAX_OVERLAP_CHARS = 300
+MIN_OVERLAP_CHARS = 20
+
+
+# === Tokens ===
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoder()
+    if enc is None:
+        return max(1, len(text) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def _truncate_to_tokens(text: str, budget: int) -> str:
+    enc = _encoder()
+    if enc is None:
+        return text[: budget * 4]
+    return enc.decode(enc.encode(text, disallowed_special=())[:budget])
+
+
+# === Dedup / merge ===
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    limit = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def dedupe_chunks(chunks: List[Dict]) -> List[Dict]:
+    """
+    Collapse duplicate and overlapping chunks.
+
+    Chunks carrying a `chunk` index (set at ingestion) are merged with their
+    neighbours from the same source; the merged chunk keeps the best score.
+    """
+    seen_texts = set()
+    unique = []
+    for c in sorted(chunks, key=lambda c: c.get("score") or 0, reverse=True):
+        text = (c.get("text") or "").strip()
+        if not text or text in seen_texts:
+            continue
+        seen_texts.add(text)
+        unique.append({**c, "text": text})
+
+    # Drop chunks wholly contained in a better-scored one
+    kept: List[Dict] = []
+    for c in unique:
+        if any(c["text"] in k["text"] for k in kept if k.get("source") == c.get("source")):
+            continue
+        kept.append(c)
+
+    # Stitch runs of consecutive chunk indexes per source
+    by_source: Dict[str, List[Dict]] = {}
+    loose = []
+    for c in kept:
+        if isinstance(c.get("chunk"), int):
+            by_source.setdefault(c.get("source", "unknown"), []).append(c)
+        else:
+            loose.append(c)
+
+    merged = []
+    for source, items in by_source.items():
+        items.sort(key=lambda c: c["chunk"])
+        run, last = dict(items[0]), items[0]["chunk"]
+        for nxt in items[1:]:
+            if nxt["chunk"] == last + 1:
+                size = _overlap(run["text"], nxt["text"])
+                run["text"] = run["text"] + ("" if size else "\n") + nxt["text"][size:]
+                run["score"] = max(run.get("score") or 0, nxt.get("score") or 0)
+            else:
+                merged.append(run)
+                run = dict(nxt)
+            last = nxt["chunk"]
+        merged.append(run)
+
+    return sorted(merged + loose, key=lambda c: c.get("score") or 0, reverse=True)
+
+
+# === Packing ===
+def build_context(chunks: List[Dict], max_tokens: int) -> str:
+    """Deduplicated chunks, best first, labelled by source, within `max_tokens`."""
+    parts = []
+    remaining = max_tokens
+    for c in dedupe_chunks(chunks):
+        block = f"[{c.get('source', 'unknown')}] {c['text']}"
+        cost = count_tokens(block) + 1  # separator
+        if cost <= remaining:
+            parts.append(block)
+            remaining -= cost
+        elif not parts and remaining > 0:
+            # Never return empty context just because the top chunk is large
+            parts.append(_truncate_to_tokens(block, remaining))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return "\n\n".join(parts)
+
+
+def compact_json(data) -> str:
+    """JSON without indentation or spaces; accepts dicts and pydantic models."""
+    if hasattr(data, "model_dump"):
+        data = data.model_dump()
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
@@ -1,4 +1,4 @@
-from fastapi import HTTPException, Depends, status, Header
+from fastapi import HTTPException, Depends, status, Header, Query
 from typing import Optional
 import os
 from app.utils import load_env_file
@@ -16,6 +16,14 @@ async def get_api_key(api_key: Optional[str] = Header(None)) -> str:
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or missing API key"
     )
+
+async def profiling_requested(profile: bool = Query(False), api_key: Optional[str] = Header(None)) -> bool:
+    """`?profile=1`; only honoured with a valid API key"""
+    if not profile:
+        return False
+    await get_api_key(api_key)
+    return True
+
 def get_keyvault_url() -> str:
     """Dependency to validate API key"""
     return "https://kv-capstone-team-four.vault.azure.net/"
@@ -1,57 +1,68 @@
 # graph.py
 from typing import TypedDict, Annotated
 from langgraph.graph import StateGraph, END
-import operator
 from app.agents.market_analyst import run_market_analyst
 from app.agents.geo_resolver import resolve_geo
+from app.agents.market_prewarm import signal_key, signal_store, request_history, MARKET_SIGNAL_MAX_AGE_S
 from app.agents.layout_strategist import strategist_subgraph
 from app.agents.draftsman import draftsman_node
 from app.utils import load_env_file
+from app.clients import run_blocking
+from app.resilience import deadline_after
+from app.profiling import instrumented_node
+from app.structured_logging import log_event, setup_logging
+from app.state import bounded_messages
+from app.schemas.layout import LayoutPlan
 import os
-import json
-from datetime import datetime
+import logging
 from langfuse import observe, get_client
 from langfuse.langchain import CallbackHandler as LBHandler
 
 # === Load Env ===
 load_env_file()
 
+logger = logging.getLogger("app.agents")
+
 langfuse = get_client()
- 
+
 # Verify connection
 if langfuse.auth_check():
-    print("Langfuse client is authenticated and ready!")
+    logger.info("Langfuse client is authenticated and ready")
 else:
-    print("Authentication failed. Please check your credentials and host.")
+    logger.warning("Langfuse authentication failed; check the credentials and host")
 
 langfuse_handler = LBHandler()
 
+# Last-known signals may be served this stale while Trends is failing
+DEGRADED_SIGNAL_MAX_AGE_S = float(os.getenv("DEGRADED_SIGNAL_MAX_AGE_S", str(7 * 24 * 3600)))
+
 # === Main State ===
 class MainState(TypedDict):
     store_name: str
     city: str
     keywords: list[str]
     entrance_side: str
-    messages: Annotated[list, operator.add]
+    messages: Annotated[list, bounded_messages]
     market_trends: dict
-    final_plan: dict
+    final_plan: LayoutPlan
     diagram_path: str
+    # Names the run's artifacts (diagram file); the API sets it to the request's layout id
+    layout_id: str
+    # Hash of the request inputs (app.checkpoints); a resumed layout_id must match it
+    request_fingerprint: str
     review_log: dict
+    # Optional: re-plan incrementally from a previous plan and its signals
+    previous_plan: dict
+    previous_trends: dict
 
-# === Helper: Pretty Print with Timestamp ===
-def log_agent(name: str, message: str, data: dict = None):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    print(f"\n[{timestamp}] AGENT: {name.upper()}")
-    print(f"{'─' * 60}")
-    print(message)
-    if data:
-        print("Payload:")
-        print(json.dumps(data, indent=2)[:500] + ("..." if len(json.dumps(data, indent=2)) > 500 else ""))
-    print(f"{'─' * 60}\n")
+# === Helper: Agent Log Line ===
+def log_agent(name: str, message: str, data: dict = None, verbose: bool = False, level: int = logging.INFO):
+    """Structured, queued log record; `data` is serialized off the request path, if at all."""
+    log_event(logger, message, data, agent=name, verbose=verbose, level=level)
 
 # === Nodes ===
 
-def market_analyst_node(state: MainState):
+def _market_start(state: MainState) -> dict:
     log_agent("market_analyst", f"Analyzing trends for {state['city']}...", {
         "keywords": state["keywords"],
         "entrance": state["entrance_side"]
@@ -59,14 +70,39 @@ def market_analyst_node(state: MainState):
 
     geo = resolve_geo(state["city"])
     log_agent("market_analyst", "Geo resolved", geo)
+    return geo
+
+def _signal_key(state: MainState, geo: dict):
+    """Store key for this (geo, keywords) pair, recording the hit for the scheduler."""
+    key = signal_key(state["keywords"], geo["geo"], geo["sub_geo"])
+    request_history.record(key, state["keywords"])
+    return key
+
+def _served(cached, geo: dict):
+    if cached is not None:
+        log_agent("market_analyst", "Serving pre-warmed market signals", {"sub_geo": geo["sub_geo"]})
+    return cached
+
+def _cached_signals(state: MainState, geo: dict):
+    """Pre-warmed / recent result for this (geo, keywords) pair."""
+    key = _signal_key(state, geo)
+    return key, _served(signal_store.get(key, MARKET_SIGNAL_MAX_AGE_S), geo)
 
-    result = run_market_analyst(
-        keywords=state["keywords"],
-        geo=geo["geo"],
-        sub_geo=geo["sub_geo"],
-        
-    )
+async def _acached_signals(state: MainState, geo: dict):
+    key = _signal_key(state, geo)
+    return key, _served(await signal_store.aget(key, MARKET_SIGNAL_MAX_AGE_S), geo)
 
+def _degraded_signals(state: MainState, geo: dict, key, error: Exception) -> dict:
+    """Trends failed or its breaker is open: last-known signals, else placeholder ones."""
+    stale = signal_store.get(key, DEGRADED_SIGNAL_MAX_AGE_S)
+    if stale is not None:
+        log_agent("market_analyst", "Trends unavailable; serving last-known signals", {"error": str(error)}, level=logging.WARNING)
+        return {**stale, "degraded": "cached_trends"}
+    log_agent("market_analyst", "Trends unavailable; using placeholder signals", {"error": str(error)}, level=logging.WARNING)
+    result = run_market_analyst(keywords=state["keywords"], geo=geo["geo"], sub_geo=geo["sub_geo"], mock=True)
+    return {**result, "degraded": "mock_trends"}
+
+def _market_done(result: dict) -> dict:
     trends_count = len(result["payload"]["signals"]["interest_over_time_national"])
     log_agent("market_analyst", f"Analysis complete", {
         "top_trends": result["payload"]["signals"]["interest_over_time_national"][:3],
@@ -78,7 +114,43 @@ def market_analyst_node(state: MainState):
         "messages": [f"Market analysis done. {trends_count} trends found."]
     }
 
-def strategist_node(state: MainState):
+def market_analyst_node(state: MainState):
+    geo = _market_start(state)
+    key, result = _cached_signals(state, geo)
+    if result is None:
+        try:
+            result = run_market_analyst(
+                keywords=state["keywords"],
+                geo=geo["geo"],
+                sub_geo=geo["sub_geo"],
+                
+            )
+        except Exception as e:
+            result = _degraded_signals(state, geo, key, e)
+        else:
+            signal_store.put(key, result, state["keywords"])
+    return _market_done(result)
+
+async def amarket_analyst_node(state: MainState):
+    """Async variant: pytrends is blocking, so it runs on the shared I/O executor."""
+    geo = _market_start(state)
+    key, result = await _acached_signals(state, geo)
+    if result is None:
+        try:
+            result = await run_blocking(
+                run_market_analyst,
+                keywords=state["keywords"],
+                geo=geo["geo"],
+                sub_geo=geo["sub_geo"],
+            )
+        except Exception as e:
+            # Rare path; its store read and placeholder build stay off the event loop too
+            result = await run_blocking(_degraded_signals, state, geo, key, e)
+        else:
+            await signal_store.aput(key, result, state["keywords"])
+    return _market_done(result)
+
+def _strategist_input(state: MainState) -> dict:
     trends = state["market_trends"]["payload"]["signals"]["interest_over_time_national"][:3]
     log_agent("layout_strategist", f"Designing layout for {state['city']}...", {
         "store": state["store_name"],
@@ -86,31 +158,46 @@ def strategist_node(state: MainState):
         "top_3_trends": [f"{t['keyword']} ({t['score']})" for t in trends]
     })
 
-    result = strategist_subgraph.invoke({
+    return {
         "store_name": state["store_name"],
         "city": state["city"],
         "trends": state["market_trends"]["payload"]["signals"],
         "entrance_side": state["entrance_side"],
         "messages": [],
-        "iteration": 0
-    })
+        "iteration": 0,
+        "deadline": deadline_after(),
+        "previous_plan": state.get("previous_plan"),
+        "previous_trends": state.get("previous_trends")
+    }
 
+def _strategist_done(result: dict) -> dict:
     plan = result["final_plan"]
     review = result.get("review", {})
     log_agent("layout_strategist", "Layout designed", {
         "zones": len(plan.zones),
+        "floors": len(plan.levels),
         "best_practice_score": plan.best_practice_score,
         "is_compliant": review.get("is_compliant", False),
+    })
+    log_agent("layout_strategist", "Review", {
         "issues": review.get("issues", []),
         "suggestions": review.get("suggestions", [])
-    })
+    }, verbose=True)
 
     return {
-        "final_plan": plan.model_dump(),
+        "final_plan": plan,
         "review_log": review,
         "messages": result.get("messages", [])
     }
 
+def strategist_node(state: MainState):
+    result = strategist_subgraph.invoke(_strategist_input(state))
+    return _strategist_done(result)
+
+async def astrategist_node(state: MainState):
+    result = await strategist_subgraph.ainvoke(_strategist_input(state))
+    return _strategist_done(result)
+
 def draftsman_node_wrapper(state: MainState):
     log_agent("draftsman", f"Generating diagram for {state['city']}...")
     output = draftsman_node(state)
@@ -119,25 +206,38 @@ def draftsman_node_wrapper(state: MainState):
     })
     return output
 
-def create_graph():
+async def adraftsman_node_wrapper(state: MainState):
+    """Async variant: rendering is CPU/disk bound, keep it off the event loop."""
+    log_agent("draftsman", f"Generating diagram for {state['city']}...")
+    output = await run_blocking(draftsman_node, state)
+    log_agent("draftsman", "Diagram saved", {
+        "path": output["diagram_path"]
+    })
+    return output
+
+def create_graph(checkpointer=None):
+    """Compiled main graph; with a `checkpointer` state is saved after every node (see app.checkpoints)."""
     # === Build Graph ===
     graph = StateGraph(MainState)
 
-    graph.add_node("market", market_analyst_node)
-    graph.add_node("strategist", strategist_node)
-    graph.add_node("draftsman", draftsman_node_wrapper)
+    # Sync + async implementations: `invoke` for scripts, `ainvoke` for the API;
+    # nodes also record memory / timings for tracked or profiled requests (app.profiling)
+    graph.add_node("market", instrumented_node("market", market_analyst_node, amarket_analyst_node))
+    graph.add_node("strategist", instrumented_node("strategist", strategist_node, astrategist_node))
+    graph.add_node("draftsman", instrumented_node("draftsman", draftsman_node_wrapper, adraftsman_node_wrapper))
 
     graph.set_entry_point("market")
     graph.add_edge("market", "strategist")
     graph.add_edge("strategist", "draftsman")
     graph.add_edge("draftsman", END)
 
-    return graph.compile().with_config({"callbacks":[langfuse_handler]})
+    return graph.compile(checkpointer=checkpointer).with_config({"callbacks":[langfuse_handler]})
 
 
 
 # === Demo ===
 if __name__ == '__main__':
+    setup_logging(fmt="text")
     print("STARTING FULL RETAIL LAYOUT COPILOT")
     print("=" * 80)
     app = create_graph()
@@ -150,10 +250,10 @@ if __name__ == '__main__':
     })
 
     print("\n" + "FINAL OUTPUT SUMMARY".center(70, "="))
-    print(f"Store: {result['final_plan']['store_name']}")
-    print(f"City: {result['final_plan']['city']}")
-    print(f"Best Practice Score: {result['final_plan']['best_practice_score']:.1f}/10")
-    print(f"Compliance Notes: {len(result['final_plan']['compliance_notes'])}")
+    print(f"Store: {result['final_plan'].store_name}")
+    print(f"City: {result['final_plan'].city}")
+    print(f"Best Practice Score: {result['final_plan'].best_practice_score:.1f}/10")
+    print(f"Compliance Notes: {len(result['final_plan'].compliance_notes)}")
     print(f"Diagram: {result['diagram_path']}")
 
     print("\nTop 3 Trending Products:")
@@ -0,0 +1,311 @@
+# app/llm_cache.py
+"""
+Response cache for planner / reviewer completions.
+
+Lookups go in two steps:
+    1. exact match on the SHA-256 of the rendered prompt;
+    2. optionally, cosine similarity between the prompt's embedding and the
+       embeddings of cached prompts in the same scope, accepted above a
+       threshold (prompts for the same city/trend profile differ only in a
+       few numbers).
+
+Entries are scoped by (model deployment, prompt name, prompt hash, site)
+so a prompt edit or a model swap never serves stale completions, and a
+semantic hit never crosses cities or entrance sides: two plans for different
+cities can render to near-identical prompts. Each entry has a
+TTL; the cache is capped in size and evicts least-recently-used entries.
+
+Completions live on the shared cache backend (`app.cache`, namespace
+"llm"), so with a SQLite or Redis backend every worker sees every other
+worker's completions. The embeddings for semantic lookup stay in-process:
+each worker indexes the prompts it has seen and reads the matching
+completion from the backend.
+
+The cache is an optimisation, never a dependency: a backend or embedding
+error during a lookup counts as a miss, and one during a store is dropped,
+so an outage there can't fail (or degrade) the LLM call it sits in front of.
+
+Configuration (environment variables):
+    LLM_CACHE_ENABLED       "1"/"0" (default 1)
+    LLM_CACHE_TTL_S         entry lifetime in seconds (default 3600)
+    LLM_CACHE_MAX_ENTRIES   size cap before LRU eviction (default 1024)
+    LLM_CACHE_SIMILARITY    cosine threshold for semantic hits, e.g. 0.97;
+                            unset or 0 disables the embedding step
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.cache import CacheBackend, NamespaceCache, make_key
+from app.prompt_loader import PromptManager
+
+logger = logging.getLogger(__name__)
+
+Scope = Tuple[str, ...]
+# Embeddings kept between a semantic miss and the put that follows it
+MISSED_VECTORS = 64
+
+
+@dataclass
+class _Vector:
+    embedding: np.ndarray
+    expires_at: float
+    scope: Scope
+
+
+@dataclass
+class CacheStats:
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Exact (shared backend) + semantic (per-process index) completion cache with TTL and LRU eviction."""
+
+    def __init__(
+        self,
+        ttl_s: float = 3600,
+        max_entries: int = 1024,
+        similarity_threshold: float = 0.0,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        aembed_fn: Optional[Callable] = None,
+        backend: Optional[CacheBackend] = None,
+    ):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._embed_fn = embed_fn
+        self._aembed_fn = aembed_fn
+        self._store = NamespaceCache("llm", ttl_s, max_entries, backend)
+        self._vectors: "OrderedDict[str, _Vector]" = OrderedDict()
+        # Embeddings of prompts that just missed, so the put after the LLM call doesn't embed again
+        self._missed: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity_threshold > 0 and self._embed_fn is not None
+
+    @staticmethod
+    def _key(prompt: str, scope: Scope) -> str:
+        return make_key(*scope, prompt_hash(prompt))
+
+    # === Lookup ===
+    def _exact_hit(self, hit: Optional[str]) -> Optional[str]:
+        if hit is not None:
+            with self._lock:
+                self.stats.exact_hits += 1
+        return hit
+
+    def _nearest(self, scope: Scope, vector: np.ndarray) -> Optional[str]:
+        """Key of the most similar cached prompt in the scope, if above the threshold."""
+        now = time.time()
+        with self._lock:
+            keys, matrix = [], []
+            for key, entry in self._vectors.items():
+                if entry.scope == scope and entry.expires_at >= now:
+                    keys.append(key)
+                    matrix.append(entry.embedding)
+        if not keys:
+            return None
+        scores = np.stack(matrix) @ vector
+        best = int(np.argmax(scores))
+        return keys[best] if scores[best] >= self.similarity_threshold else None
+
+    def _similar_hit(self, key: str, hit: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if hit is None:
+                # Evicted from the backend (possibly by another worker)
+                self._vectors.pop(key, None)
+                return None
+            if key in self._vectors:
+                self._vectors.move_to_end(key)
+            self.stats.semantic_hits += 1
+        return hit
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _miss(self, key: Optional[str] = None, vector: Optional[np.ndarray] = None) -> None:
+        with self._lock:
+            self.stats.misses += 1
+            if vector is not None:
+                self._missed[key] = vector
+                while len(self._missed) > MISSED_VECTORS:
+                    self._missed.popitem(last=False)
+
+    def _missed_vector(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._missed.pop(key, None)
+
+    def _error(self, op: str, error: Exception) -> None:
+        with self._lock:
+            self.stats.errors += 1
+        logger.warning(f"LLM cache {op} failed, ignoring: {error}")
+
+    def get(self, prompt: str, scope: Scope) -> Optional[str]:
+        """Cached completion, or None on a miss or a backend / embedding error."""
+        try:
+            return self._get(prompt, scope)
+        except Exception as e:
+            self._error("lookup", e)
+            return None
+
+    async def aget(self, prompt: str, scope: Scope) -> Optional[str]:
+        try:
+            return await self._aget(prompt, scope)
+        except Exception as e:
+            self._error("lookup", e)
+            return None
+
+    def put(self, prompt: str, scope: Scope, response: str) -> None:
+        """Store a completion; errors are logged and dropped."""
+        try:
+            self._put(prompt, scope, response)
+        except Exception as e:
+            self._error("store", e)
+
+    async def aput(self, prompt: str, scope: Scope, response: str) -> None:
+        try:
+            await self._aput(prompt, scope, response)
+        except Exception as e:
+            self._error("store", e)
+
+    def _get(self, prompt: str, scope: Scope) -> Optional[str]:
+        key = self._key(prompt, scope)
+        hit = self._exact_hit(self._store.get(key))
+        if hit is not None or not self.semantic:
+            if hit is None:
+                self._miss()
+            return hit
+        vector = self._normalize(self._embed_fn(prompt))
+        similar = self._nearest(scope, vector)
+        hit = None if similar is None else self._similar_hit(similar, self._store.get(similar))
+        if hit is None:
+            self._miss(key, vector)
+        return hit
+
+    async def _aget(self, prompt: str, scope: Scope) -> Optional[str]:
+        key = self._key(prompt, scope)
+        hit = self._exact_hit(await self._store.aget(key))
+        if hit is not None or not self.semantic:
+            if hit is None:
+                self._miss()
+            return hit
+        embedding = await self._aembed_fn(prompt) if self._aembed_fn else self._embed_fn(prompt)
+        vector = self._normalize(embedding)
+        similar = self._nearest(scope, vector)
+        hit = None if similar is None else self._similar_hit(similar, await self._store.aget(similar))
+        if hit is None:
+            self._miss(key, vector)
+        return hit
+
+    # === Store ===
+    def _index(self, key: str, scope: Scope, embedding) -> None:
+        if embedding is None:
+            return
+        with self._lock:
+            self._vectors[key] = _Vector(self._normalize(embedding), time.time() + self.ttl_s, scope)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def _put(self, prompt: str, scope: Scope, response: str) -> None:
+        embedding = None
+        if self.semantic:
+            embedding = self._missed_vector(self._key(prompt, scope))
+            if embedding is None:
+                embedding = self._embed_fn(prompt)
+        key = self._key(prompt, scope)
+        self._store.set(key, response)
+        self._index(key, scope, embedding)
+
+    async def _aput(self, prompt: str, scope: Scope, response: str) -> None:
+        embedding = None
+        if self.semantic:
+            embedding = self._missed_vector(self._key(prompt, scope))
+            if embedding is None:
+                embedding = await self._aembed_fn(prompt) if self._aembed_fn else self._embed_fn(prompt)
+        key = self._key(prompt, scope)
+        await self._store.aset(key, response)
+        self._index(key, scope, embedding)
+
+    def clear(self) -> None:
+        self._store.clear()
+        with self._lock:
+            self._vectors.clear()
+            self._missed.clear()
+
+    def status(self) -> Dict:
+        try:
+            backend = self._store.stats()
+        except Exception as e:
+            backend = {"error": str(e)}
+        with self._lock:
+            indexed = len(self._vectors)
+        return {**self.stats.as_dict(), "semantic": self.semantic, "indexed_prompts": indexed, "backend": backend}
+
+
+def prompt_scope(prompt_name: str, *site: str, variant: str = "default") -> Scope:
+    """Cache scope for a PromptManager prompt on the configured deployment.
+
+    Keyed on the content hash rather than the declared version, so an edited
+    prompt whose version wasn't bumped still misses old entries. `site`
+    (city, entrance side) keeps semantic hits within one store.
+    """
+    return (
+        os.getenv("AZURE_OPENAI_DEPLOYMENT", ""),
+        f"{prompt_name}:{variant}",
+        PromptManager.hash(prompt_name, variant),
+        "|".join((part or "").strip().casefold() for part in site),
+    )
+
+
+_active: Optional[LLMResponseCache] = None
+
+
+def llm_cache_status() -> Dict:
+    """Hit / miss / error counts of the cache `build_llm_cache` built, for /diagnostics."""
+    return _active.status() if _active is not None else {"enabled": False}
+
+
+def build_llm_cache() -> Optional[LLMResponseCache]:
+    """Cache configured from the environment, or None when disabled."""
+    global _active
+    if os.getenv("LLM_CACHE_ENABLED", "1") in ("0", "false", "False"):
+        return None
+    threshold = float(os.getenv("LLM_CACHE_SIMILARITY", "0") or 0)
+    embed_fn = aembed_fn = None
+    if threshold > 0:
+        from app.tools.embedding_batcher import get_embedding_batcher
+
+        embed_fn = lambda text: get_embedding_batcher().embed_query(text)
+        aembed_fn = lambda text: get_embedding_batcher().aembed_query(text)
+    _active = LLMResponseCache(
+        ttl_s=float(os.getenv("LLM_CACHE_TTL_S", "3600")),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+        similarity_threshold=threshold,
+        embed_fn=embed_fn,
+        aembed_fn=aembed_fn,
+    )
+    return _active
@@ -1,6 +1,8 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
+from contextlib import nullcontext
+import asyncio
 import uuid
 import time
 import logging
@@ -8,14 +10,30 @@ import os
 import base64
 from app.graph import create_graph
 from app.utils import load_env_file
+from app.clients import aclose_clients
+from app.rate_limiter import llm_priority, limiter_status, PRIORITY_NAMES
+from app.state import as_plan
+from app.checkpoints import (
+    open_checkpointer, close_checkpointer, resume_point, thread_config, request_fingerprint, CheckpointMismatch,
+    layout_lease, prune_periodically, LayoutBusy,
+)
+from app.agents.market_prewarm import PrewarmScheduler, prewarm_enabled
+from app.prompt_loader import PromptManager, hot_reload_enabled
+from app.structured_logging import setup_logging, shutdown_logging, correlation, logging_status
+from app.profiling import atrack_request, memory_report, start_tracing, profile_request, profile_path, ProfilerBusy
+from app.resilience import breakers_status
+from app.cache import cache_status
+from app.llm_cache import llm_cache_status
+from app.tools.embedding_batcher import embedding_status
 from .models import LayoutRequest
-from .dependencies import get_keyvault_url
+from .dependencies import get_keyvault_url, get_api_key, profiling_requested
 from azure.identity import DefaultAzureCredential
 from azure.keyvault.secrets import SecretClient
 
 # === Setup ===
 load_env_file()
-logging.basicConfig(level=logging.INFO)
+# Queued JSON logs (app.structured_logging); records carry the request's layout_id
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Key Vault
@@ -42,45 +60,164 @@ load_secrets()
 
 # === App ===
 app = FastAPI()
+# Compiled once per worker; every request shares it via `ainvoke`.
+# Recompiled with the SQLite checkpointer at startup (needs the event loop).
+graph = create_graph()
+checkpointer = None
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
 
-# === Endpoint: Return Base64 Diagram Only ===
-@app.post("/generate_layout")
-async def generate_diagram(request: LayoutRequest):
-    layout_id = str(uuid.uuid4())
-    start = time.time()
-    logger.info(f"Generating diagram (base64) | ID: {layout_id}")
+prewarm_scheduler = PrewarmScheduler()
+
+@app.on_event("startup")
+async def start_prewarm():
+    # Refresh market signals for the hottest city/keyword pairs off-peak
+    if prewarm_enabled():
+        prewarm_scheduler.start()
+
+@app.on_event("startup")
+async def watch_prompts():
+    # Swap in an edited / redeployed prompt bundle without restarting workers
+    if hot_reload_enabled():
+        PromptManager.start_watcher()
 
-    try:
-        graph = create_graph()
+@app.on_event("startup")
+async def start_memory_tracing():
+    # No-op unless MEMORY_PROFILING=1; tracing from startup attributes import-time allocations too
+    start_tracing()
 
-        result = graph.invoke({
+checkpoint_pruner = None
+
+@app.on_event("startup")
+async def open_graph_checkpoints():
+    global graph, checkpointer, checkpoint_pruner
+    checkpointer = await open_checkpointer()
+    if checkpointer is not None:
+        graph = create_graph(checkpointer)
+        # Idle layout threads are deleted (CHECKPOINT_TTL_S / CHECKPOINT_MAX_THREADS)
+        checkpoint_pruner = asyncio.create_task(prune_periodically(checkpointer))
+
+@app.on_event("shutdown")
+async def shutdown_clients():
+    await prewarm_scheduler.stop()
+    PromptManager.stop_watcher()
+    # Drain the shared keep-alive pools (app.clients)
+    await aclose_clients()
+    if checkpoint_pruner is not None:
+        checkpoint_pruner.cancel()
+    await close_checkpointer(checkpointer)
+    shutdown_logging()
+
+async def _run_graph(request: LayoutRequest, layout_id: str, config: dict) -> dict:
+    # One run per layout_id at a time, across workers: a concurrent retry waits, then resumes or reads the result
+    async with layout_lease(checkpointer, layout_id):
+        return await _run_graph_leased(request, layout_id, config)
+
+async def _run_graph_leased(request: LayoutRequest, layout_id: str, config: dict) -> dict:
+    keywords = request.keywords or ["electronics"]
+    fingerprint = request_fingerprint(request.city, keywords, request.previous_plan, request.previous_trends)
+    pending = await resume_point(graph, layout_id, fingerprint) if checkpointer is not None else None
+    if pending is None:
+        return await graph.ainvoke({
             "store_name": "Blue Retail Store",
             "city": request.city,
-            "keywords": request.keywords or ["electronics"],
+            "keywords": keywords,
             "entrance_side": "south",
             "messages": [],
-        })
+            "layout_id": layout_id,
+            "request_fingerprint": fingerprint,
+            "previous_plan": request.previous_plan,
+            "previous_trends": request.previous_trends,
+        }, config)
+    if pending:
+        # Failed earlier: continue from the last completed node
+        logger.info(f"Resuming {layout_id} at {', '.join(pending)}")
+        return await graph.ainvoke(None, config)
+    # Already finished: serve the checkpointed result, redrawing a diagram that's since been removed
+    values = (await graph.aget_state(config)).values
+    if not os.path.exists(values.get("diagram_path") or ""):
+        logger.info(f"Diagram for {layout_id} is gone; redrawing it from the checkpointed plan")
+        await graph.aupdate_state(config, {"diagram_path": None}, as_node="strategist")
+        return await graph.ainvoke(None, config)
+    return values
+
+# === Endpoint: Azure OpenAI quota queue (depth, wait times, 429s) ===
+@app.get("/llm_rate_limits")
+async def llm_rate_limits():
+    return limiter_status()
 
-        diagram_path = result.get("diagram_path")
-        if not diagram_path or not os.path.exists(diagram_path):
-            raise HTTPException(status_code=500, detail="Diagram file not generated")
+# === Endpoint: Diagnostics (memory, breakers, limiters, caches; admin key) ===
+@app.get("/diagnostics")
+async def diagnostics(api_key: str = Depends(get_api_key)):
+    return {
+        "memory": memory_report(),
+        "breakers": breakers_status(),
+        "llm_rate_limits": limiter_status(),
+        "caches": cache_status(),
+        "llm_cache": llm_cache_status(),
+        "embeddings": embedding_status(),
+        "logging": logging_status(),
+    }
 
-        # Read and encode to base64
-        with open(diagram_path, "rb") as img_file:
-            base64_str = base64.b64encode(img_file.read()).decode("utf-8")
+# === Endpoint: Stored request profiles (speedscope JSON; admin key) ===
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, api_key: str = Depends(get_api_key)):
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
 
-        logger.info(f"Diagram encoded to base64 in {time.time() - start:.2f}s")
+# === Endpoint: Return Base64 Diagram Only ===
+@app.post("/generate_layout")
+async def generate_diagram(request: LayoutRequest, profile: bool = Depends(profiling_requested)):
+    layout_id = request.layout_id or str(uuid.uuid4())
+    config = thread_config(layout_id)
+    start = time.time()
+
+    # Every record logged for this request (graph nodes included) carries its layout_id
+    with correlation(layout_id):
+        logger.info(f"Generating diagram (base64){' (profiled)' if profile else ''}")
+
+        try:
+            profiler = profile_request(layout_id) if profile else nullcontext()
+            with llm_priority(PRIORITY_NAMES[request.priority]):
+                # Memory snapshots (MEMORY_PROFILING) run on the I/O executor, not the event loop
+                async with atrack_request(layout_id):
+                    with profiler as profiled:
+                        result = await _run_graph(request, layout_id, config)
+
+            diagram_path = result.get("diagram_path")
+            if not diagram_path or not os.path.exists(diagram_path):
+                raise HTTPException(status_code=500, detail="Diagram file not generated")
+
+            # Read and encode to base64
+            with open(diagram_path, "rb") as img_file:
+                base64_str = base64.b64encode(img_file.read()).decode("utf-8")
 
-        # Return ONLY base64
+            logger.info(f"Diagram encoded to base64 in {time.time() - start:.2f}s")
 
-        return JSONResponse({
-            "diagram_base64": base64_str
-        })
+            # Base64 diagram (plus the plan / signals on request and the timing summary of a profiled run)
+            body = {"diagram_base64": base64_str}
+            headers = {"X-Layout-Id": layout_id}
+            if request.include_plan:
+                # What a later request needs for an incremental re-plan
+                body["layout_plan"] = as_plan(result["final_plan"]).model_dump(mode="json")
+                body["market_signals"] = result["market_trends"]["payload"]["signals"]
+            if profiled is not None:
+                body["profile"] = profiled.summary()
+                headers["X-Profile-Id"] = body["profile"]["profile_id"]
 
-    except Exception as e:
-        logger.error(f"Diagram generation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to generate diagram")
+            return JSONResponse(body, headers=headers)
+
+        except (ProfilerBusy, CheckpointMismatch, LayoutBusy) as e:
+            raise HTTPException(status_code=409, detail=str(e), headers={"X-Layout-Id": layout_id})
+        except Exception as e:
+            logger.error(f"Diagram generation failed: {str(e)}")
+            # The id lets the client resume instead of starting over
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to generate diagram (layout_id={layout_id})",
+                headers={"X-Layout-Id": layout_id},
+            )
     
 
 if __name__ == "__main__":
@@ -1,11 +1,29 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 class LayoutRequest(BaseModel):
     """Request model for retail layout generation"""
     city: str  # e.g., "Surat"
     keywords: Optional[List[str]] = None  # e.g., ["smartphones", "laptops"]
+    # Incremental re-plan: previous LayoutPlan and the market signals it was built from
+    previous_plan: Optional[Dict[str, Any]] = None
+    previous_trends: Optional[Dict[str, Any]] = None
+    # Retry a failed run with its layout_id to resume from the last completed node.
+    # It names the diagram file, so only letters, digits and dashes.
+    layout_id: Optional[str] = Field(
+        None,
+        pattern=r"^[A-Za-z0-9-]{1,64}$",
+        description=(
+            "Re-post a failed request with the X-Layout-Id it returned to resume from the last completed "
+            "step (market, strategist, draftsman). A failure inside the strategist re-runs the whole strategist. "
+            "The rest of the request must match the original, or the API answers 409."
+        ),
+    )
+    # Also return the plan and market signals, to send back as previous_plan / previous_trends
+    include_plan: bool = False
+    # Batch / pre-generation jobs queue behind interactive requests for the LLM quota
+    priority: Literal["interactive", "batch"] = "interactive"
 
 class LayoutResponse(BaseModel):
     """Response model for layout generation"""
@@ -0,0 +1,461 @@
+# app/profiling.py
+"""
+Opt-in per-request and per-node memory and CPU instrumentation.
+
+With MEMORY_PROFILING=1:
+
+    - `tracemalloc` traces allocations for the life of the worker;
+    - every graph node built with `instrumented_node` records its RSS delta,
+      traced-memory delta and traced peak into the current request;
+    - `track_request(layout_id)` snapshots traced memory at the start and,
+      after a `gc.collect()`, at the end of a request; the allocation sites
+      whose memory grew across the request are reported as survivors, and
+      those above MEMORY_LEAK_THRESHOLD_KB are flagged as leak suspects.
+      `atrack_request` is the same for async handlers, with the collection,
+      snapshots and diff run on the I/O executor instead of the event loop;
+      only a MEMORY_SAMPLE_RATE fraction of requests is tracked;
+    - the last MEMORY_HISTORY request reports and the current top
+      allocators are returned by `memory_report()` (the diagnostics
+      endpoint).
+
+tracemalloc is process-wide, so deltas are exact with one request in flight
+and upper bounds under concurrency (other requests' allocations count too).
+Peaks are the opposite: `reset_peak()` is process-wide as well, so a node
+starting while another is running resets the other's peak, and under
+concurrency a node's traced peak is a lower bound.
+Tracing costs CPU and memory itself; leave it off unless investigating.
+
+`profile_request(layout_id)` (`POST /generate_layout?profile=1`, admin key)
+runs one request under a stack sampler: a daemon thread records every
+thread's Python stack each PROFILE_INTERVAL_MS, and the same node hook
+times each graph node in wall and CPU (`process_time`) seconds, so a slow
+node splits into compute vs waiting on the network. The result is a
+speedscope file (https://www.speedscope.app) under PROFILE_DIR, named by a
+generated profile id, with one sampled profile per thread plus the node
+timeline. Samples and CPU time are process-wide as well, so only one
+request is profiled at a time, and a node's `cpu_s` also counts CPU spent by
+unprofiled requests running alongside it.
+
+Configuration (environment variables):
+    MEMORY_PROFILING            "1"/"0" (default 0)
+    MEMORY_TRACE_FRAMES         frames kept per allocation traceback (default 10)
+    MEMORY_TOP_N                allocation sites reported (default 15)
+    MEMORY_LEAK_THRESHOLD_KB    growth across a request flagged as a suspect (default 256)
+    MEMORY_HISTORY              request reports kept (default 50)
+    MEMORY_SAMPLE_RATE          fraction of requests tracked by atrack_request (default 1)
+    PROFILE_INTERVAL_MS         stack sampling interval (default 5)
+    PROFILE_MAX_DEPTH           frames kept per sampled stack (default 128)
+    PROFILE_DIR                 speedscope files (default artifacts/profiles)
+"""
+import contextvars
+import gc
+import json
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.runnables import RunnableLambda
+
+from app.clients import run_blocking
+
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "0") in ("1", "true", "True")
+TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "10"))
+TOP_N = int(os.getenv("MEMORY_TOP_N", "15"))
+LEAK_THRESHOLD_B = int(os.getenv("MEMORY_LEAK_THRESHOLD_KB", "256")) * 1024
+HISTORY = int(os.getenv("MEMORY_HISTORY", "50"))
+SAMPLE_RATE = float(os.getenv("MEMORY_SAMPLE_RATE", "1"))
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "128"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "artifacts/profiles"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size; peak RSS where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _mb(n: int) -> float:
+    return round(n / 2**20, 3)
+
+
+# === Records ===
+@dataclass
+class NodeMemory:
+    node: str
+    seconds: float
+    rss_delta_mb: float
+    traced_delta_mb: float
+    traced_peak_mb: float
+
+
+@dataclass
+class RequestMemory:
+    request_id: str
+    started: float = field(default_factory=time.time)
+    rss_start: int = field(default_factory=rss_bytes)
+    nodes: List[NodeMemory] = field(default_factory=list)
+    summary: Dict = field(default_factory=dict)
+
+    def as_dict(self) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "started": self.started,
+            "nodes": [n.__dict__ for n in self.nodes],
+            **self.summary,
+        }
+
+
+_current: contextvars.ContextVar[Optional[RequestMemory]] = contextvars.ContextVar("request_memory", default=None)
+_history: deque = deque(maxlen=HISTORY)
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    """Traced allocations, minus tracemalloc's own and the import machinery's."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+
+
+def _site(stat) -> str:
+    frame = stat.traceback[0]
+    return f"{frame.filename}:{frame.lineno}"
+
+
+def _top(stats, key: str = "size") -> List[Dict]:
+    return [
+        {"site": _site(s), "size_mb": _mb(getattr(s, key)), "count": getattr(s, "count_diff" if key == "size_diff" else "count")}
+        for s in stats[:TOP_N]
+    ]
+
+
+# === Per request ===
+def start_tracing() -> None:
+    if MEMORY_PROFILING and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACE_FRAMES)
+
+
+def _survivors(record: RequestMemory, before: tracemalloc.Snapshot) -> None:
+    """Collect, snapshot and diff against `before`; the slow part of a tracked request."""
+    gc.collect()
+    after = _snapshot()
+    grown = [s for s in after.compare_to(before, "lineno") if s.size_diff > 0]
+    record.summary = {
+        "seconds": round(time.time() - record.started, 3),
+        "rss_delta_mb": _mb(rss_bytes() - record.rss_start),
+        "survived_mb": _mb(sum(s.size_diff for s in grown)),
+        "survivors": _top(grown, "size_diff"),
+        "leak_suspects": _top([s for s in grown if s.size_diff >= LEAK_THRESHOLD_B], "size_diff"),
+    }
+    _history.append(record)
+
+
+@contextmanager
+def track_request(request_id: str):
+    """Record per-node memory for this request and report what survived it."""
+    if not MEMORY_PROFILING:
+        yield None
+        return
+    start_tracing()
+    record = RequestMemory(request_id)
+    token = _current.set(record)
+    before = _snapshot()
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+        _survivors(record, before)
+
+
+@asynccontextmanager
+async def atrack_request(request_id: str):
+    """`track_request` for async handlers: sampled, with snapshots and diffing off the event loop."""
+    if not MEMORY_PROFILING or random.random() >= SAMPLE_RATE:
+        yield None
+        return
+    start_tracing()
+    record = RequestMemory(request_id)
+    token = _current.set(record)
+    before = await run_blocking(_snapshot)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+        await run_blocking(_survivors, record, before)
+
+
+# === Per node ===
+# Peaks of the nodes measuring around the current one: an inner node (a
+# strategist subgraph step) resets tracemalloc's peak, so it hands its own
+# peak up to them when it finishes. Nodes of *other* requests can't be
+# compensated this way: their `reset_peak()` discards this node's peak so far,
+# so with concurrent requests `traced_peak_mb` under-reports.
+_enclosing: contextvars.ContextVar[tuple] = contextvars.ContextVar("enclosing_nodes", default=())
+
+
+@contextmanager
+def _measure(name: str):
+    record, profile = _current.get(), _profile.get()
+    if record is None and profile is None:
+        yield
+        return
+    t0, cpu0, rss0 = time.perf_counter(), time.process_time(), rss_bytes()
+    if record is not None:
+        traced0, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        inner_peak = [traced0]
+        token = _enclosing.set(_enclosing.get() + (inner_peak,))
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+        if profile is not None:
+            profile.nodes.append(NodeTiming(name, t0 - profile.started, wall, cpu))
+        if record is not None:
+            _enclosing.reset(token)
+            traced1, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, inner_peak[0])
+            for outer in _enclosing.get():
+                outer[0] = max(outer[0], peak)
+            record.nodes.append(NodeMemory(
+                node=name,
+                seconds=round(wall, 3),
+                rss_delta_mb=_mb(rss_bytes() - rss0),
+                traced_delta_mb=_mb(traced1 - traced0),
+                traced_peak_mb=_mb(peak - traced0),
+            ))
+
+
+def instrumented_node(name: str, func, afunc=None) -> RunnableLambda:
+    """`RunnableLambda(func, afunc=afunc)` that records memory / timings for tracked requests."""
+    @wraps(func)
+    def sync(state):
+        with _measure(name):
+            return func(state)
+
+    async_impl = None
+    if afunc is not None:
+        @wraps(afunc)
+        async def async_impl(state):
+            with _measure(name):
+                return await afunc(state)
+
+    return RunnableLambda(sync, afunc=async_impl, name=name)
+
+
+# === Sampling profiler ===
+@dataclass
+class NodeTiming:
+    node: str
+    start_s: float
+    wall_s: float
+    cpu_s: float
+
+    def as_dict(self) -> Dict:
+        return {
+            "node": self.node,
+            "start_s": round(self.start_s, 4),
+            "wall_s": round(self.wall_s, 4),
+            "cpu_s": round(self.cpu_s, 4),
+            # Time not on a CPU: network, disk, locks, queueing for the limiter
+            "wait_s": round(max(0.0, self.wall_s - self.cpu_s), 4),
+        }
+
+
+def _is_idle(code) -> bool:
+    """A thread-pool worker parked on its queue between tasks."""
+    return code.co_name == "_worker" and code.co_filename.endswith(os.path.join("concurrent", "futures", "thread.py"))
+
+
+class StackSampler:
+    """
+    Daemon thread that records every other thread's Python stack each
+    `interval_s`. Pure Python (`sys._current_frames`): no native extension,
+    cost proportional to the sampling rate, not to the work sampled.
+    """
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.frames: Dict[Tuple[str, str, int], int] = {}
+        # thread id -> (thread name, [(stack of frame indexes root first, weight s)])
+        self.threads: Dict[int, Tuple[str, List[Tuple[Tuple[int, ...], float]]]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started = self.stopped = 0.0
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        if key not in self.frames:
+            self.frames[key] = len(self.frames)
+        return self.frames[key]
+
+    def _sample(self, weight: float) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident or _is_idle(frame.f_code):
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            entry = self.threads.setdefault(ident, (names.get(ident, str(ident)), []))
+            entry[1].append((tuple(reversed(stack)), weight))
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval_s):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    @property
+    def sample_count(self) -> int:
+        return sum(len(samples) for _, samples in self.threads.values())
+
+
+class ProfilerBusy(RuntimeError):
+    """Another request is being profiled; samples are process-wide, so one at a time."""
+
+
+@dataclass
+class RequestProfile:
+    request_id: str
+    sampler: StackSampler
+    started: float = field(default_factory=time.perf_counter)
+    nodes: List[NodeTiming] = field(default_factory=list)
+    path: Optional[Path] = None
+
+    def speedscope(self) -> Dict:
+        """speedscope.app file: one sampled profile per thread plus the graph-node timeline."""
+        sampler = self.sampler
+        frames = [{"name": name, "file": file, "line": line} for name, file, line in sampler.frames]
+        end = sampler.stopped - self.started
+        profiles = [{
+            "type": "sampled",
+            "name": f"{thread_name} (wall)",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": end,
+            "samples": [list(stack) for stack, _ in samples],
+            "weights": [weight for _, weight in samples],
+        } for thread_name, samples in sampler.threads.values()]
+
+        # Nodes as an evented profile, so their spans line up with the samples
+        node_frames: Dict[str, int] = {}
+        events = []
+        for timing in self.nodes:
+            if timing.node not in node_frames:
+                node_frames[timing.node] = len(frames)
+                frames.append({"name": f"node:{timing.node}"})
+            events.append((timing.start_s, "O", node_frames[timing.node]))
+            events.append((timing.start_s + timing.wall_s, "C", node_frames[timing.node]))
+        events.sort(key=lambda e: (e[0], e[1] == "O"))
+        profiles.append({
+            "type": "evented",
+            "name": "graph nodes",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": end,
+            "events": [{"type": kind, "frame": frame, "at": at} for at, kind, frame in events],
+        })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"layout {self.request_id}",
+            "exporter": "app.profiling",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "profile_id": self.path.name[: -len(".speedscope.json")] if self.path else None,
+            "wall_s": round(self.sampler.stopped - self.started, 4),
+            "samples": self.sampler.sample_count,
+            "interval_ms": self.sampler.interval_s * 1000,
+            "nodes": [t.as_dict() for t in self.nodes],
+            "cpu_note": "cpu_s is process-wide process_time(): it includes other requests running concurrently",
+        }
+
+
+_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar("request_profile", default=None)
+_profiling_lock = threading.Lock()
+
+
+@contextmanager
+def profile_request(request_id: str):
+    """
+    Sample every thread while the enclosed request runs and time its graph
+    nodes (wall vs CPU); the speedscope file is written to PROFILE_DIR on
+    exit. Raises ProfilerBusy if another request is being profiled.
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profiled request is already running")
+    try:
+        profile = RequestProfile(request_id, StackSampler())
+        token = _profile.set(profile)
+        profile.sampler.start()
+        try:
+            yield profile
+        finally:
+            profile.sampler.stop()
+            _profile.reset(token)
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            # Generated, never client-supplied: the id names a file
+            profile.path = PROFILE_DIR / f"{uuid.uuid4().hex}.speedscope.json"
+            profile.path.write_text(json.dumps(profile.speedscope()), encoding="utf-8")
+    finally:
+        _profiling_lock.release()
+
+
+def profile_path(profile_id: str) -> Optional[Path]:
+    """Stored speedscope file for an id returned by `profile_request`, if any."""
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        return None
+    path = PROFILE_DIR / f"{profile_id}.speedscope.json"
+    return path if path.exists() else None
+
+
+# === Report ===
+def memory_report() -> Dict:
+    """Recent per-request reports and the current top allocation sites."""
+    report = {"enabled": MEMORY_PROFILING, "rss_mb": _mb(rss_bytes())}
+    if not MEMORY_PROFILING or not tracemalloc.is_tracing():
+        return report
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = _snapshot()
+    report.update({
+        "traced_mb": _mb(current),
+        "traced_peak_mb": _mb(peak),
+        "top_allocators": _top(snapshot.statistics("lineno")),
+        "requests": [r.as_dict() for r in list(_history)[::-1]],
+    })
+    return report
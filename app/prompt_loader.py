@@ -1,29 +1,303 @@
 # prompt_loader.py
-import yaml, os
+"""
+Prompt templates, compiled once into an immutable bundle.
+
+Sources are the YAML files from the prompts repository
+(`prompts/<name>.yaml`, each with `variants.<variant>.prompt` and an optional
+`version`). `python -m app.prompt_loader build` compiles them into a JSON
+bundle shipped inside the package: per variant the text, declared version,
+content hash and placeholder names, with malformed templates rejected at
+build time. Workers load the bundle once; when there is none (a development
+checkout), or a source YAML is newer than it (edited since the last build),
+the YAML sources are compiled in memory instead. Both paths are
+resolved from this file, so startup no longer depends on the working
+directory.
+
+`PromptManager.hash` changes whenever a variant's text does, so downstream
+caches keyed on it (see `app.llm_cache.prompt_scope`) never serve entries
+produced by an older prompt.
+
+With PROMPTS_HOT_RELOAD=1 a daemon thread polls the bundle and the sources
+and, on a change, compiles a new bundle and swaps it in with one reference
+assignment: a reader sees the old bundle or the new one, never a mix. A
+YAML edit therefore takes effect without rebuilding the bundle. A bundle
+that fails to compile is logged and the current one kept.
+
+Configuration (environment variables):
+    PROMPTS_DIR                 YAML sources (default <repo>/prompts)
+    PROMPT_BUNDLE               compiled bundle (default app/prompts.bundle.json)
+    PROMPTS_HOT_RELOAD          "1"/"0" (default 0)
+    PROMPTS_RELOAD_INTERVAL_S   poll interval in seconds (default 2)
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import string
+import threading
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent
+PROMPTS_DIR = Path(os.getenv("PROMPTS_DIR", APP_DIR.parent / "prompts"))
+PROMPT_BUNDLE = Path(os.getenv("PROMPT_BUNDLE", APP_DIR / "prompts.bundle.json"))
+HOT_RELOAD = os.getenv("PROMPTS_HOT_RELOAD", "0") in ("1", "true", "True")
+RELOAD_INTERVAL_S = float(os.getenv("PROMPTS_RELOAD_INTERVAL_S", "2"))
+
+BUNDLE_FORMAT = 1
+_formatter = string.Formatter()
+
+
+# === Compiled templates ===
+@dataclass(frozen=True)
+class CompiledPrompt:
+    name: str
+    variant: str
+    text: str
+    version: str
+    hash: str
+    fields: Tuple[str, ...]
+    # (literal, field, format_spec, conversion) parsed once; None when a field
+    # uses attribute/index access and rendering falls back to str.format
+    segments: Optional[Tuple[Tuple[str, Optional[str], str, Optional[str]], ...]]
+
+    def render(self, **values) -> str:
+        missing = [f for f in self.fields if f not in values]
+        if missing:
+            raise KeyError(f"Prompt {self.name}:{self.variant} needs {', '.join(missing)}")
+        if self.segments is None:
+            return self.text.format(**values)
+        parts: List[str] = []
+        for literal, field, spec, conversion in self.segments:
+            parts.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            elif conversion == "s":
+                value = str(value)
+            parts.append(format(value, spec))
+        return "".join(parts)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def compile_prompt(name: str, variant: str, text: str, version: Optional[str] = None) -> CompiledPrompt:
+    """Parse a template once; raises ValueError for malformed braces."""
+    try:
+        parsed = list(_formatter.parse(text))
+    except ValueError as e:
+        raise ValueError(f"Prompt {name}:{variant} is not a valid template: {e}") from e
+    fields: List[str] = []
+    segments = []
+    simple = True
+    for literal, field, spec, conversion in parsed:
+        if field is not None:
+            if not field.isidentifier() or "{" in (spec or ""):
+                simple = False
+            root = field.split(".")[0].split("[")[0]
+            if root not in fields:
+                fields.append(root)
+        segments.append((literal, field, spec or "", conversion))
+    digest = content_hash(text)
+    return CompiledPrompt(
+        name=name,
+        variant=variant,
+        text=text,
+        version=str(version) if version is not None else digest,
+        hash=digest,
+        fields=tuple(fields),
+        segments=tuple(segments) if simple else None,
+    )
+
+
+# === Bundles ===
+@dataclass(frozen=True)
+class PromptBundle:
+    prompts: Dict[Tuple[str, str], CompiledPrompt]
+    source: str
+
+    @property
+    def digest(self) -> str:
+        """Hash over every variant; changes when any prompt does."""
+        return content_hash("".join(p.hash for _, p in sorted(self.prompts.items())))
+
+    def to_json(self) -> Dict:
+        names: Dict[str, Dict] = {}
+        for (name, variant), p in sorted(self.prompts.items()):
+            names.setdefault(name, {"variants": {}})["variants"][variant] = {
+                "prompt": p.text, "version": p.version, "hash": p.hash, "fields": list(p.fields),
+            }
+        return {"format": BUNDLE_FORMAT, "digest": self.digest, "prompts": names}
+
+
+def compile_sources(prompts_dir: Path = PROMPTS_DIR) -> PromptBundle:
+    """Compile every `<name>.yaml` under `prompts_dir`."""
+    prompts: Dict[Tuple[str, str], CompiledPrompt] = {}
+    for path in sorted(prompts_dir.glob("*.y*ml")):
+        with open(path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        for variant, spec in (data.get("variants") or {}).items():
+            version = spec.get("version", data.get("version"))
+            prompts[(path.stem, variant)] = compile_prompt(path.stem, variant, spec["prompt"], version)
+    if not prompts:
+        raise FileNotFoundError(f"No prompt YAML files in {prompts_dir}")
+    return PromptBundle(prompts, source=str(prompts_dir))
+
+
+def load_bundle(path: Path = PROMPT_BUNDLE) -> PromptBundle:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported prompt bundle format in {path}: {data.get('format')}")
+    prompts: Dict[Tuple[str, str], CompiledPrompt] = {}
+    for name, entry in data["prompts"].items():
+        for variant, spec in entry["variants"].items():
+            compiled = compile_prompt(name, variant, spec["prompt"], spec["version"])
+            if compiled.hash != spec["hash"]:
+                raise ValueError(f"Prompt {name}:{variant} does not match its hash in {path}")
+            prompts[(name, variant)] = compiled
+    return PromptBundle(prompts, source=str(path))
+
+
+def write_bundle(bundle: PromptBundle, path: Path = PROMPT_BUNDLE) -> None:
+    """Write via a temp file and rename, so a watching worker never reads half a bundle."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(bundle.to_json(), indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
 
-PROMPTS_DIR = Path(os.getcwd()) / "prompts"
+def _sources_newer(bundle_path: Path, prompts_dir: Path) -> bool:
+    """Whether any source YAML was modified after the bundle was written."""
+    if not prompts_dir.exists():
+        return False
+    built = bundle_path.stat().st_mtime_ns
+    return any(p.stat().st_mtime_ns > built for p in prompts_dir.glob("*.y*ml"))
 
+
+def _build(bundle_path: Path = PROMPT_BUNDLE, prompts_dir: Path = PROMPTS_DIR) -> PromptBundle:
+    """The bundle, unless it is missing or older than a source: then the sources, compiled."""
+    if bundle_path.exists() and not _sources_newer(bundle_path, prompts_dir):
+        return load_bundle(bundle_path)
+    return compile_sources(prompts_dir)
+
+
+def _signature() -> Tuple:
+    """What the watcher compares: size and mtime of the bundle and every source."""
+    paths = [PROMPT_BUNDLE, *sorted(PROMPTS_DIR.glob("*.y*ml"))] if PROMPTS_DIR.exists() else [PROMPT_BUNDLE]
+    return tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in paths if p.exists())
+
+
+# === Manager ===
 class PromptManager:
-    _cache: Dict[str, Dict] = {}
+    _bundle: Optional[PromptBundle] = None
+    _lock = threading.Lock()
+    _watcher: Optional[threading.Thread] = None
+    _stop = threading.Event()
 
     @classmethod
-    def load(cls, name: str) -> Dict[str, Any]:
-        if name in cls._cache:
-            return cls._cache[name]
+    def bundle(cls) -> PromptBundle:
+        bundle = cls._bundle
+        if bundle is None:
+            with cls._lock:
+                if cls._bundle is None:
+                    cls._bundle = _build()
+                    logger.info(f"Loaded {len(cls._bundle.prompts)} prompt(s) from {cls._bundle.source}")
+                bundle = cls._bundle
+        return bundle
 
-        file_path = PROMPTS_DIR / f"{name}.yaml"
-        if not file_path.exists():
-            raise FileNotFoundError(f"Prompt file not found: {file_path}")
+    @classmethod
+    def compiled(cls, name: str, variant: str = "default") -> CompiledPrompt:
+        bundle = cls.bundle()
+        try:
+            return bundle.prompts[(name, variant)]
+        except KeyError:
+            raise KeyError(f"Prompt {name}:{variant} not in {bundle.source}") from None
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            prompt_data = yaml.safe_load(f)
+    @classmethod
+    def get(cls, name: str, variant: str = "default") -> str:
+        return cls.compiled(name, variant).text
 
-        cls._cache[name] = prompt_data
-        return prompt_data
+    @classmethod
+    def render(cls, name: str, variant: str = "default", **values) -> str:
+        return cls.compiled(name, variant).render(**values)
 
     @classmethod
-    def get(cls, name: str, variant: str = "default") -> str:
-        data = cls.load(name)
-        return data["variants"][variant]["prompt"]
\ No newline at end of file
+    def version(cls, name: str, variant: str = "default") -> str:
+        """Declared `version` of a prompt variant, else its content hash."""
+        return cls.compiled(name, variant).version
+
+    @classmethod
+    def hash(cls, name: str, variant: str = "default") -> str:
+        """Content hash of a variant's text; use it to key caches of its completions."""
+        return cls.compiled(name, variant).hash
+
+    # === Hot reload ===
+    @classmethod
+    def reload(cls) -> bool:
+        """Compile a fresh bundle and swap it in; False (old bundle kept) if it doesn't compile."""
+        try:
+            bundle = _build()
+        except Exception as e:
+            logger.error(f"Prompt reload failed, keeping {cls._bundle.digest if cls._bundle else 'none'}: {e}")
+            return False
+        previous, cls._bundle = cls._bundle, bundle
+        if previous is not None and previous.digest == bundle.digest:
+            logger.info(f"Prompt files changed, prompts unchanged (digest {bundle.digest}, {bundle.source})")
+        else:
+            logger.info(f"Prompts reloaded from {bundle.source} (digest {bundle.digest})")
+        return True
+
+    @classmethod
+    def start_watcher(cls, interval_s: float = RELOAD_INTERVAL_S) -> None:
+        if cls._watcher is not None:
+            return
+        cls.bundle()
+        cls._stop.clear()
+        seen = _signature()
+
+        def watch():
+            nonlocal seen
+            while not cls._stop.wait(interval_s):
+                current = _signature()
+                if current != seen:
+                    seen = current
+                    cls.reload()
+
+        cls._watcher = threading.Thread(target=watch, name="prompt-watcher", daemon=True)
+        cls._watcher.start()
+
+    @classmethod
+    def stop_watcher(cls) -> None:
+        cls._stop.set()
+        cls._watcher = None
+
+
+def hot_reload_enabled() -> bool:
+    return HOT_RELOAD
+
+
+# === Build CLI ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile prompt YAML files into the packaged bundle.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--src", type=Path, default=PROMPTS_DIR)
+    parser.add_argument("--out", type=Path, default=PROMPT_BUNDLE)
+    args = parser.parse_args()
+
+    bundle = compile_sources(args.src)
+    write_bundle(bundle, args.out)
+    for (name, variant), p in sorted(bundle.prompts.items()):
+        print(f"{name}:{variant}  version={p.version}  hash={p.hash}  fields={','.join(p.fields)}")
+    print(f"Wrote {args.out} (digest {bundle.digest})")
@@ -0,0 +1,346 @@
+# app/rate_limiter.py
+"""
+Process-wide token-bucket rate limiting for Azure OpenAI deployments.
+
+Every planner, reviewer and RAG-routing call of every concurrent request
+goes through one `RateLimiter` per deployment, which holds two buckets that
+refill continuously from the deployment quota:
+
+    - tokens:   estimated prompt + completion tokens (TPM)
+    - requests: one per call (RPM)
+
+Callers queue by priority (interactive requests before batch jobs, FIFO
+within a level) and only the head of the queue may take from the buckets,
+so a large prompt isn't starved by a stream of small ones. Estimates are
+corrected from the response's `usage_metadata` when it has one, and a 429
+drains the buckets so every waiter backs off together instead of each
+retrying into the same wall.
+
+Buckets hold `LLM_RATE_BURST_S` seconds of quota, matching Azure's
+short-window enforcement; a single call larger than that is let through
+on a full bucket and leaves it in debt.
+
+Priority is read from a context variable, so a request sets it once
+(`llm_priority(BATCH)`) and every node it runs inherits it.
+
+Configuration (environment variables):
+    AZURE_OPENAI_TPM            tokens per minute of the chat deployment (default 0 = unlimited)
+    AZURE_OPENAI_RPM            requests per minute of the chat deployment (default 0 = unlimited)
+    LLM_RATE_BURST_S            seconds of quota a bucket holds (default 10)
+    LLM_COMPLETION_TOKENS_EST   completion tokens assumed per call (default 1000)
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+INTERACTIVE = 0
+BATCH = 10
+PRIORITY_NAMES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+RATE_BURST_S = float(os.getenv("LLM_RATE_BURST_S", "10"))
+COMPLETION_TOKENS_EST = int(os.getenv("LLM_COMPLETION_TOKENS_EST", "1000"))
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(level: int):
+    """Run the enclosed LLM calls (and graph nodes started inside) at `level`."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def estimate_tokens(prompt: str, completion: int = COMPLETION_TOKENS_EST) -> int:
+    """~4 characters per token for the prompt, plus the expected completion."""
+    return len(prompt) // 4 + completion
+
+
+# === Buckets ===
+class TokenBucket:
+    """Continuously refilling bucket; `per_minute <= 0` means unlimited."""
+
+    def __init__(self, per_minute: float, burst_s: float = RATE_BURST_S):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (capped at a full bucket)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Correct an estimate; a negative amount adds debt."""
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, now: float) -> None:
+        if not self.unlimited:
+            self._refill(now)
+            self.level = min(self.level, 0.0)
+
+
+# === Metrics ===
+@dataclass
+class LimiterStats:
+    granted: int = 0
+    queued: int = 0
+    throttled: int = 0
+    wait_total_s: float = 0.0
+    wait_max_s: float = 0.0
+    tokens_estimated: int = 0
+    tokens_reported: int = 0
+    recent_waits: deque = field(default_factory=lambda: deque(maxlen=500))
+
+    def p95_wait_s(self) -> float:
+        if not self.recent_waits:
+            return 0.0
+        ordered = sorted(self.recent_waits)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    wake: Callable[[], None] = field(compare=False)
+
+
+# === Limiter ===
+class RateLimiter:
+    """Priority queue in front of a TPM and an RPM bucket; sync and async callers share it."""
+
+    def __init__(self, name: str, tpm: float = 0, rpm: float = 0, burst_s: float = RATE_BURST_S):
+        self.name = name
+        self.tokens = TokenBucket(tpm, burst_s)
+        self.requests = TokenBucket(rpm, burst_s)
+        self.stats = LimiterStats()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return not (self.tokens.unlimited and self.requests.unlimited)
+
+    # --- queue (all under self._lock) ---
+    def _enqueue(self, tokens: int, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(_priority.get(), next(self._seq), tokens, wake)
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _try_grant(self, waiter: _Waiter) -> Optional[float]:
+        """0 when granted, else seconds until the head could go; None if `waiter` isn't the head."""
+        if self._queue[0] is not waiter:
+            return None
+        now = time.monotonic()
+        wait = max(self.tokens.ready_in(waiter.tokens, now), self.requests.ready_in(1, now))
+        if wait > 0:
+            return wait
+        self.tokens.take(waiter.tokens)
+        self.requests.take(1)
+        heapq.heappop(self._queue)
+        self._wake_head()
+        return 0.0
+
+    def _wake_head(self) -> None:
+        if self._queue:
+            self._queue[0].wake()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            was_head = self._queue and self._queue[0] is waiter
+            self._queue.remove(waiter)
+            heapq.heapify(self._queue)
+            if was_head:
+                self._wake_head()
+
+    def _granted(self, tokens: int, waited: float, queued: bool) -> None:
+        with self._lock:
+            self.stats.granted += 1
+            self.stats.tokens_estimated += tokens
+            self.stats.queued += queued
+            self.stats.wait_total_s += waited
+            self.stats.wait_max_s = max(self.stats.wait_max_s, waited)
+            self.stats.recent_waits.append(waited)
+
+    # --- acquire ---
+    def acquire(self, tokens: int) -> float:
+        """Block until `tokens` and one request slot are granted; returns the wait in seconds."""
+        if not self.enabled:
+            return 0.0
+        start = time.perf_counter()
+        event = threading.Event()
+        waiter = self._enqueue(tokens, event.set)
+        queued = False
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._try_grant(waiter)
+                if wait == 0:
+                    break
+                queued = True
+                event.wait(wait)
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        waited = time.perf_counter() - start
+        self._granted(tokens, waited, queued)
+        return waited
+
+    async def aacquire(self, tokens: int) -> float:
+        """Async `acquire`: waits on the event loop without holding a thread."""
+        if not self.enabled:
+            return 0.0
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake():
+            # Called from whichever thread released the head
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+        waiter = self._enqueue(tokens, wake)
+        queued = False
+        try:
+            while True:
+                event.clear()
+                with self._lock:
+                    wait = self._try_grant(waiter)
+                if wait == 0:
+                    break
+                queued = True
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        waited = time.perf_counter() - start
+        self._granted(tokens, waited, queued)
+        return waited
+
+    # --- after the call ---
+    def settle(self, estimated: int, response) -> None:
+        """Replace the estimate with the reported usage when the response carries it."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens")
+        if not actual:
+            return
+        with self._lock:
+            self.stats.tokens_reported += actual
+            self.tokens.give_back(estimated - actual)
+            self._wake_head()
+
+    def throttled(self) -> None:
+        """The deployment answered 429: empty both buckets so every waiter backs off."""
+        with self._lock:
+            self.stats.throttled += 1
+            now = time.monotonic()
+            self.tokens.drain(now)
+            self.requests.drain(now)
+
+    @contextmanager
+    def reserve(self, tokens: int):
+        """`with limiter.reserve(n) as settle: settle(llm.invoke(...))`"""
+        self.acquire(tokens)
+        try:
+            yield lambda response: self.settle(tokens, response)
+        except Exception as e:
+            if _is_rate_limited(e):
+                self.throttled()
+            raise
+
+    @asynccontextmanager
+    async def areserve(self, tokens: int):
+        await self.aacquire(tokens)
+        try:
+            yield lambda response: self.settle(tokens, response)
+        except Exception as e:
+            if _is_rate_limited(e):
+                self.throttled()
+            raise
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            depth: Dict[str, int] = {}
+            for waiter in self._queue:
+                label = next((k for k, v in PRIORITY_NAMES.items() if v == waiter.priority), str(waiter.priority))
+                depth[label] = depth.get(label, 0) + 1
+            s = self.stats
+            return {
+                "enabled": self.enabled,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_priority": depth,
+                "granted": s.granted,
+                "queued": s.queued,
+                "throttled_429": s.throttled,
+                "mean_wait_ms": 1000 * s.wait_total_s / s.granted if s.granted else 0.0,
+                "p95_wait_ms": 1000 * s.p95_wait_s(),
+                "max_wait_ms": 1000 * s.wait_max_s,
+                "tokens_estimated": s.tokens_estimated,
+                "tokens_reported": s.tokens_reported,
+            }
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+# === Registry ===
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(deployment: Optional[str] = None) -> RateLimiter:
+    """Shared limiter for an Azure OpenAI deployment (the chat deployment by default)."""
+    name = deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT") or "chat"
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = RateLimiter(
+                name,
+                tpm=float(os.getenv("AZURE_OPENAI_TPM", "0")),
+                rpm=float(os.getenv("AZURE_OPENAI_RPM", "0")),
+            )
+        return _limiters[name]
+
+
+def limiter_status() -> Dict[str, Dict]:
+    """Queue depth and wait-time metrics of every limiter."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.as_dict() for limiter in limiters}
@@ -0,0 +1,210 @@
+# app/resilience.py
+"""
+Failure isolation for external dependencies.
+
+    - `CircuitBreaker`: after N consecutive failures a dependency is
+      considered down for a cool-off period and calls fail immediately with
+      `CircuitOpenError` instead of waiting on timeouts and backoff; one
+      probe call is let through afterwards to close it again.
+    - `Hedger` / `hedged`: for tail latency. If an async call hasn't
+      finished after the dependency's recent p95 latency, a second identical
+      call is started and whichever finishes first wins.
+    - `deadline_after` / `time_left`: a per-request time budget, so late
+      pipeline steps can switch to a degraded mode and still return a layout
+      within the SLA.
+
+Breakers are process-wide, one per dependency name ("trends", "llm",
+"embeddings", "pinecone"), so one misbehaving service trips fast-fail for
+every in-flight request at once.
+
+Configuration (environment variables):
+    BREAKER_FAILURES        consecutive failures that open a breaker (default 5)
+    BREAKER_RESET_S         seconds before a half-open probe (default 30)
+    HEDGE_ENABLED           "1"/"0" (default 1)
+    HEDGE_MIN_DELAY_MS      never hedge sooner than this (default 500)
+    STRATEGIST_BUDGET_S     time budget of the strategist refinement loop (default 90)
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") not in ("0", "false", "False")
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_MS", "500")) / 1000
+STRATEGIST_BUDGET_S = float(os.getenv("STRATEGIST_BUDGET_S", "90"))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+
+# === Circuit breaker ===
+class CircuitBreaker:
+    """closed → (N failures) → open → (reset timeout) → half-open → closed / open."""
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_s: float = BREAKER_RESET_S):
+        self.name = name
+        self.max_failures = failures
+        self.reset_s = reset_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; only one half-open probe at a time."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.max_failures:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def _check(self) -> None:
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit open; failing fast")
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        self._check()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    async def acall(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        self._check()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Losing a hedge race or client disconnect says nothing about the dependency
+            with self._lock:
+                self.probing = False
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {"state": self._state(), "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breakers_status() -> Dict[str, Dict]:
+    with _breakers_lock:
+        return {name: b.as_dict() for name, b in _breakers.items()}
+
+
+# === Hedging ===
+class Hedger:
+    """Tracks recent latencies of one call type; the hedge delay is their p95."""
+
+    def __init__(self, name: str, window: int = 200, min_delay_s: float = HEDGE_MIN_DELAY_S):
+        self.name = name
+        self.min_delay_s = min_delay_s
+        self._latencies = deque(maxlen=window)
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+
+    def delay(self) -> Optional[float]:
+        """None until there is enough history to know what 'slow' means."""
+        if len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        return max(self.min_delay_s, ordered[int(0.95 * (len(ordered) - 1))])
+
+
+async def hedged(factory: Callable[[], Awaitable[T]], hedger: Hedger) -> T:
+    """
+    Await `factory()`; if it is still pending after the hedger's delay, race
+    it against a second `factory()` call. The loser is cancelled. Only use
+    for idempotent calls.
+    """
+    start = time.perf_counter()
+    delay = hedger.delay() if HEDGE_ENABLED else None
+    pending = {asyncio.ensure_future(factory())}
+    first = next(iter(pending))
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if not done:
+            hedger.hedges += 1
+            pending.add(asyncio.ensure_future(factory()))
+        error: Optional[BaseException] = None
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    hedger.observe(time.perf_counter() - start)
+                    if task is not first:
+                        hedger.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+            if not pending:
+                raise error
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # The loser, or everything if we were cancelled ourselves
+        for task in pending:
+            task.cancel()
+
+
+# === Deadline ===
+def deadline_after(seconds: float = STRATEGIST_BUDGET_S) -> float:
+    """Wall-clock deadline (a plain timestamp, so it can live in graph state)."""
+    return time.time() + seconds
+
+
+def time_left(deadline: Optional[float]) -> float:
+    return float("inf") if deadline is None else deadline - time.time()
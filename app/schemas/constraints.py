@@ -0,0 +1,27 @@
+# schemas/constraints.py
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+
+Category = Literal["circulation", "accessibility", "walls", "entrance", "fixtures", "services", "brand"]
+
+class Constraint(BaseModel):
+    category: Category
+    text: str
+    page: Optional[int] = None
+
+class FixtureSpec(BaseModel):
+    code: str
+    name: str = ""
+    dimensions_mm: Dict[str, float] = Field(default_factory=dict)  # keyed W / D / H / L
+
+class SourceDigest(BaseModel):
+    source: str
+    city: Optional[str] = None  # None: applies to every city
+    file_hash: str
+    constraints: List[Constraint] = Field(default_factory=list)
+    fixtures: List[FixtureSpec] = Field(default_factory=list)
+
+class DigestBundle(BaseModel):
+    format: int = 1
+    extractor: str
+    sources: List[SourceDigest]
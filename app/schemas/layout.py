@@ -1,6 +1,16 @@
 # schemas/layout.py
-from pydantic import BaseModel, Field
-from typing import List, Literal
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+
+Side = Literal["north", "south", "east", "west"]
+
+class FixturePlacement(BaseModel):
+    """A catalog fixture placed inside its zone, in plan metres."""
+    code: str
+    x: float
+    y: float
+    width: float
+    height: float
 
 class Zone(BaseModel):
     name: str
@@ -8,14 +18,55 @@ class Zone(BaseModel):
     y: float
     width: float
     height: float
+    floor: int = 0  # level of the `Floor` it sits on; 0 is the entrance level
     fixtures: List[str] = Field(default_factory=list)
     products: List[str] = Field(default_factory=list)
+    placements: List[FixturePlacement] = Field(default_factory=list)
+
+class Floor(BaseModel):
+    level: int
+    name: str = ""
+    # Defaults to the plan's dimensions
+    dimensions_m: Optional[tuple[float, float]] = None
 
 class LayoutPlan(BaseModel):
     store_name: str
     city: str
     dimensions_m: tuple[float, float]
-    entrance_side: Literal["north", "south", "east", "west"]
+    entrance_side: Side
     zones: List[Zone]
+    # Empty for a single-floor store: every zone is on level 0 at `dimensions_m`
+    floors: List[Floor] = Field(default_factory=list)
     compliance_notes: List[str] = Field(default_factory=list)
-    best_practice_score: float = Field(ge=0, le=10)
\ No newline at end of file
+    best_practice_score: float = Field(ge=0, le=10)
+
+    @field_validator("dimensions_m", mode="before")
+    @classmethod
+    def _normalize_dimensions(cls, value):
+        # LLMs return {"length": .., "width": ..} or 3-element lists as often as pairs
+        if isinstance(value, dict):
+            return (value.get("length", 20), value.get("width", 12))
+        if isinstance(value, (list, tuple)):
+            return tuple(value[:2])
+        return value
+
+    @property
+    def levels(self) -> List[int]:
+        """Floor levels in ascending order, including any a zone names without a `Floor` entry."""
+        return sorted({f.level for f in self.floors} | {z.floor for z in self.zones} | {0})
+
+    def floor_dimensions(self, level: int) -> tuple[float, float]:
+        for floor in self.floors:
+            if floor.level == level and floor.dimensions_m:
+                return tuple(floor.dimensions_m)
+        return tuple(self.dimensions_m)
+
+    def on_floor(self, level: int = 0) -> "LayoutPlan":
+        """Single-floor view of one level (shares the zone objects)."""
+        if not self.floors and all(z.floor == level for z in self.zones):
+            return self
+        return self.model_copy(update={
+            "dimensions_m": self.floor_dimensions(level),
+            "zones": [z for z in self.zones if z.floor == level],
+            "floors": [],
+        })
@@ -0,0 +1,52 @@
+# app/state.py
+"""
+Reducers that keep LangGraph state small.
+
+`messages` used to be merged with `operator.add`, so every planner answer
+(a multi-KB layout JSON), every tool result and every review stayed in state
+for the whole request, once in the subgraph and again in the main graph.
+Nothing downstream reads old message bodies: prompts are built from
+`draft_plan`, `retrieved` and `review`, and the ToolNode only needs the last
+message's `tool_calls`. `bounded_messages` therefore keeps the most recent
+messages and trims each one's content to a short summary.
+
+Plans travel between nodes as `LayoutPlan` objects (by reference) rather
+than being dumped to dicts and re-validated at every hop.
+
+Configuration (environment variables):
+    STATE_MAX_MESSAGES      messages kept per state (default 12)
+    STATE_MESSAGE_CHARS     content kept per message (default 400)
+"""
+import os
+from typing import List, Union
+
+from langchain_core.messages import BaseMessage
+
+from app.schemas.layout import LayoutPlan
+
+MAX_MESSAGES = int(os.getenv("STATE_MAX_MESSAGES", "12"))
+MESSAGE_CHARS = int(os.getenv("STATE_MESSAGE_CHARS", "400"))
+
+
+def _summarize(message, limit: int):
+    if isinstance(message, str):
+        return message if len(message) <= limit else message[:limit] + "…"
+    if isinstance(message, BaseMessage) and isinstance(message.content, str) and len(message.content) > limit:
+        # tool_calls / ids are kept; only the body is trimmed
+        return message.model_copy(update={"content": message.content[:limit] + "…"})
+    return message
+
+
+def bounded_messages(left: List, right: Union[List, object, None]) -> List:
+    """`operator.add` for message lists, keeping the last MAX_MESSAGES trimmed messages."""
+    if right is None:
+        right = []
+    elif not isinstance(right, list):
+        right = [right]
+    merged = list(left or []) + [_summarize(m, MESSAGE_CHARS) for m in right]
+    return merged[-MAX_MESSAGES:]
+
+
+def as_plan(plan) -> LayoutPlan:
+    """Accepts a `LayoutPlan` (returned as is) or its dict form."""
+    return plan if isinstance(plan, LayoutPlan) else LayoutPlan.model_validate(plan)
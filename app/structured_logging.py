@@ -0,0 +1,205 @@
+# app/structured_logging.py
+"""
+Non-blocking structured logging.
+
+`setup_logging()` replaces the root handlers with a `QueueHandler`: a
+request thread only stamps the record with its correlation id and puts it
+on an in-memory queue. A `QueueListener` thread formats it (one JSON object
+per line, or readable text) and writes it to stdout. A full queue drops
+records and counts them instead of blocking the request.
+
+Payloads passed to `log_event` are serialized lazily:
+
+    - not at all when the logger's level is disabled;
+    - on the listener thread otherwise (so pass fresh dicts, not objects a
+      node keeps mutating);
+    - `verbose=True` payloads (raw LLM output, full review lists) only for
+      a LOG_PAYLOAD_SAMPLE_RATE share of requests, decided once per
+      request so a sampled request is logged completely, or when DEBUG is
+      enabled.
+
+`correlation(layout_id)` binds the id to every record logged inside it,
+including the graph nodes the request runs (context variables propagate
+into tasks and the executor).
+
+Configuration (environment variables):
+    LOG_LEVEL                   root level (default INFO)
+    LOG_FORMAT                  "json" / "text" (default json)
+    LOG_QUEUE_SIZE              records buffered before dropping (default 10000)
+    LOG_PAYLOAD_MAX_CHARS       serialized payload cut-off (default 2000)
+    LOG_PAYLOAD_SAMPLE_RATE     share of requests logging verbose payloads (default 0.1)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.1"))
+
+_correlation_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("correlation_id", default=None)
+_sampled: contextvars.ContextVar[bool] = contextvars.ContextVar("log_payload_sampled", default=False)
+
+
+@contextmanager
+def correlation(layout_id: str, sampled: Optional[bool] = None):
+    """Tag records logged inside with `layout_id`; decide verbose-payload sampling for them."""
+    id_token = _correlation_id.set(layout_id)
+    sample_token = _sampled.set(random.random() < PAYLOAD_SAMPLE_RATE if sampled is None else sampled)
+    try:
+        yield
+    finally:
+        _sampled.reset(sample_token)
+        _correlation_id.reset(id_token)
+
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+
+# === Emitting ===
+def log_event(
+    logger: logging.Logger,
+    message: str,
+    payload: Any = None,
+    *,
+    agent: Optional[str] = None,
+    level: int = logging.INFO,
+    verbose: bool = False,
+) -> None:
+    """Log `message` with an optional structured payload, serialized only if it will be written."""
+    if not logger.isEnabledFor(level):
+        return
+    if payload is not None and verbose and not (_sampled.get() or logger.isEnabledFor(logging.DEBUG)):
+        payload = None
+    logger.log(level, message, extra={"agent": agent, "payload": payload}, stacklevel=2)
+
+
+# === Formatting (listener thread) ===
+def _payload_json(payload: Any) -> str:
+    """Payload as JSON text, serialized once; over the limit it becomes a truncated string."""
+    text = json.dumps(payload, default=str, ensure_ascii=False)
+    if len(text) <= PAYLOAD_MAX_CHARS:
+        return text
+    return json.dumps(text[:PAYLOAD_MAX_CHARS] + "...", ensure_ascii=False)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("layout_id", "agent"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        line = json.dumps(entry, default=str, ensure_ascii=False)
+        if getattr(record, "payload", None) is not None:
+            # Spliced in rather than nested, so the payload isn't encoded twice
+            line = f'{line[:-1]}, "payload": {_payload_json(record.payload)}}}'
+        return line
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+        parts = [f"[{timestamp}] {record.levelname:<7} {record.name}"]
+        if getattr(record, "layout_id", None):
+            parts.append(f"[{record.layout_id}]")
+        if getattr(record, "agent", None):
+            parts.append(f"{record.agent.upper()}:")
+        parts.append(record.getMessage())
+        line = " ".join(parts)
+        if getattr(record, "payload", None) is not None:
+            line += " | " + _payload_json(record.payload)
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+# === Queue handler ===
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue without formatting: the caller only stamps the correlation id,
+    merges `%` args and renders a traceback (which can't cross threads
+    safely); everything else happens on the listener.
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.layout_id = getattr(record, "layout_id", None) or _correlation_id.get()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    """Route every logger through the queue; idempotent."""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+    records: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    _queue_handler = NonBlockingQueueHandler(records)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records, stop the listener thread and log synchronously from then on."""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    # Detach first so nothing is enqueued after the listener's final drain
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
+    _queue_handler = None
+
+
+def logging_status() -> dict:
+    return {
+        "queued": _listener.queue.qsize() if _listener is not None else 0,
+        "dropped": NonBlockingQueueHandler.dropped,
+        "payload_sample_rate": PAYLOAD_SAMPLE_RATE,
+    }
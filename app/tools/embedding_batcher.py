@@ -0,0 +1,231 @@
+# tools/embedding_batcher.py
+"""
+Micro-batching for query embeddings.
+
+Concurrent requests each need one query embedding; sent one by one they pay
+a full Azure round trip and a rate-limit slot each. The batcher parks each
+`embed_query` call on a queue, a collector thread gathers whatever arrives
+within a short window (or until the batch is full), sends a single
+`embed_documents` call, and resolves every waiting caller with its vector.
+Sync callers block on a future; async callers await it without holding a
+thread. Batches run on the batcher's own small pool, not the shared I/O
+executor, so sync callers that are themselves I/O-executor threads can't
+starve the batch they wait on.
+
+Query vectors are cached on the shared cache backend (`app.cache`,
+namespace "embeddings"), so repeated retrieval and semantic-cache queries
+skip Azure altogether, in every worker.
+
+Configuration (environment variables):
+    EMBED_BATCHING          "1"/"0" (default 1)
+    EMBED_BATCH_WINDOW_MS   how long to wait for more queries (default 10)
+    EMBED_BATCH_MAX         max texts per embed_documents call (default 16)
+    EMBED_BATCH_WORKERS     embed_documents calls in flight at once (default 4)
+    EMBED_CACHE_TTL_S       query vector lifetime (default 7 days; 0 disables)
+    EMBED_CACHE_MAX_ENTRIES cached query vectors before LRU eviction (default 10000)
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+from app.cache import get_cache
+from app.clients import EMBEDDING_DEPLOYMENT, get_embeddings
+
+
+@dataclass
+class BatcherStats:
+    batches: int = 0
+    queries: int = 0
+    embedded: int = 0  # texts sent, after dropping duplicates and cancelled callers
+    deduplicated: int = 0
+    cancelled: int = 0
+    failures: int = 0
+    batch_sizes: Counter = field(default_factory=Counter)
+    queue_delay_total_ms: float = 0.0
+    queue_delay_max_ms: float = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "deduplicated": self.deduplicated,
+            "cancelled": self.cancelled,
+            "failures": self.failures,
+            "mean_batch_size": self.embedded / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "mean_queue_delay_ms": self.queue_delay_total_ms / served if (served := self.queries - self.cancelled) else 0.0,
+            "max_queue_delay_ms": self.queue_delay_max_ms,
+        }
+
+
+class EmbeddingMicroBatcher:
+    """Coalesces concurrent `embed_query` calls into `embed_documents` batches."""
+
+    def __init__(
+        self,
+        embed_documents: Callable[[List[str]], List[List[float]]],
+        window_ms: float = 10,
+        max_batch: int = 16,
+        workers: int = 4,
+    ):
+        self._embed_documents = embed_documents
+        self.window_s = window_ms / 1000
+        self.max_batch = max_batch
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="embed-batch")
+        self._queue: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.stats = BatcherStats()
+        self._collector = threading.Thread(target=self._collect, name="embed-batcher", daemon=True)
+        self._collector.start()
+
+    # === Public API ===
+    def submit(self, text: str) -> Future:
+        fut: Future = Future()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {"batching": True, "pending": self._queue.qsize(), **self.stats.as_dict()}
+
+    # === Collector ===
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Dispatch on the batcher's own pool so the next batch can form meanwhile
+            self._executor.submit(self._run_batch, batch)
+
+    @staticmethod
+    def _resolve(fut: Future, result=None, error: BaseException = None) -> None:
+        # One caller's future in a bad state must not strand the rest of the batch
+        try:
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        except Exception:
+            pass
+
+    def _run_batch(self, batch: List[Tuple[str, Future, float]]) -> None:
+        dispatched = time.perf_counter()
+        queued = len(batch)
+        # Callers cancelled while queued (e.g. a losing hedge) are dropped; the rest can no longer be cancelled
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        with self._lock:
+            self.stats.queries += queued
+            self.stats.cancelled += queued - len(batch)
+            self.stats.deduplicated += len(batch) - len(texts)
+            if texts:
+                self.stats.batches += 1
+                self.stats.embedded += len(texts)
+                self.stats.batch_sizes[len(texts)] += 1
+            for _, _, enqueued in batch:
+                delay_ms = (dispatched - enqueued) * 1000
+                self.stats.queue_delay_total_ms += delay_ms
+                self.stats.queue_delay_max_ms = max(self.stats.queue_delay_max_ms, delay_ms)
+        if not texts:
+            return
+        try:
+            vectors = dict(zip(texts, self._embed_documents(texts)))
+        except Exception as e:
+            with self._lock:
+                self.stats.failures += 1
+            for _, fut, _ in batch:
+                self._resolve(fut, error=e)
+            return
+        for text, fut, _ in batch:
+            self._resolve(fut, vectors.get(text))
+
+
+class _DirectEmbedder:
+    """Same interface without batching (EMBED_BATCHING=0)."""
+
+    def __init__(self, embeddings):
+        self._embeddings = embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._embeddings.aembed_query(text)
+
+    def status(self) -> Dict:
+        return {"batching": False}
+
+
+class _CachedEmbedder:
+    """Looks query vectors up on the shared cache before embedding them."""
+
+    def __init__(self, inner, cache):
+        self._inner = inner
+        self._cache = cache
+
+    def _key(self, text: str):
+        return (EMBEDDING_DEPLOYMENT, text)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cache.get(self._key(text))
+        if vector is None:
+            vector = self._inner.embed_query(text)
+            self._cache.set(self._key(text), vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = await self._cache.aget(self._key(text))
+        if vector is None:
+            vector = await self._inner.aembed_query(text)
+            await self._cache.aset(self._key(text), vector)
+        return vector
+
+    def status(self) -> Dict:
+        return {**self._inner.status(), "cache": self._cache.stats()}
+
+
+@lru_cache(maxsize=None)
+def get_embedding_batcher():
+    """Process-wide query embedder shared by retrieval and the LLM cache."""
+    embeddings = get_embeddings()
+    if os.getenv("EMBED_BATCHING", "1") in ("0", "false", "False"):
+        embedder = _DirectEmbedder(embeddings)
+    else:
+        embedder = EmbeddingMicroBatcher(
+            embeddings.embed_documents,
+            window_ms=float(os.getenv("EMBED_BATCH_WINDOW_MS", "10")),
+            max_batch=int(os.getenv("EMBED_BATCH_MAX", "16")),
+            workers=int(os.getenv("EMBED_BATCH_WORKERS", "4")),
+        )
+    ttl_s = float(os.getenv("EMBED_CACHE_TTL_S", str(7 * 24 * 3600)))
+    if ttl_s <= 0:
+        return embedder
+    cache = get_cache("embeddings", ttl_s, int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000")))
+    return _CachedEmbedder(embedder, cache)
+
+
+def embedding_status() -> Dict:
+    """Batcher stats and embedding cache counts for /diagnostics; empty until first use."""
+    if not get_embedding_batcher.cache_info().currsize:
+        return {}
+    return get_embedding_batcher().status()
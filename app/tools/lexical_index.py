@@ -0,0 +1,135 @@
+# tools/lexical_index.py
+"""
+Local BM25 inverted index over the ingested chunks.
+
+Built by `data_ingestion/build_lexical_index.py` (run in the Docker build)
+over the same chunks `data_ingestion/index_documents.py` upserts to
+Pinecone, and saved as JSON next to them. `rag_tool` loads it once
+and uses it for:
+
+    - lexical-only lookups when a query names exact clause / fixture
+      identifiers (no embedding call, no network), and
+    - hybrid retrieval, fusing BM25 and vector rankings with reciprocal
+      rank fusion.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+LEXICAL_INDEX_PATH = Path(os.getenv(
+    "RAG_LEXICAL_INDEX",
+    Path(__file__).resolve().parents[2] / "data_ingestion" / "bm25_index.json",
+))
+
+# Keeps dotted / hyphenated / underscored identifiers ("4.2.1", "fx-200", "fx_200") as one token
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/_][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _is_identifier(token: str) -> bool:
+    # Clause numbers ("7.3.2") and catalog codes ("fx-200", "gs12"); a bare number isn't one
+    if not any(c.isdigit() for c in token):
+        return False
+    return any(c.isalpha() for c in token) or any(c in "./-_" for c in token)
+
+
+def query_identifiers(query: str) -> List[str]:
+    """Exact identifiers in a query, as the index tokens they must match."""
+    return [t for t in tokenize(query) if _is_identifier(t)]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts, with postings lists per term."""
+
+    def __init__(self, docs: List[Dict], k1: float = 1.5, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[List[int]]] = defaultdict(list)
+        lengths = []
+        for i, doc in enumerate(docs):
+            tokens = tokenize(doc["text"])
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append([i, tf])
+        self.doc_len = np.asarray(lengths, dtype=np.float32)
+        self.avgdl = float(self.doc_len.mean()) if len(docs) else 0.0
+        n = len(docs)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        if not self.docs:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / (self.avgdl or 1.0))
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            arr = np.asarray(postings, dtype=np.int64)
+            idx, tf = arr[:, 0], arr[:, 1].astype(np.float32)
+            scores[idx] += self.idf[term] * tf * (self.k1 + 1) / (tf + norm[idx])
+        return scores
+
+    def search(self, query: str, top_k: int = 8) -> List[Dict]:
+        scores = self.scores(query)
+        if not scores.any():
+            return []
+        k = min(top_k, int((scores > 0).sum()))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**self.docs[i], "score": float(scores[i])} for i in top]
+
+    def contains_all(self, doc: Dict, terms: List[str]) -> bool:
+        tokens = set(tokenize(doc["text"]))
+        return all(t in tokens for t in terms)
+
+    # === Persistence ===
+    def save(self, path: Path = LEXICAL_INDEX_PATH) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": self.docs}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: Path = LEXICAL_INDEX_PATH) -> "BM25Index":
+        with Path(path).open("r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["docs"], k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+
+
+@lru_cache(maxsize=1)
+def get_lexical_index() -> Optional[BM25Index]:
+    """The ingested BM25 index, or None if ingestion hasn't produced one."""
+    if not LEXICAL_INDEX_PATH.exists():
+        return None
+    return BM25Index.load(LEXICAL_INDEX_PATH)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+    """Fuse ranked chunk lists; chunks are identified by (source, chunk, text)."""
+    fused: Dict[tuple, float] = defaultdict(float)
+    first_seen: Dict[tuple, Dict] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = (doc.get("source"), doc.get("chunk"), doc.get("text"))
+            fused[key] += 1.0 / (k + rank + 1)
+            first_seen.setdefault(key, doc)
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+    return [{**first_seen[key], "score": score} for key, score in best]
@@ -1,8 +1,12 @@
 # tools/rag_tool.py
-from typing import List, Dict
+from typing import List, Dict, Literal, Optional
 from pydantic import BaseModel, Field
-from langchain_openai import AzureOpenAIEmbeddings
-from  pinecone import Pinecone
+from langchain_core.tools import StructuredTool
+from app.cache import get_cache
+from app.clients import PINECONE_INDEX_NAME, get_pinecone_index, run_blocking
+from app.tools.embedding_batcher import get_embedding_batcher
+from app.tools.lexical_index import get_lexical_index, query_identifiers, reciprocal_rank_fusion
+from app.resilience import breaker, Hedger, hedged
 import os
 from pathlib import Path
 
@@ -33,75 +37,214 @@ def load_env_file(env_path: str = ".env") -> None:
                 os.environ[key] = value
 
 load_env_file()
-# --- Initialize Pinecone ---
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-if not PINECONE_API_KEY:
-    raise ValueError("❌ Missing PINECONE_API_KEY environment variable.")
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
-index_name = "retail-copilot"
-if not pc.has_index(index_name):
-    raise ValueError(f"❌ Pinecone index '{index_name}' not found.")
-
-index = pc.Index(index_name)
-
-# --- Initialize Azure Embeddings ---
-embeddings = AzureOpenAIEmbeddings(
-    azure_deployment="text-embedding-3-small",
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    openai_api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    openai_api_version="2023-05-15"
+# --- Shared Pinecone index & Azure embeddings (pooled, see app.clients) ---
+index = get_pinecone_index()
+# Query embeddings from concurrent requests are coalesced into batches
+embeddings = get_embedding_batcher()
+# Per-dependency breakers; when either is down, retrieval degrades to local BM25
+embeddings_breaker = breaker("embeddings")
+pinecone_breaker = breaker("pinecone")
+embeddings_hedger = Hedger("embeddings")
+# Retrieved chunks per (index, query, top_k, mode), shared across workers (app.cache);
+# the corpus only changes on re-ingestion, so entries live for a day by default
+retrieval_cache = get_cache(
+    "retrieval",
+    float(os.getenv("RETRIEVAL_CACHE_TTL_S", str(24 * 3600))),
+    int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2048")),
 )
 
 # --- Input Schema ---
 class RAGInput(BaseModel):
     query: str = Field(..., description="Natural language query to retrieve relevant documents.")
     top_k: int = Field(default=8, description="Number of top relevant chunks to retrieve.")
+    mode: Literal["auto", "hybrid", "vector", "lexical"] = Field(
+        default_factory=lambda: os.getenv("RAG_MODE", "auto"),
+        description="auto: lexical fast path for exact identifiers, else hybrid (BM25 + vector).",
+    )
+
+# --- Helpers ---
+def _payload(query: str, chunks: List[Dict], mode: str) -> Dict:
+    return {
+        "query": query,
+        "retrieval_mode": mode,
+        "retrieved_chunks": chunks
+    }
+
+def _lexical_fast_path(input: RAGInput) -> Optional[Dict]:
+    """
+    Answer from the local BM25 index alone when that is enough.
+
+    In `auto` mode this fires when the query names exact identifiers
+    (clause numbers, fixture codes) and the best BM25 hit contains all of
+    them; no embedding call or network round trip is made.
+    """
+    lexical = get_lexical_index()
+    if lexical is None:
+        return None
+    if input.mode == "lexical":
+        return _payload(input.query, lexical.search(input.query, input.top_k), "lexical")
+    if input.mode != "auto":
+        return None
+    identifiers = query_identifiers(input.query)
+    if not identifiers:
+        return None
+    hits = lexical.search(input.query, input.top_k)
+    if hits and lexical.contains_all(hits[0], identifiers):
+        return _payload(input.query, hits, "lexical")
+    return None
+
+def _fuse(input: RAGInput, vector_chunks: List[Dict]) -> Dict:
+    lexical = get_lexical_index()
+    if input.mode == "vector" or lexical is None:
+        return _payload(input.query, vector_chunks, "vector")
+    lexical_chunks = lexical.search(input.query, input.top_k * 2)
+    fused = reciprocal_rank_fusion([vector_chunks, lexical_chunks], input.top_k)
+    return _payload(input.query, fused, "hybrid")
+
+def _degraded(input: RAGInput, error: Exception) -> Dict:
+    """Embeddings or Pinecone unavailable: answer from the local BM25 index if there is one."""
+    lexical = get_lexical_index()
+    if lexical is None:
+        return {"error": str(error)}
+    payload = _payload(input.query, lexical.search(input.query, input.top_k), "lexical")
+    payload["degraded"] = f"{type(error).__name__}: {error}"
+    return payload
+
+def _cache_key(input: RAGInput):
+    return (PINECONE_INDEX_NAME, input.query, input.top_k, input.mode)
+
+def _cacheable(payload: Dict) -> bool:
+    # Degraded (BM25-only) answers aren't cached, so recovery is immediate
+    return "error" not in payload and "degraded" not in payload
+
+def _remember(input: RAGInput, payload: Dict) -> Dict:
+    if _cacheable(payload):
+        retrieval_cache.set(_cache_key(input), payload)
+    return payload
+
+async def _aremember(input: RAGInput, payload: Dict) -> Dict:
+    if _cacheable(payload):
+        await retrieval_cache.aset(_cache_key(input), payload)
+    return payload
+
+def _collect(results) -> List[Dict]:
+    """Shape Pinecone matches into chunk dicts."""
+    chunks = []
+    for match in results.matches:
+        meta = match.metadata or {}
+        chunks.append({
+            "text": meta.get("text", ""),
+            "source": meta.get("source", "unknown"),
+            "chunk": int(meta["chunk"]) if "chunk" in meta else None,
+            "score": match.score
+        })
+    return chunks
 
 # --- RAG Tool Function ---
 def rag_tool(input: RAGInput) -> Dict:
     """
-    Retrieve relevant document chunks from Pinecone based on the input query.
+    Retrieve relevant document chunks based on the input query.
+
+    Dense retrieval runs against Pinecone; when the local BM25 index is
+    available it is fused in (hybrid) or used alone (lexical fast path).
 
     Args:
-        input (RAGInput): Query and number of chunks to retrieve.
+        input (RAGInput): Query, number of chunks to retrieve and retrieval mode.
 
     Returns:
         dict: {
             "query": str,
-            "retrieved_chunks": List[{"text": str, "source": str, "score": float}]
+            "retrieval_mode": "lexical" | "hybrid" | "vector",
+            "retrieved_chunks": List[{"text": str, "source": str, "chunk": int, "score": float}],
+            "degraded": str  # only when Pinecone/embeddings failed and BM25 answered
         }
     """
+    cached = retrieval_cache.get(_cache_key(input))
+    if cached is not None:
+        return cached
+
+    try:
+        fast = _lexical_fast_path(input)
+        if fast is not None:
+            return fast
+    except Exception as e:
+        return {"error": str(e)}
+
     try:
         # Embed the query
-        q_emb = embeddings.embed_query(input.query)
+        q_emb = embeddings_breaker.call(embeddings.embed_query, input.query)
 
         # Perform similarity search
-        results = index.query(
+        results = pinecone_breaker.call(
+            index.query,
             vector=q_emb,
             top_k=input.top_k,
             include_metadata=True
         )
+        return _remember(input, _fuse(input, _collect(results)))
 
-        # Collect matched chunks
-        chunks = []
-        for match in results.matches:
-            meta = match.metadata or {}
-            chunks.append({
-                "text": meta.get("text", ""),
-                "source": meta.get("source", "unknown"),
-                "score": match.score
-            })
-
-        return {
-            "query": input.query,
-            "retrieved_chunks": chunks
-        }
+    except Exception as e:
+        return _degraded(input, e)
 
+
+async def arag_tool(input: RAGInput) -> Dict:
+    """
+    Async variant of `rag_tool`.
+
+    The embedding is awaited on the shared micro-batcher; the Pinecone
+    REST query has no async API in the sync SDK, so it runs on the shared
+    I/O executor instead of blocking the event loop, as do reads and writes
+    of the retrieval cache. Slow embeddings are hedged (see `app.resilience`).
+    """
+    cached = await retrieval_cache.aget(_cache_key(input))
+    if cached is not None:
+        return cached
+
+    try:
+        fast = _lexical_fast_path(input)
+        if fast is not None:
+            return fast
     except Exception as e:
         return {"error": str(e)}
 
+    try:
+        q_emb = await embeddings_breaker.acall(
+            hedged, lambda: embeddings.aembed_query(input.query), embeddings_hedger
+        )
+        results = await pinecone_breaker.acall(
+            run_blocking,
+            index.query,
+            vector=q_emb,
+            top_k=input.top_k,
+            include_metadata=True
+        )
+        return await _aremember(input, _fuse(input, _collect(results)))
+
+    except Exception as e:
+        return _degraded(input, e)
+
+
+# --- LangChain tool (sync + async) used by the strategist ToolNode ---
+def _rag_input(query: str, top_k: int, mode: Optional[str]) -> RAGInput:
+    return RAGInput(query=query, top_k=top_k, **({"mode": mode} if mode else {}))
+
+
+def _run_rag(query: str, top_k: int = 8, mode: Optional[str] = None) -> Dict:
+    return rag_tool(_rag_input(query, top_k, mode))
+
+
+async def _arun_rag(query: str, top_k: int = 8, mode: Optional[str] = None) -> Dict:
+    return await arag_tool(_rag_input(query, top_k, mode))
+
+
+rag_structured_tool = StructuredTool.from_function(
+    func=_run_rag,
+    coroutine=_arun_rag,
+    name="rag_tool",
+    description="Retrieve store-layout constraints (brand book, fixture catalog, building code, leasing agreement, best practices).",
+    args_schema=RAGInput,
+)
+
 
 # --- DEMO SECTION ---
 if __name__ == "__main__":
@@ -6,38 +6,100 @@ import numpy as np
 
 import pandas as pd
 import matplotlib.pyplot as plt
-from pytrends.request import TrendReq
+from app.clients import get_trends_client
+from app.tools.trend_store import get_trend_store
 from langchain.tools import tool
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_not_exception_type
+from pytrends.exceptions import TooManyRequestsError
+from app.resilience import breaker, CircuitOpenError
+import functools
+import contextvars
+from contextlib import contextmanager
 import logging 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 def make_trends_client():
-    return TrendReq(hl="en-US", tz=330)
+    # Reused per thread (see app.clients) instead of a cookie handshake per call
+    return get_trends_client()
 
 
-def fetch_interest_over_time(keywords, geo, timeframe, gprop):
+# Retries wrap each Trends request, not the whole pipeline: a failed
+# related-queries call no longer re-downloads interest over time.
+# A 429 or an open breaker fails fast: backing off into a rate limit only
+# holds the request longer, and the caller has degraded modes.
+fetch_retry = retry(
+    stop=stop_after_attempt(3),            # Retry up to 3 times
+    wait=wait_exponential(multiplier=2, min=2, max=10),  # Exponential backoff
+    retry=retry_if_not_exception_type((TooManyRequestsError, CircuitOpenError)),
+    reraise=True,
+)
+
+trends_breaker = breaker("trends")
+
+# Trends requests sent (retries and per-range downloads included) inside `count_trends_requests`
+_sent: contextvars.ContextVar = contextvars.ContextVar("trends_requests_sent", default=None)
+
+@contextmanager
+def count_trends_requests():
+    """Yields a one-item list holding the number of Trends requests sent in the block.
+
+    The counter is shared with `run_blocking` workers started inside the
+    block (they run in a copy of this context), so it sees their requests too.
+    """
+    counter = [0]
+    token = _sent.set(counter)
+    try:
+        yield counter
+    finally:
+        _sent.reset(token)
+
+def trends_call(fn):
+    """Per-request retries, each attempt going through the shared Trends breaker."""
+    def sent(*args, **kwargs):
+        # Counted once past the breaker: a fast-failed attempt costs no quota
+        counter = _sent.get()
+        if counter is not None:
+            counter[0] += 1
+        return fn(*args, **kwargs)
+
+    @functools.wraps(fn)
+    def guarded(*args, **kwargs):
+        return trends_breaker.call(sent, *args, **kwargs)
+    return fetch_retry(guarded)
+
+# The fetchers take the calling thread's client rather than a module global,
+# so concurrent analyses on the I/O executor don't overwrite each other's payload.
+@trends_call
+def _download_interest_over_time(keywords, geo, timeframe, gprop):
+    pytrend = make_trends_client()
     pytrend.build_payload(kw_list=keywords, timeframe=timeframe, geo=geo, gprop=gprop)
     df = pytrend.interest_over_time()
     return df
 
+def fetch_interest_over_time(keywords, geo, timeframe, gprop):
+    # Served from the local trend-history store; only missing days are downloaded
+    store = get_trend_store()
+    if store is not None:
+        return store.interest_over_time(_download_interest_over_time, keywords, geo, timeframe, gprop)
+    return _download_interest_over_time(keywords, geo, timeframe, gprop)
+
+@trends_call
 def fetch_related_queries(keywords, geo, timeframe, gprop):
+    pytrend = make_trends_client()
     pytrend.build_payload(kw_list=keywords, timeframe=timeframe, geo=geo, gprop=gprop)
     return pytrend.related_queries()
 
 def fetch_realtime_trends(cat="all", geo="IN"):
     try:
-        df = pytrend.realtime_trending_searches(geo=geo)
+        df = make_trends_client().realtime_trending_searches(geo=geo)
     except Exception as e:
         return pd.DataFrame()
     return df
 
 def fetch_state_interest(keywords, sub_geo, timeframe, gprop):
-    pytrend.build_payload(kw_list=keywords, timeframe=timeframe, geo=sub_geo, gprop=gprop)
-    df = pytrend.interest_over_time()
-    return df
+    return fetch_interest_over_time(keywords, sub_geo, timeframe, gprop)
 
 def package_signals(iot_df, state_df, rq_top_df, city_hint="Surat", state_code="IN-GJ"):
     def top_keyword(df, window=-48):
@@ -170,11 +232,16 @@ def package_signals(iot_df, state_df, rq_top_df, city_hint="Surat", state_code="
 #                 }
 #             }
 
-@retry(
-    stop=stop_after_attempt(3),            # Retry up to 3 times
-    wait=wait_exponential(multiplier=2, min=2, max=10),  # Exponential backoff
-    retry=retry_if_exception_type(Exception)  # Retry on any exception
-)
+def _mock_frames(keywords):
+    """Deterministic stand-in data: keywords ranked in the order given."""
+    index = pd.date_range(end=pd.Timestamp.today().normalize(), periods=12, freq="W")
+    iot_df = pd.DataFrame(
+        {kw: np.full(len(index), round(100 * 0.85 ** i)) for i, kw in enumerate(keywords)},
+        index=index,
+    )
+    rq_top_df = pd.DataFrame(columns=["keyword", "query", "value"])
+    return iot_df, iot_df.copy(), rq_top_df
+
 def run_market_analyst(
     keywords="",
     geo="",
@@ -186,13 +253,21 @@ def run_market_analyst(
     """
     Run a complete market trend analysis pipeline using Google Trends data.
 
-    Includes retry logic (via Tenacity) and structured exception handling.
+    Each Trends request is retried on its own (see `fetch_retry`); this
+    function adds structured exception handling around the steps.
+
+    With `mock=True` no Trends request is made: the payload is built from
+    deterministic placeholder series (keywords ranked in the order given)
+    and marked `"source": "mock"`. Used as the last degraded mode.
     """
+    if mock:
+        iot_df, state_df, rq_top_df = _mock_frames(list(keywords))
+        payload = package_signals(iot_df, state_df, rq_top_df, city_hint="Surat", state_code=sub_geo)
+        payload["source"] = "mock"
+        return {"payload": payload, "artifacts": {}}
+
     try:
-        global MOCK
-        MOCK = mock
-        global pytrend
-        pytrend = make_trends_client()
+        make_trends_client()
         logger.info("Initialized Google Trends client successfully.")
     except Exception as e:
         logger.exception("Failed to initialize Google Trends client.")
@@ -0,0 +1,215 @@
+# tools/trend_store.py
+"""
+Incremental, columnar store of Google Trends history.
+
+Every interest-over-time fetch used to re-download its whole window
+("today 3-m") although only the last day or two had changed. The store
+keeps one Parquet series per (gprop, geo, keyword):
+
+    {TREND_STORE_DIR}/gprop=<gprop>/geo=<geo>/keyword=<slug>/series.parquet
+
+and a request only fetches the date ranges the store is missing, extended
+by a few days into what is already stored. Trends normalizes every response
+to 0–100 within its own window, so each delta fetch is re-scaled onto the
+stored series using the median ratio over those overlapping days (any
+requested keyword with stored overlap acts as the anchor). The stitched
+window is finally re-normalized to 0–100, matching what pytrends returns.
+
+Today's point is still accumulating, so it is never stored: a fetch that
+returns it serves it (flagged `isPartial`) to that request only, and the
+next fetch after midnight stores the final value.
+
+Series files are written to a per-writer temp file and renamed into place,
+so concurrent workers never interleave bytes in one file; the per-partition
+lock only orders writers within a process, and across processes the last
+rename wins (each writer's series is complete).
+
+Configuration (environment variables):
+    TREND_STORE_ENABLED     "1"/"0" (default 1; needs pyarrow)
+    TREND_STORE_DIR         store root (default artifacts/trends)
+"""
+import importlib.util
+import os
+import re
+import threading
+import uuid
+from datetime import date, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+OVERLAP_DAYS = 7
+# Today's point is partial; yesterday's counts as fresh
+FRESH_TOLERANCE_DAYS = 1
+
+FetchFn = Callable[[List[str], str, str, str], pd.DataFrame]
+
+_RELATIVE_RE = re.compile(r"^(?:today|now)\s+(\d+)-([dmy])$")
+
+
+def parse_timeframe(timeframe: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """pytrends timeframe → inclusive (start, end) dates."""
+    today = today or date.today()
+    tf = timeframe.strip()
+    if tf == "all":
+        return date(2004, 1, 1), today
+    m = _RELATIVE_RE.match(tf)
+    if m:
+        n, unit = int(m.group(1)), m.group(2)
+        days = {"d": n, "m": n * 30, "y": n * 365}[unit]
+        return today - timedelta(days=days), today
+    start, end = tf.split()
+    return date.fromisoformat(start), date.fromisoformat(end)
+
+
+def _slug(keyword: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", keyword.strip().lower()).strip("_") or "_"
+
+
+def _daily(df: pd.DataFrame) -> pd.DataFrame:
+    """Collapse hourly/partial rows onto calendar days."""
+    df = df.drop(columns=[c for c in df.columns if c == "isPartial"], errors="ignore")
+    if df.empty:
+        return df
+    df.index = pd.to_datetime(df.index).normalize()
+    return df.groupby(level=0).mean().astype(float)
+
+
+class TrendHistoryStore:
+    """Per-keyword Parquet series with delta fetches and overlap re-scaling."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._locks: Dict[tuple, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.fetches = 0
+        self.fetched_days = 0
+
+    # === Partitions ===
+    def _path(self, gprop: str, geo: str, keyword: str) -> Path:
+        return self.root / f"gprop={gprop or 'web'}" / f"geo={geo or 'world'}" / f"keyword={_slug(keyword)}" / "series.parquet"
+
+    def _lock(self, gprop: str, geo: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault((gprop, geo), threading.Lock())
+
+    def load(self, gprop: str, geo: str, keyword: str) -> pd.Series:
+        path = self._path(gprop, geo, keyword)
+        if not path.exists():
+            return pd.Series(dtype=float)
+        df = pd.read_parquet(path)
+        return df.set_index("date")["value"].sort_index()
+
+    def save(self, gprop: str, geo: str, keyword: str, series: pd.Series) -> None:
+        path = self._path(gprop, geo, keyword)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df = series.rename("value").rename_axis("date").reset_index()
+        # Unique per writer: other worker processes may be saving the same series
+        tmp = path.with_suffix(f".{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        df.to_parquet(tmp, index=False)
+        tmp.replace(path)
+
+    # === Planning ===
+    @staticmethod
+    def _missing(series: pd.Series, start: date, end: date) -> List[Tuple[date, date]]:
+        if series.empty:
+            return [(start, end)]
+        have_min, have_max = series.index.min().date(), series.index.max().date()
+        ranges = []
+        if have_min > start + timedelta(days=FRESH_TOLERANCE_DAYS):
+            ranges.append((start, min(have_min + timedelta(days=OVERLAP_DAYS), end)))
+        if have_max < end - timedelta(days=FRESH_TOLERANCE_DAYS):
+            ranges.append((max(have_max - timedelta(days=OVERLAP_DAYS), start), end))
+        return ranges
+
+    @staticmethod
+    def _merge_ranges(ranges: List[Tuple[date, date]]) -> List[Tuple[date, date]]:
+        merged: List[Tuple[date, date]] = []
+        for s, e in sorted(ranges):
+            if merged and s <= merged[-1][1] + timedelta(days=1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+            else:
+                merged.append((s, e))
+        return merged
+
+    @staticmethod
+    def _scale(stored: Dict[str, pd.Series], fetched: pd.DataFrame) -> float:
+        """Median stored/fetched ratio over overlapping non-zero days of any anchor keyword."""
+        ratios = []
+        for kw in fetched.columns:
+            old = stored.get(kw)
+            if old is None or old.empty:
+                continue
+            both = pd.concat([old, fetched[kw]], axis=1, join="inner").dropna()
+            both = both[(both.iloc[:, 0] > 0) & (both.iloc[:, 1] > 0)]
+            ratios.extend((both.iloc[:, 0] / both.iloc[:, 1]).tolist())
+        return float(pd.Series(ratios).median()) if ratios else 1.0
+
+    # === Public API ===
+    def interest_over_time(
+        self,
+        fetch: FetchFn,
+        keywords: List[str],
+        geo: str,
+        timeframe: str,
+        gprop: str,
+        today: Optional[date] = None,
+    ) -> pd.DataFrame:
+        """
+        Same shape as `TrendReq.interest_over_time()` for `timeframe`, served
+        from the store and topped up with delta fetches via `fetch`.
+        """
+        today = today or date.today()
+        start, end = parse_timeframe(timeframe, today)
+        cutoff = pd.Timestamp(today)
+        partial: Dict[str, pd.Series] = {}
+        with self._lock(gprop, geo):
+            stored = {kw: self.load(gprop, geo, kw) for kw in keywords}
+            ranges = self._merge_ranges([r for kw in keywords for r in self._missing(stored[kw], start, end)])
+            for s, e in ranges:
+                span = max(e - s, timedelta(days=OVERLAP_DAYS))
+                s = min(s, e - span)
+                raw = fetch(keywords, geo, f"{s.isoformat()} {e.isoformat()}", gprop)
+                self.fetches += 1
+                self.fetched_days += (e - s).days + 1
+                fetched = _daily(raw)
+                if fetched.empty:
+                    continue
+                ratio = self._scale(stored, fetched)
+                for kw in keywords:
+                    if kw not in fetched.columns:
+                        continue
+                    new = fetched[kw] * ratio
+                    # Today's partial point is served, never stored
+                    if (new.index >= cutoff).any():
+                        partial[kw] = new[new.index >= cutoff]
+                    new = new[new.index < cutoff]
+                    old = stored[kw]
+                    # Fresh values win on overlap
+                    stored[kw] = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+                    self.save(gprop, geo, kw, stored[kw])
+
+        series = {
+            kw: pd.concat([stored[kw], partial[kw]]).sort_index() if kw in partial else stored[kw]
+            for kw in keywords
+        }
+        window = pd.DataFrame(series)
+        window = window[(window.index >= pd.Timestamp(start)) & (window.index <= pd.Timestamp(end))]
+        peak = window.max().max() if not window.empty else 0
+        if peak and peak > 0:
+            window = (window * 100.0 / peak).round(0)
+        window["isPartial"] = window.index >= cutoff
+        window.index.name = "date"
+        return window
+
+
+@lru_cache(maxsize=1)
+def get_trend_store() -> Optional[TrendHistoryStore]:
+    """The configured store, or None if disabled or pyarrow is unavailable."""
+    if os.getenv("TREND_STORE_ENABLED", "1") in ("0", "false", "False"):
+        return None
+    if importlib.util.find_spec("pyarrow") is None:
+        return None
+    return TrendHistoryStore(Path(os.getenv("TREND_STORE_DIR", "artifacts/trends")))
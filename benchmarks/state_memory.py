@@ -0,0 +1,110 @@
+# benchmarks/state_memory.py
+"""
+Per-request LangGraph state size across refinement iterations.
+
+Replays the updates a strategist refinement loop makes to its state (planner
+answer, tool result, review, decider note) without calling any LLM, once
+with the old `operator.add` / dict-plan state and once with the bounded
+reducers from `app.state`, and reports:
+
+    - pickled state size after each iteration (what a checkpointer stores)
+    - tracemalloc peak for N concurrent requests held in memory
+
+Run from the repo root:
+    python -m benchmarks.state_memory --iterations 10 --concurrency 50
+"""
+import argparse
+import json
+import operator
+import pickle
+import tracemalloc
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from app.agents.zone_packer import pack_zones
+from app.schemas.layout import LayoutPlan
+from app.state import bounded_messages
+
+TRENDS = {
+    "interest_over_time_national": [
+        {"keyword": k, "score": s}
+        for k, s in [("iPhone 15", 95), ("gaming laptop", 88), ("earbuds", 72), ("smartwatch", 40)]
+    ]
+}
+
+
+def _plan(i: int) -> LayoutPlan:
+    zones = pack_zones((20, 12), "south", TRENDS)
+    for z in zones:
+        z.products = [f"{z.name} item {n} rev{i}" for n in range(6)]
+        z.fixtures = ["Gondola", "Wall bay", "Endcap"]
+    return LayoutPlan(
+        store_name="Blue Retail - Surat", city="Surat", dimensions_m=(20, 12),
+        entrance_side="south", zones=zones, best_practice_score=7.5,
+        compliance_notes=[f"note {n}" for n in range(5)],
+    )
+
+
+def _iteration_updates(i: int, legacy: bool):
+    """The state updates one planner → reviewer → decider → rag pass makes."""
+    plan = _plan(i)
+    retrieved = [{"text": "Aisle width guidance. " * 40, "source": f"doc{n}.pdf", "chunk": n} for n in range(8)]
+    call_id = str(uuid4())
+    return [
+        {"draft_plan": plan.model_dump() if legacy else plan, "messages": [AIMessage(content=plan.model_dump_json(indent=2))]},
+        {"review": {"is_compliant": False, "best_practice_score": 7.5, "issues": ["x"] * 5},
+         "messages": [AIMessage(content="Review: " + json.dumps({"issues": ["Aisle too narrow near checkout"] * 10}))]},
+        {"messages": [AIMessage(content="Refining layout...")]},
+        {"retrieved": retrieved,
+         "messages": [
+             AIMessage(content="", tool_calls=[{"name": "rag_tool", "args": {"query": "fix"}, "id": call_id, "type": "tool_call"}]),
+             ToolMessage(content=json.dumps({"retrieved": retrieved}), tool_call_id=call_id),
+         ]},
+    ]
+
+
+def _apply(state: dict, update: dict, reducer) -> None:
+    for key, value in update.items():
+        state[key] = reducer(state.get(key, []), value) if key == "messages" else value
+
+
+def run_request(iterations: int, legacy: bool):
+    reducer = operator.add if legacy else bounded_messages
+    state = {"store_name": "Blue Retail", "city": "Surat", "trends": TRENDS, "entrance_side": "south", "messages": []}
+    sizes = []
+    for i in range(iterations):
+        for update in _iteration_updates(i, legacy):
+            _apply(state, update, reducer)
+        sizes.append(len(pickle.dumps(state)))
+    return state, sizes
+
+
+def peak_bytes(iterations: int, concurrency: int, legacy: bool) -> int:
+    tracemalloc.start()
+    held = [run_request(iterations, legacy)[0] for _ in range(concurrency)]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    _, legacy = run_request(args.iterations, legacy=True)
+    _, bounded = run_request(args.iterations, legacy=False)
+    print(f"{'iter':>4} {'operator.add':>14} {'bounded':>10}")
+    for i, (a, b) in enumerate(zip(legacy, bounded), 1):
+        print(f"{i:>4} {a / 1024:>12.1f}KB {b / 1024:>8.1f}KB")
+
+    for label, flag in (("operator.add", True), ("bounded", False)):
+        peak = peak_bytes(args.iterations, args.concurrency, flag)
+        print(f"{label:>12}: peak {peak / 2**20:.1f} MiB for {args.concurrency} concurrent requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# data_ingestion/build_constraint_digests.py
+"""
+Distil the ingested corpus into per-source constraint digests.
+
+The building code, brand book, fixture catalog and leasing agreement don't
+change between requests, yet the strategist used to retrieve and resend
+raw chunks of them on every iteration. This step runs offline over the
+same documents as `index_documents` (text comes from the extraction cache)
+and keeps only what a layout has to respect:
+
+    - rules: clauses with a modal ("shall", "must", "minimum", "not
+      exceed", "prohibited", ...) about circulation, accessibility, walls,
+      the entrance, fixtures, building services or the brand, kept as
+      (shortened) text: the LLM reads the bounds where they're stated;
+    - fixtures: catalog model ids with their name and overall W/D/H.
+
+Each source keeps its best DIGEST_MAX_RULES rules. The result is a small
+JSON store (`app/constraint_digests.json` by default) read by
+`app.constraint_digests`; site-specific sources (a city's leasing
+agreement) are stored under their city.
+
+    python -m data_ingestion.build_constraint_digests [--out PATH]
+
+Configuration (environment variables):
+    CONSTRAINT_DIGESTS      output path (default app/constraint_digests.json)
+    DIGEST_MAX_RULES        rules kept per source (default 40)
+    DIGEST_MAX_RULE_CHARS   rule text cut-off (default 240)
+"""
+import argparse
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.constraint_digests import DIGESTS_PATH
+from app.schemas.constraints import Constraint, DigestBundle, FixtureSpec, SourceDigest
+from data_ingestion.corpus import CORPUS
+from data_ingestion.extract import extract_documents, file_hash
+
+# Bump when the rules below change, so stores built by older rules are obvious
+DIGEST_EXTRACTOR = "rules-2"
+MAX_RULES = int(os.getenv("DIGEST_MAX_RULES", "40"))
+MAX_RULE_CHARS = int(os.getenv("DIGEST_MAX_RULE_CHARS", "240"))
+
+CATEGORY_TERMS = {
+    "circulation": ["aisle", "walkway", "path", "corridor", "circulation", "passage", "clear width", "turning"],
+    "accessibility": ["ramp", "wheelchair", "accessible", "tactile", "handrail", "braille", "barrier"],
+    "walls": ["wall", "partition", "drilling", "fastening", "column", "structural"],
+    # Storefront glazing only: "glass" alone also matches glass shelves and cabinet doors
+    "entrance": ["entrance", "door", "storefront", "shopfront", "frontage", "decompression", "glazed front", "glass front"],
+    "fixtures": ["fixture", "shelf", "shelves", "shelving", "counter", "pedestal", "display table", "cabinet", "gondola"],
+    "services": ["hvac", "electrical", "lighting", "lumens", "lux", "kva", "noise", "db", "acoustic", "floor load", "sound"],
+    "brand": ["brand", "logo", "signage", "sign band"],
+}
+# A rule must be about the floor plate, or it is dropped (logo artwork, file formats, contracts)
+SPATIAL_TERMS = [
+    "store", "floor", "zone", "wall", "entrance", "door", "aisle", "path", "walkway", "corridor", "fixture",
+    "display", "layout", "area", "space", "counter", "shelf", "premises", "column", "ramp", "width",
+    "height", "depth", "clearance", "sightline", "glazed", "storefront",
+]
+# Layout-shaping categories first when ranking rules of equal strength
+CATEGORY_WEIGHT = {"circulation": 3, "accessibility": 3, "walls": 3, "entrance": 3, "fixtures": 2, "services": 1, "brand": 1}
+
+_MODAL = re.compile(
+    r"\b(shall|must|required|mandatory|minimum|maximum|at least|not less than|not exceed|no more than|"
+    r"prohibited|not permitted|impermissible|never)\b", re.I,
+)
+_DEFINITION = re.compile(r"\bshall mean\b|\bmeans\b", re.I)
+_MEASURE = re.compile(
+    r"(\d[\d,]*(?:\.\d+)?)\s*-?\s*(mm|cm|m|metres|meters|feet|foot|ft|inches|inch|%|kg|kva|db|lux|lumens|watts)\b"
+    r"|1\s*(?:in|:)\s*(\d+)",
+    re.I,
+)
+# Sentence ends, bullets and clause markers ("a) ", "5.4. ", "● ")
+_SPLIT = re.compile(r"(?<=[a-z)][.;])\s*(?=[A-Z(])|(?<=\d[.;])\s+(?=[A-Z(])|(?<=[a-z.;:])(?=[A-Z][A-Z ]{6,}:)|\s*[•●○◦]\s*|\s(?=[a-h]\)\s)|\s(?=\d+\.\d+\.?\s+[A-Z])")
+
+
+# === Rules ===
+def _clauses(text: str) -> List[str]:
+    flat = re.sub(r"\s*\n\s*", " ", text)
+    return [c.strip(" -–") for c in _SPLIT.split(flat) if c and len(c.strip()) > 25]
+
+
+def _category(clause: str) -> Tuple[Optional[str], int]:
+    lowered = clause.lower()
+    hits = {
+        cat: sum(1 for term in terms if re.search(rf"\b{re.escape(term)}", lowered))
+        for cat, terms in CATEGORY_TERMS.items()
+    }
+    best = max(hits, key=lambda c: (hits[c], CATEGORY_WEIGHT[c]))
+    return (best, hits[best]) if hits[best] else (None, 0)
+
+
+def _shorten(clause: str) -> str:
+    clause = re.sub(r"\s+", " ", clause).strip()
+    return clause if len(clause) <= MAX_RULE_CHARS else clause[: MAX_RULE_CHARS - 1].rsplit(" ", 1)[0] + "…"
+
+
+def extract_rules(pages: List[str], site_specific: bool = False) -> List[Constraint]:
+    """Best MAX_RULES constraint clauses of a document, in document order."""
+    scored = []
+    seen = set()
+    for page_no, page in enumerate(pages):
+        for clause in _clauses(page):
+            category, hits = _category(clause)
+            # Over 2x the cut-off is a flattened table or a run-on paragraph, not a rule
+            if category is None or _DEFINITION.search(clause) or len(clause) > 2 * MAX_RULE_CHARS:
+                continue
+            lowered = clause.lower()
+            if not any(re.search(rf"\b{term}", lowered) for term in SPATIAL_TERMS):
+                continue
+            modal = bool(_MODAL.search(clause))
+            measured = _MEASURE.search(clause) is not None
+            # Site facts ("two columns (600mm x 600mm) located centrally") count without a modal
+            if not (modal or (site_specific and measured)):
+                continue
+            key = clause.lower()[:120]
+            if key in seen:
+                continue
+            seen.add(key)
+            score = 2 * modal + 2 * measured + min(hits, 3) + CATEGORY_WEIGHT[category] - len(clause) / 400
+            scored.append((score, page_no, clause, category))
+
+    best = sorted(scored, key=lambda s: -s[0])[:MAX_RULES]
+    return [
+        Constraint(category=category, text=_shorten(clause), page=page_no)
+        for _, page_no, clause, category in sorted(best, key=lambda s: s[1])
+    ]
+
+
+# === Fixtures ===
+_FIXTURE_NAME = re.compile(r"(BRV-FX-[A-Z]+\d+)\s*\|\s*([^\n|]+)")
+_MODEL_ID = re.compile(r"Model ID\s+(BRV-FX-[A-Z]+\d+)\b")
+# "1200mm (W) × 450mm (D) × 2400mm (H)"; unlabelled sizes ("Large: 1200mm × 800mm × 900mm") read as W × D × H
+_DIMENSIONS = re.compile(
+    r"(\d[\d,]*)\s*mm\s*(?:\(([A-Z])\))?\s*[×x]\s*(\d[\d,]*)\s*mm\s*(?:\(([A-Z])\))?\s*[×x]\s*(\d[\d,]*)\s*mm\s*(?:\(([A-Z])\))?"
+)
+
+
+def extract_fixtures(pages: List[str]) -> List[FixtureSpec]:
+    """Catalog model ids with names (from the index) and overall dimensions (from each spec sheet)."""
+    text = "\n".join(pages)
+    names: Dict[str, str] = {}
+    for code, name in _FIXTURE_NAME.findall(text):
+        names.setdefault(code, name.strip())
+    dims: Dict[str, Dict[str, float]] = {}
+    for match in _MODEL_ID.finditer(text):
+        found = _DIMENSIONS.search(text, match.end(), match.end() + 800)
+        if found and match.group(1) not in dims:
+            values = found.groups()
+            dims[match.group(1)] = {
+                values[i + 1] or default: float(values[i].replace(",", ""))
+                for i, default in ((0, "W"), (2, "D"), (4, "H"))
+            }
+    return [FixtureSpec(code=code, name=names.get(code, ""), dimensions_mm=dims.get(code, {}))
+            for code in sorted(set(names) | set(dims))]
+
+
+# === Build ===
+def build_digests(corpus=CORPUS) -> DigestBundle:
+    extracted = extract_documents([fp for fp, _, _ in corpus])
+    sources = []
+    for fp, source, city in corpus:
+        pages = [doc.page_content for doc in extracted[fp]]
+        if not pages:
+            continue
+        sources.append(SourceDigest(
+            source=source,
+            city=city,
+            file_hash=file_hash(Path(fp)),
+            constraints=extract_rules(pages, site_specific=city is not None),
+            fixtures=extract_fixtures(pages),
+        ))
+    return DigestBundle(extractor=DIGEST_EXTRACTOR, sources=sources)
+
+
+def write_digests(bundle: DigestBundle, path: Path = DIGESTS_PATH) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(bundle.model_dump_json(indent=1, exclude_none=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Distil the ingested corpus into constraint digests.")
+    parser.add_argument("--out", type=Path, default=DIGESTS_PATH)
+    args = parser.parse_args()
+
+    bundle = build_digests()
+    write_digests(bundle, args.out)
+    for digest in bundle.sources:
+        print(f"✅ {digest.source} ({digest.city or 'all cities'}): "
+              f"{len(digest.constraints)} rules, {len(digest.fixtures)} fixtures")
+    print(f"ℹ️ Constraint digests written to {args.out}")
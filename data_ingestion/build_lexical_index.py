@@ -0,0 +1,57 @@
+# data_ingestion/build_lexical_index.py
+"""
+Build the local BM25 index (`data_ingestion/bm25_index.json`) offline.
+
+`index_documents` saves the index as a by-product of upserting to Pinecone,
+which needs credentials a container build doesn't have. This step splits
+the same documents with the same splitter (text comes from the extraction
+cache), so its chunks, and their (source, chunk) ids, are the ones in
+Pinecone, and hybrid retrieval can fuse the two rankings.
+
+    python -m data_ingestion.build_lexical_index [--out PATH]
+
+Configuration (environment variables):
+    RAG_LEXICAL_INDEX       output path (default data_ingestion/bm25_index.json)
+"""
+import argparse
+import logging
+from pathlib import Path
+from typing import Dict, List
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from app.tools.lexical_index import BM25Index, LEXICAL_INDEX_PATH
+from data_ingestion.corpus import CORPUS
+from data_ingestion.extract import extract_documents
+
+# Shared with index_documents: changing these changes the chunk ids in Pinecone
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def chunk_records(docs, source: str) -> List[Dict]:
+    """A file's extracted pages split into chunk records ({text, source, chunk})."""
+    chunks = splitter.split_documents(docs)
+    return [{"text": c.page_content, "source": source, "chunk": i} for i, c in enumerate(chunks)]
+
+
+def build_lexical_index(corpus=CORPUS) -> BM25Index:
+    extracted = extract_documents([fp for fp, _, _ in corpus])
+    records = []
+    for fp, source, _ in corpus:
+        if extracted[fp]:
+            records.extend(chunk_records(extracted[fp], source))
+    return BM25Index(records)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Build the local BM25 index over the corpus chunks.")
+    parser.add_argument("--out", type=Path, default=LEXICAL_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = build_lexical_index()
+    index.save(args.out)
+    print(f"✅ BM25 index over {len(index.docs)} chunks saved to {args.out}")
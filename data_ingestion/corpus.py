@@ -0,0 +1,15 @@
+# data_ingestion/corpus.py
+"""
+The documents ingested for retrieval and distilled into constraint digests:
+(path, source name, city). `city` is None for documents that apply
+everywhere and names the store's city for site-specific ones such as a
+leasing agreement.
+"""
+
+CORPUS = [
+    ("data/Blue_Retail_Brand_Book_v4.pdf", "brand_book", None),
+    ("data/Fixture_Catalog_Q3_2025.pdf", "fixture_catalog", None),
+    ("data/National_Building_Code_Accessibility_Chapter.txt", "building_code", None),
+    ("data/Store_Leasing_Agreement_Surat.pdf", "leasing_agreement", "Surat"),
+    ("data/Retail_Design_Best_Practices.md", "best_practices", None),
+]
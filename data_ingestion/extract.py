@@ -0,0 +1,179 @@
+# data_ingestion/extract.py
+"""
+Text extraction for ingestion: page-parallel PDFs and a per-file cache.
+
+    - PDFs are read with `pypdf` directly. Their pages are split into ranges
+      and extracted on a process pool, so a long leasing agreement or
+      fixture catalog uses every core. All files of a run share one pool.
+    - Markdown and text files are read as plain text. Markdown markup
+      (headings, emphasis, links, images, fences, HTML tags) is stripped
+      with a few regexes; the heavy `unstructured` stack isn't needed.
+    - Extracted pages are cached under `artifacts/extracted/<sha256>.json`,
+      keyed by the file's content hash and the extractor version, so a
+      re-index only parses new or changed files.
+
+The worker functions live here, not in `index_documents`, so the pool can
+import them without connecting to Pinecone.
+
+Configuration (environment variables):
+    INGEST_WORKERS          extraction processes (default: CPU count)
+    INGEST_PAGES_PER_TASK   PDF pages per pool task (default 8)
+    EXTRACT_CACHE_DIR       extracted-text cache (default artifacts/extracted)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+# Bump when extraction output changes, so cached text is re-extracted
+EXTRACTOR_VERSION = "1"
+EXTRACT_CACHE_DIR = Path(os.getenv("EXTRACT_CACHE_DIR", "artifacts/extracted"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+
+SUPPORTED_SUFFIXES = (".pdf", ".txt", ".md")
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# === Cache ===
+class ExtractedTextCache:
+    """Pages of extracted text per file content hash, as small JSON files."""
+
+    def __init__(self, root: Path = EXTRACT_CACHE_DIR):
+        self.root = root
+
+    def _path(self, digest: str) -> Path:
+        return self.root / f"{digest}.json"
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        path = self._path(digest)
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return data["pages"] if data.get("extractor") == EXTRACTOR_VERSION else None
+
+    def put(self, digest: str, pages: List[str]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(digest).with_suffix(".tmp")
+        tmp.write_text(json.dumps({"extractor": EXTRACTOR_VERSION, "pages": pages}), encoding="utf-8")
+        os.replace(tmp, self._path(digest))
+
+
+# === Extractors ===
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, stop: int) -> List[str]:
+    """Pool task: text of pages [start, stop). Each process opens the file itself."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+_MD_RULES = [
+    (re.compile(r"```[^\n]*\n(.*?)```", re.S), r"\1"),        # fenced code → its content
+    (re.compile(r"!\[([^\]]*)\]\([^)]*\)"), r"\1"),             # images → alt text
+    (re.compile(r"\[([^\]]+)\]\([^)]*\)"), r"\1"),              # links → label
+    (re.compile(r"<[^>\n]+>"), ""),                              # inline HTML tags
+    (re.compile(r"^\s{0,3}#{1,6}\s*", re.M), ""),                # heading markers
+    (re.compile(r"^\s{0,3}>\s?", re.M), ""),                     # blockquotes
+    (re.compile(r"^\s*([-*+]|\d+\.)\s+", re.M), ""),             # list bullets
+    (re.compile(r"^\s*([-*_]\s*){3,}$", re.M), ""),              # horizontal rules
+    (re.compile(r"(\*\*|\*|`)(?=\S)(.+?)(?<=\S)\1"), r"\2"),      # emphasis / inline code
+    (re.compile(r"(?<!\w)(__|_)(?=\S)(.+?)(?<=\S)\1(?!\w)"), r"\2"),  # _emphasis_, not snake_case
+]
+
+
+def markdown_to_text(markdown: str) -> str:
+    text = markdown
+    for pattern, repl in _MD_RULES:
+        text = pattern.sub(repl, text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def read_text(path: Path) -> str:
+    text = path.read_text(encoding="utf-8", errors="replace")
+    return markdown_to_text(text) if path.suffix == ".md" else text
+
+
+def _page_ranges(pages: int, per_task: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + per_task, pages)) for start in range(0, pages, per_task)]
+
+
+# === Pipeline ===
+def extract_documents(
+    paths: Sequence[str],
+    workers: int = INGEST_WORKERS,
+    cache: Optional[ExtractedTextCache] = None,
+) -> Dict[str, List[Document]]:
+    """
+    Page `Document`s per path (metadata: source path, page), parsing only
+    files whose content hash isn't cached. Unsupported types map to [].
+    """
+    cache = cache or ExtractedTextCache()
+    pages: Dict[str, List[str]] = {}
+    digests: Dict[str, str] = {}
+    pending_pdfs: List[str] = []
+    hits = 0
+
+    for fp in paths:
+        path = Path(fp)
+        if path.suffix not in SUPPORTED_SUFFIXES:
+            logger.warning(f"Unsupported file type {path.suffix}: {fp}")
+            pages[fp] = []
+            continue
+        digests[fp] = file_hash(path)
+        cached = cache.get(digests[fp])
+        if cached is not None:
+            pages[fp] = cached
+            hits += 1
+        elif path.suffix == ".pdf":
+            pending_pdfs.append(fp)
+        else:
+            pages[fp] = [read_text(path)]
+            cache.put(digests[fp], pages[fp])
+
+    if pending_pdfs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = dict(zip(pending_pdfs, pool.map(pdf_page_count, pending_pdfs)))
+            # Every page range of every PDF is queued at once, so small files
+            # don't leave workers idle while a large one finishes
+            tasks = [
+                (fp, pool.submit(extract_pdf_pages, fp, start, stop))
+                for fp in pending_pdfs
+                for start, stop in _page_ranges(counts[fp], PAGES_PER_TASK)
+            ]
+            for fp in pending_pdfs:
+                pages[fp] = []
+            for fp, future in tasks:
+                pages[fp].extend(future.result())
+        for fp in pending_pdfs:
+            cache.put(digests[fp], pages[fp])
+
+    logger.info(f"{hits} file(s) unchanged (cached text); {len(pending_pdfs)} PDF(s) parsed on {workers} worker(s)")
+    return {
+        fp: [Document(page_content=text, metadata={"source": fp, "page": i}) for i, text in enumerate(texts)]
+        for fp, texts in ((fp, pages[fp]) for fp in paths)
+    }
@@ -1,20 +1,21 @@
 # rag/ingest.py
+import logging
 import os
-from pathlib import Path
 from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import AzureOpenAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import ServerlessSpec
 
 # === Load environment variables ===
 from app.utils import load_env_file
+from app.clients import PINECONE_INDEX_NAME, get_embeddings, get_pinecone, get_pinecone_index
+from app.tools.lexical_index import BM25Index, LEXICAL_INDEX_PATH
+from data_ingestion.extract import extract_documents
+from data_ingestion.build_lexical_index import chunk_records
+from data_ingestion.corpus import CORPUS
 load_env_file()
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = "retail-copilot"
+INDEX_NAME = PINECONE_INDEX_NAME
 
 # === Initialize Pinecone client ===
-pc = Pinecone(api_key=PINECONE_API_KEY)
+pc = get_pinecone()
 
 # === Create index if not exists ===
 existing_indexes = [index["name"] for index in pc.list_indexes()]
@@ -33,57 +34,56 @@ else:
     print(f"ℹ️ Using existing index: {INDEX_NAME}")
 
 # === Connect to index ===
-index = pc.Index(INDEX_NAME)
+index = get_pinecone_index(INDEX_NAME)
 
 # === Embedding model ===
-embeddings = AzureOpenAIEmbeddings(
-    azure_deployment="text-embedding-3-small",
-    openai_api_version="2023-05-15"
-)
-
-# === Text splitter ===
-splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+embeddings = get_embeddings()
 
 # === Ingest function ===
-def ingest_document(file_path: str, source: str):
-    """Load, split, embed, and upload document chunks to Pinecone index."""
-    path = Path(file_path)
-    if path.suffix == ".pdf":
-        loader = PyPDFLoader(str(path))
-    elif path.suffix == ".txt":
-        loader = TextLoader(str(path))
-    elif path.suffix == ".md":
-        loader = UnstructuredMarkdownLoader(str(path))
-    else:
-        print(f"⚠️ Unsupported file type: {path.suffix}")
-        return
+def ingest_document(file_path: str, source: str, docs=None):
+    """Split, embed, and upload document chunks to Pinecone index.
+
+    `docs` are the file's extracted pages (see `data_ingestion.extract`);
+    they are extracted here when not given.
+
+    Returns the chunk records (without vectors) so the caller can build the
+    local BM25 index over exactly the same chunks.
+    """
+    if docs is None:
+        docs = extract_documents([file_path])[file_path]
+    if not docs:
+        return []
 
-    docs = loader.load()
-    chunks = splitter.split_documents(docs)
-    texts = [c.page_content for c in chunks]
-    vectors = embeddings.embed_documents(texts)
+    # Same splitter as build_lexical_index, so both indexes hold the same chunks
+    records = chunk_records(docs, source)
+    vectors = embeddings.embed_documents([r["text"] for r in records])
 
     items = [
         {
             "id": f"{source}_{i}",
             "values": vec,
-            "metadata": {"text": texts[i], "source": source, "chunk": i},
+            "metadata": records[i],
         }
         for i, vec in enumerate(vectors)
     ]
 
     index.upsert(vectors=items)
     print(f"✅ Ingested {len(items)} chunks from {source}")
+    return [item["metadata"] for item in items]
 
 # === Run once ===
 if __name__ == "__main__":
-    docs = [
-        ("data/Blue_Retail_Brand_Book_v4.pdf", "brand_book"),
-        ("data/Fixture_Catalog_Q3_2025.pdf", "fixture_catalog"),
-        ("data/National_Building_Code_Accessibility_Chapter.txt", "building_code"),
-        ("data/Store_Leasing_Agreement_Surat.pdf", "leasing_agreement"),
-        ("data/Retail_Design_Best_Practices.md", "best_practices"),
-    ]
+    # Surface extraction progress (data_ingestion.extract logs instead of printing)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    docs = [(fp, src) for fp, src, _ in CORPUS]
+
+    # Pages of every file extracted up front, in parallel; unchanged files come from the text cache
+    extracted = extract_documents([fp for fp, _ in docs])
 
+    lexical_docs = []
     for fp, src in docs:
-        ingest_document(fp, src)
+        lexical_docs.extend(ingest_document(fp, src, extracted[fp]))
+
+    # Local inverted index over the same chunks (hybrid / lexical retrieval)
+    BM25Index(lexical_docs).save(LEXICAL_INDEX_PATH)
+    print(f"✅ BM25 index over {len(lexical_docs)} chunks saved to {LEXICAL_INDEX_PATH}")
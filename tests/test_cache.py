@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import pytest
+
+from app.cache import MemoryBackend, NamespaceCache, SQLiteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(tmp_path / "cache.sqlite")
+
+
+def test_roundtrip_returns_a_copy(backend):
+    cache = NamespaceCache("t", 60, 10, backend)
+    value = {"a": [1, 2], "b": "x"}
+    cache.set(("k", 1), value)
+    hit = cache.get(("k", 1))
+    assert hit == value and hit is not value
+    assert cache.get(("k", 2)) is None
+
+
+def test_lru_evicts_least_recently_read_or_written(backend):
+    cache = NamespaceCache("t", 60, 3, backend)
+    for k in "abc":
+        cache.set(k, k)
+        time.sleep(0.002)  # distinct access times for the SQLite backend
+    assert cache.get("a") == "a"  # now the most recent
+    time.sleep(0.002)
+    cache.set("d", "d")
+    assert [cache.get(k) for k in "abcd"] == ["a", None, "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry_and_explicit_zero(backend):
+    cache = NamespaceCache("t", 60, 10, backend)
+    cache.set("short", 1, ttl_s=0.05)
+    cache.set("zero", 1, ttl_s=0)
+    cache.set("default", 1)
+    time.sleep(0.1)
+    assert cache.get("short") is None
+    assert cache.get("zero") is None
+    assert cache.get("default") == 1
+    assert cache.stats()["expired"] == 2
+
+
+def test_namespaces_are_independent(backend):
+    a, b = NamespaceCache("a", 60, 1, backend), NamespaceCache("b", 60, 1, backend)
+    a.set("k", "from a")
+    b.set("k", "from b")
+    assert a.get("k") == "from a" and b.get("k") == "from b"
+    a.clear()
+    assert a.get("k") is None and b.get("k") == "from b"
+
+
+def test_async_wrappers(backend):
+    cache = NamespaceCache("t", 60, 10, backend)
+
+    async def run():
+        await cache.aset("k", [1, 2])
+        return await cache.aget("k"), await cache.aget("missing")
+
+    assert asyncio.run(run()) == ([1, 2], None)
+
+
+def test_sqlite_reads_batch_their_lru_touches(tmp_path):
+    backend = SQLiteBackend(tmp_path / "cache.sqlite", touch_s=3600)
+    cache = NamespaceCache("t", 60, 2, backend)
+    cache.set("a", "a")
+    time.sleep(0.002)
+    cache.set("b", "b")
+    writes = backend._conn.total_changes
+    time.sleep(0.002)
+    for _ in range(5):
+        assert cache.get("a") == "a"
+    assert backend._conn.total_changes == writes  # hits didn't write
+    # The pending touch is applied before the next write evicts, so "b" goes
+    cache.set("c", "c")
+    assert [cache.get(k) for k in "abc"] == ["a", None, "c"]
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.checkpoints import CheckpointMismatch, request_fingerprint, resume_point
+
+
+class _Graph:
+    def __init__(self, values, next_nodes=()):
+        self._snapshot = SimpleNamespace(values=values, next=next_nodes)
+
+    async def aget_state(self, config):
+        return self._snapshot
+
+
+def test_fingerprint_tracks_request_inputs():
+    base = request_fingerprint("Surat", ["laptops"], None, None)
+    assert base == request_fingerprint("Surat", ["laptops"], None, None)
+    assert base != request_fingerprint("Pune", ["laptops"], None, None)
+    assert base != request_fingerprint("Surat", ["phones"], None, None)
+    assert base != request_fingerprint("Surat", ["laptops"], {"zones": []}, None)
+
+
+def test_resume_point():
+    fp = request_fingerprint("Surat", ["laptops"])
+    assert asyncio.run(resume_point(_Graph({}), "a", fp)) is None
+    assert asyncio.run(resume_point(_Graph({"request_fingerprint": fp}, ("draftsman",)), "a", fp)) == ("draftsman",)
+    assert asyncio.run(resume_point(_Graph({"request_fingerprint": fp}), "a", fp)) == ()
+
+
+def test_resume_point_rejects_a_different_request():
+    graph = _Graph({"request_fingerprint": request_fingerprint("Surat", ["laptops"])}, ("strategist",))
+    with pytest.raises(CheckpointMismatch):
+        asyncio.run(resume_point(graph, "a", request_fingerprint("Pune", ["laptops"])))
+
+
+def _saver(tmp_path):
+    from app.checkpoints import open_checkpointer
+    return open_checkpointer(tmp_path / "checkpoints.sqlite")
+
+
+def test_layout_lease_serialises_runs_of_one_layout(tmp_path, monkeypatch):
+    from app import checkpoints
+
+    monkeypatch.setattr(checkpoints, "LEASE_POLL_S", 0.01)
+    events = []
+
+    async def run(saver, name):
+        async with checkpoints.layout_lease(saver, "layout-1"):
+            events.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            events.append(f"{name} end")
+
+    async def main():
+        saver = await _saver(tmp_path)
+        try:
+            await asyncio.gather(run(saver, "a"), run(saver, "b"))
+            with pytest.raises(checkpoints.LayoutBusy):
+                async with checkpoints.layout_lease(saver, "layout-2"):
+                    async with checkpoints.layout_lease(saver, "layout-2", wait_s=0.02):
+                        pass
+        finally:
+            await checkpoints.close_checkpointer(saver)
+
+    asyncio.run(main())
+    assert events in (["a start", "a end", "b start", "b end"], ["b start", "b end", "a start", "a end"])
+
+
+def test_prune_checkpoints_drops_idle_and_excess_threads(tmp_path):
+    from app import checkpoints
+
+    async def main():
+        saver = await _saver(tmp_path)
+        try:
+            conn = saver.conn
+            for i, age in enumerate((10, 5000, 20, 30)):
+                await conn.execute(
+                    "INSERT INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id) VALUES (?, '', 'c')", (f"t{i}",))
+                await conn.execute(
+                    "INSERT INTO layout_threads (thread_id, updated_at) VALUES (?, ?)", (f"t{i}", time.time() - age))
+            # Still running (claimed just now): kept, and counts towards max_threads
+            await conn.execute("UPDATE layout_threads SET updated_at = ?, lease_until = ? WHERE thread_id = 't3'",
+                               (time.time(), time.time() + 60))
+            # Created before threads were tracked
+            await conn.execute("INSERT INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id) VALUES ('old', '', 'c')")
+            await conn.commit()
+            pruned = await checkpoints.prune_checkpoints(saver, ttl_s=1000, max_threads=2)
+            left = await conn.execute_fetchall("SELECT DISTINCT thread_id FROM checkpoints ORDER BY thread_id")
+            return pruned, [r[0] for r in left]
+        finally:
+            await checkpoints.close_checkpointer(saver)
+
+    # t1 is idle, t2 is the third most recent, "old" is untracked
+    assert asyncio.run(main()) == (3, ["t0", "t3"])
@@ -0,0 +1,42 @@
+from app.constraint_digests import RENDER_MEMO_SIZE, DigestStore
+from app.schemas.constraints import Constraint, DigestBundle, SourceDigest
+from data_ingestion.build_constraint_digests import _category
+
+
+def _store(tmp_path):
+    bundle = DigestBundle(extractor="test", sources=[
+        SourceDigest(source="Building Code", file_hash="a", constraints=[
+            Constraint(category="circulation", text="Aisles shall be at least 1200 mm wide."),
+        ]),
+        SourceDigest(source="Lease", city="Surat", file_hash="b", constraints=[
+            Constraint(category="walls", text="No drilling into the party wall."),
+        ]),
+    ])
+    path = tmp_path / "digests.json"
+    path.write_text(bundle.model_dump_json(), encoding="utf-8")
+    return DigestStore(path)
+
+
+def test_known_city_gets_its_site_rules(tmp_path):
+    store = _store(tmp_path)
+    assert store.known_city(" surat ")
+    assert "party wall" in store.render("Surat")
+    assert "party wall" not in store.render("Pune")
+    assert "1200 mm" in store.render("Pune")
+
+
+def test_render_memo_is_bounded(tmp_path):
+    store = _store(tmp_path)
+    for i in range(RENDER_MEMO_SIZE * 2):
+        store.render(f"unknown city {i}")
+    # Unknown cities share one render
+    assert len(store._rendered) == 1
+    for budget in range(RENDER_MEMO_SIZE * 2):
+        store.render("Surat", 100 + budget)
+    assert len(store._rendered) == RENDER_MEMO_SIZE
+
+
+def test_category_ignores_glass_fixtures():
+    assert _category("Glass display shelves shall carry at most 25 kg per shelf, lit to 300 lumens.")[0] == "fixtures"
+    assert _category("Lighting inside display cabinets must not exceed 500 lumens; glass doors tempered.")[0] == "services"
+    assert _category("The entrance door must provide a clear width of at least 1000 mm.")[0] == "entrance"
@@ -0,0 +1,67 @@
+from app.context_builder import build_context, compact_json, count_tokens, dedupe_chunks
+
+LEFT = "Fire exits must stay clear of fixtures at all times. " * 3 + "Aisles are at least 1.2 m wide in every sales area."
+RIGHT = "Aisles are at least 1.2 m wide in every sales area." + " Ramps need handrails on both sides." * 3
+
+
+def test_exact_duplicates_keep_the_best_score():
+    chunks = [
+        {"source": "a.pdf", "text": "Exits stay clear.", "score": 0.4},
+        {"source": "a.pdf", "text": "  Exits stay clear.  ", "score": 0.9},
+    ]
+    assert dedupe_chunks(chunks) == [{"source": "a.pdf", "text": "Exits stay clear.", "score": 0.9}]
+
+
+def test_chunks_contained_in_a_better_one_are_dropped():
+    chunks = [
+        {"source": "a.pdf", "text": LEFT, "score": 0.9},
+        {"source": "a.pdf", "text": "Aisles are at least 1.2 m wide", "score": 0.5},
+        # Containment is only checked within a source
+        {"source": "b.pdf", "text": "at least 1.2 m wide in every sales area", "score": 0.3},
+    ]
+    assert [(c["source"], c["score"]) for c in dedupe_chunks(chunks)] == [("a.pdf", 0.9), ("b.pdf", 0.3)]
+
+
+def test_adjacent_chunks_are_stitched_on_their_overlap():
+    chunks = [
+        {"source": "a.pdf", "chunk": 4, "text": RIGHT, "score": 0.8},
+        {"source": "a.pdf", "chunk": 3, "text": LEFT, "score": 0.6},
+        {"source": "a.pdf", "chunk": 9, "text": "Unrelated later passage.", "score": 0.1},
+    ]
+    merged = dedupe_chunks(chunks)
+    assert len(merged) == 2
+    assert merged[0]["text"] == LEFT + RIGHT[len("Aisles are at least 1.2 m wide in every sales area."):]
+    assert merged[0]["text"].count("Aisles are at least") == 1
+    assert merged[0]["score"] == 0.8
+    assert merged[1]["chunk"] == 9
+
+
+def test_adjacent_chunks_without_overlap_are_joined_on_a_newline():
+    chunks = [
+        {"source": "a.pdf", "chunk": 0, "text": "First passage.", "score": 0.5},
+        {"source": "a.pdf", "chunk": 1, "text": "Second passage.", "score": 0.5},
+    ]
+    assert dedupe_chunks(chunks)[0]["text"] == "First passage.\nSecond passage."
+
+
+def test_context_packs_best_chunks_within_budget():
+    chunks = [
+        {"source": "low.pdf", "text": "low " * 50, "score": 0.1},
+        {"source": "top.pdf", "text": "top " * 50, "score": 0.9},
+        {"source": "mid.pdf", "text": "mid " * 50, "score": 0.5},
+    ]
+    block = count_tokens("[top.pdf] " + "top " * 50) + 1
+    context = build_context(chunks, max_tokens=2 * block + 5)
+    assert context.startswith("[top.pdf]")
+    assert "[mid.pdf]" in context and "[low.pdf]" not in context
+    assert count_tokens(context) <= 2 * block + 5
+
+
+def test_oversized_top_chunk_is_truncated_not_dropped():
+    context = build_context([{"source": "big.pdf", "text": "word " * 2000, "score": 1.0}], max_tokens=20)
+    assert context.startswith("[big.pdf] word")
+    assert count_tokens(context) <= 21
+
+
+def test_compact_json_has_no_whitespace():
+    assert compact_json({"a": [1, 2], "b": "é"}) == '{"a":[1,2],"b":"é"}'
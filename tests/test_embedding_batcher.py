@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+from app.tools.embedding_batcher import EmbeddingMicroBatcher
+
+
+def _fake_embed(calls):
+    def embed_documents(texts):
+        calls.append(list(texts))
+        time.sleep(0.02)
+        return [[float(len(t))] for t in texts]
+    return embed_documents
+
+
+def test_concurrent_queries_share_one_batch():
+    calls = []
+    batcher = EmbeddingMicroBatcher(_fake_embed(calls), window_ms=50, max_batch=16)
+    results = {}
+
+    def query(text):
+        results[text] = batcher.embed_query(text)
+
+    threads = [threading.Thread(target=query, args=(t,)) for t in ("a", "bb", "bb", "ccc")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=2)
+
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0]}
+    assert len(calls) == 1 and sorted(calls[0]) == ["a", "bb", "ccc"]
+    stats = batcher.stats.as_dict()
+    assert stats["deduplicated"] == 1
+    assert stats["mean_batch_size"] == 3
+
+
+def test_cancelled_caller_does_not_strand_the_batch():
+    calls = []
+    batcher = EmbeddingMicroBatcher(_fake_embed(calls), window_ms=50, max_batch=16)
+
+    async def run():
+        tasks = [asyncio.create_task(batcher.aembed_query(t)) for t in ("a", "bb", "ccc", "dddd")]
+        await asyncio.sleep(0)
+        tasks[1].cancel()  # e.g. the losing side of a hedge
+        done = await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=2)
+        return done
+
+    results = asyncio.run(run())
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert results[0] == [1.0] and results[2] == [3.0] and results[3] == [4.0]
+    assert batcher.stats.cancelled == 1
+    # The cancelled caller's text is not embedded
+    assert all("bb" not in call for call in calls)
+
+
+def test_cancel_after_dispatch_still_resolves_others():
+    calls = []
+    batcher = EmbeddingMicroBatcher(_fake_embed(calls), window_ms=1, max_batch=16)
+
+    async def run():
+        tasks = [asyncio.create_task(batcher.aembed_query(t)) for t in ("a", "bb")]
+        await asyncio.sleep(0.01)  # batch is in flight
+        tasks[0].cancel()
+        return await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=2)
+
+    results = asyncio.run(run())
+    assert results[1] == [2.0]
+
+
+def test_failure_reaches_every_caller():
+    def failing(texts):
+        raise RuntimeError("quota")
+
+    batcher = EmbeddingMicroBatcher(failing, window_ms=20)
+
+    async def run():
+        return await asyncio.gather(*(batcher.aembed_query(t) for t in ("a", "b")), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.stats.failures == 1
+
+
+def test_sync_callers_on_pool_threads_are_served():
+    # Batches run on the batcher's own pool, however busy the callers' pool is
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+    batcher = EmbeddingMicroBatcher(_fake_embed(calls), window_ms=5, max_batch=2, workers=1)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(batcher.embed_query, "x" * n) for n in range(1, 9)]
+        assert [f.result(timeout=2) for f in futures] == [[float(n)] for n in range(1, 9)]
+    status = batcher.status()
+    assert status["batching"] and status["queries"] == 8
@@ -0,0 +1,49 @@
+from app.agents.flow_sim import MAX_DESTINATIONS, simulate
+from app.schemas.layout import LayoutPlan, Zone
+
+TRENDS = {"interest_over_time_national": [{"keyword": f"kw{i}", "score": 90 - i * 5} for i in range(10)]}
+
+
+def _grid_plan(n_x, n_y, length, width):
+    zones = [
+        Zone(name="Checkout", x=0, y=0, width=length * 0.3, height=2),
+        Zone(name="Storage", x=0, y=width - 3, width=length, height=3),
+    ]
+    cw, ch = length / n_x, (width - 7) / n_y
+    for i in range(n_x):
+        for j in range(n_y):
+            zones.append(Zone(
+                name=f"Zone {i}-{j}", x=i * cw + 0.6, y=3 + j * ch + 0.6, width=cw - 1.2, height=ch - 1.2,
+                products=[f"kw{(i * n_y + j) % 10}"],
+            ))
+    return LayoutPlan(
+        store_name="s", city="c", dimensions_m=(length, width), entrance_side="south", zones=zones, best_practice_score=5
+    )
+
+
+def test_small_store_every_zone_is_seen():
+    metrics = simulate(_grid_plan(3, 2, 20, 12), TRENDS, shoppers=500)
+    assert set(metrics.exposure) == {"Checkout"} | {f"Zone {i}-{j}" for i in range(3) for j in range(2)}
+    assert not metrics.unreachable
+    assert metrics.mean_path_m > 0
+    assert min(metrics.exposure.values()) > 0
+
+
+def test_large_store_scores_every_zone_with_capped_destinations():
+    plan = _grid_plan(20, 10, 100, 50)
+    assert len(plan.zones) - 2 > MAX_DESTINATIONS
+    metrics = simulate(plan, TRENDS, shoppers=500)
+    # Exposure still covers every walkable zone, not just the destinations
+    assert len(metrics.exposure) == len(plan.zones) - 1
+    assert not metrics.unreachable
+
+
+def test_walled_in_zone_is_unreachable():
+    plan = _grid_plan(3, 2, 20, 12)
+    zones = plan.zones + [
+        Zone(name="Storage A", x=14, y=4, width=6, height=1),
+        Zone(name="Storage B", x=14, y=4, width=1, height=5),
+        Zone(name="Kiosk", x=16, y=6, width=1, height=1),
+    ]
+    plan = plan.model_copy(update={"zones": zones})
+    assert "Kiosk" in simulate(plan, TRENDS, shoppers=200).unreachable
@@ -0,0 +1,48 @@
+import pytest
+
+from app.agents.geo_resolver import edit_distance, resolve_geo
+
+
+@pytest.mark.parametrize("city, sub_geo", [
+    ("Palghar", "IN-MH"),
+    ("Kolar", "IN-KA"),
+    ("Raigarh", "IN-CT"),
+    ("Etah", "IN-UP"),
+    ("Bhandara", "IN-MH"),
+    ("Gondia", "IN-MH"),
+    ("Buldhana", "IN-MH"),
+    ("Hingoli", "IN-MH"),
+    ("Washim", "IN-MH"),
+    ("Jalna", "IN-MH"),
+    ("Gadag", "IN-KA"),
+    ("Haveri", "IN-KA"),
+    ("Koppal", "IN-KA"),
+    ("Kodagu", "IN-KA"),
+    ("Aurangabad", "IN-MH"),
+    ("Aurangabad, Bihar", "IN-BR"),
+])
+def test_district_headquarters_resolve_exactly(city, sub_geo):
+    assert resolve_geo(city)["sub_geo"] == sub_geo
+
+
+@pytest.mark.parametrize("typo, sub_geo", [
+    ("Ahmadabad", "IN-GJ"),
+    ("Banglore", "IN-KA"),
+    ("Hydrabad", "IN-TG"),
+])
+def test_typos_within_the_edit_budget_resolve(typo, sub_geo):
+    assert resolve_geo(typo)["sub_geo"] == sub_geo
+
+
+@pytest.mark.parametrize("city", ["Mumbra", "Akolar", "Xyzabad", "Palgarhh Nagar"])
+def test_unknown_places_are_rejected_not_guessed(city):
+    # Akolar is one edit from both Akola (MH) and Kolar (KA): ambiguous, so rejected
+    with pytest.raises(ValueError, match="Unsupported city"):
+        resolve_geo(city)
+
+
+def test_edit_distance():
+    assert edit_distance("banglore", "bangalore") == 1
+    assert edit_distance("mumbra", "mumbai") == 2
+    assert edit_distance("ab", "ba") == 1
+    assert edit_distance("", "abc") == 3
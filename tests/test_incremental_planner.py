@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from app.agents.incremental_planner import (
+    IncrementalPlanner,
+    PlanMismatch,
+    ZoneAssignment,
+    ZoneAssignments,
+    affected_zones,
+    apply_assignments,
+    diff_signals,
+)
+from app.schemas.layout import LayoutPlan, Zone
+
+
+def _plan(**overrides) -> LayoutPlan:
+    fields = dict(
+        store_name="Test",
+        city="Surat",
+        dimensions_m=(20, 12),
+        entrance_side="south",
+        best_practice_score=7.0,
+        zones=[
+            Zone(name="Entrance", x=0, y=0, width=4, height=3, products=["phones"]),
+            Zone(name="Phones", x=4, y=0, width=6, height=4, products=["phones", "cases"]),
+            Zone(name="Laptops", x=10, y=0, width=6, height=4, products=["laptops", "bags", "mice"]),
+            Zone(name="Audio", x=4, y=4, width=6, height=4, products=["headphones"]),
+            Zone(name="Checkout", x=0, y=8, width=20, height=2),
+        ],
+    )
+    fields.update(overrides)
+    return LayoutPlan(**fields)
+
+
+def _signals(**scores) -> dict:
+    return {"interest_over_time_national": [{"keyword": kw, "score": s} for kw, s in scores.items()]}
+
+
+def test_diff_ignores_small_moves():
+    diff = diff_signals(_signals(phones=50, laptops=40, tv=10), _signals(phones=55, laptops=70, watches=30))
+    assert diff == {"added": ["watches"], "removed": ["tv"], "changed": {"laptops": (40.0, 70.0)}}
+
+
+def test_affected_zones_skip_structural_and_add_spare_zones_for_newcomers():
+    diff = {"added": ["watches"], "removed": [], "changed": {"phones": (50.0, 80.0)}}
+    # "Entrance" stocks phones too but is structural; the newcomer goes to the weakest-stocked zone
+    assert affected_zones(_plan(), diff) == ["Phones", "Audio"]
+
+
+def test_apply_assignments_restocks_only_targets():
+    plan = _plan()
+    assignments = ZoneAssignments(zones=[
+        ZoneAssignment(name="Phones", products=["phones", "watches"]),
+        ZoneAssignment(name="Laptops", products=["ignored"]),
+    ])
+    updated = apply_assignments(plan, ["Phones"], assignments)
+    assert updated.zones[1].products == ["phones", "watches"]
+    assert updated.zones[2] == plan.zones[2]
+    assert plan.zones[1].products == ["phones", "cases"]
+
+
+def test_apply_assignments_keeps_geometry_and_structural_zones():
+    plan = _plan()
+    assignments = ZoneAssignments(zones=[
+        ZoneAssignment(name="Checkout", products=["impulse buys"]),
+        ZoneAssignment(name="Audio", products=["speakers"], fixtures=["wall bay"]),
+    ])
+    updated = apply_assignments(plan, ["Audio"], assignments)
+    assert updated.zones[4] == plan.zones[4]
+    assert updated.zones[3].fixtures == ["wall bay"]
+    assert [(z.name, z.x, z.y, z.width, z.height) for z in updated.zones] == [
+        (z.name, z.x, z.y, z.width, z.height) for z in plan.zones
+    ]
+
+
+class _FakeLLM:
+    def __init__(self, zones):
+        self.zones = zones
+        self.calls = 0
+
+    def bind_tools(self, tools, tool_choice=None):
+        return self
+
+    def _reply(self):
+        self.calls += 1
+        return AIMessage(content="", tool_calls=[{"name": "ZoneAssignments", "args": {"zones": self.zones}, "id": "a1"}])
+
+    def invoke(self, messages):
+        return self._reply()
+
+    async def ainvoke(self, messages):
+        return self._reply()
+
+
+def test_replan_rejects_a_plan_for_another_site():
+    llm = _FakeLLM([])
+    planner = IncrementalPlanner(llm)
+    old, new = _signals(phones=50), _signals(phones=90)
+    with pytest.raises(PlanMismatch):
+        planner.replan(_plan(), old, new, city="Pune", entrance_side="south")
+    with pytest.raises(PlanMismatch):
+        asyncio.run(planner.areplan(_plan(), old, new, city="surat ", entrance_side="north"))
+    assert llm.calls == 0
+
+
+def test_replan_restocks_affected_zones():
+    llm = _FakeLLM([{"name": "Phones", "products": ["phones", "chargers"]}])
+    planner = IncrementalPlanner(llm)
+    old, new = _signals(phones=50), _signals(phones=90)
+    plan = planner.replan(_plan(), old, new, city=" SURAT", entrance_side="south")
+    assert plan.zones[1].products == ["phones", "chargers"]
+    plan = asyncio.run(planner.areplan(_plan(), old, new, city="Surat", entrance_side="south"))
+    assert plan.zones[1].products == ["phones", "chargers"]
+    # Nothing moved enough: the previous plan comes back without an LLM call
+    assert planner.replan(_plan(), old, old, city="Surat", entrance_side="south") == _plan()
+    assert llm.calls == 2
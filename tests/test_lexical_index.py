@@ -0,0 +1,43 @@
+from app.tools.lexical_index import BM25Index, query_identifiers, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    {"source": "fixture_catalog", "chunk": 0, "text": "Gondola BRV-FX-GD120 is 1200 mm wide; FX_200 wall bay."},
+    {"source": "building_code", "chunk": 0, "text": "Clause 7.3.2: aisles shall be at least 1200 mm clear."},
+    {"source": "best_practices", "chunk": 0, "text": "Keep the decompression zone free of fixtures."},
+]
+
+
+def test_identifiers_are_index_tokens():
+    for query in ("Dimensions of BRV-FX-GD120?", "fx_200 bay depth", "clause 7.3.2 aisle width", "GS12 shelf"):
+        tokens = set(tokenize(query))
+        identifiers = query_identifiers(query)
+        assert identifiers and all(i in tokens for i in identifiers)
+    assert query_identifiers("Dimensions of BRV-FX-GD120?") == ["brv-fx-gd120"]
+    assert query_identifiers("fx_200 bay depth") == ["fx_200"]
+    assert query_identifiers("clause 7.3.2") == ["7.3.2"]
+
+
+def test_plain_words_and_bare_numbers_are_not_identifiers():
+    assert query_identifiers("aisle width of 1200 mm near the entrance") == []
+
+
+def test_identifier_query_finds_the_chunk_containing_it():
+    index = BM25Index(DOCS)
+    for query in ("BRV-FX-GD120 width", "FX_200", "clause 7.3.2"):
+        hits = index.search(query, top_k=2)
+        assert hits and index.contains_all(hits[0], query_identifiers(query))
+    assert index.search("BRV-FX-GD120", 1)[0]["source"] == "fixture_catalog"
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = tmp_path / "bm25.json"
+    BM25Index(DOCS).save(path)
+    loaded = BM25Index.load(path)
+    assert [d["text"] for d in loaded.docs] == [d["text"] for d in DOCS]
+    assert loaded.search("decompression", 1)[0]["source"] == "best_practices"
+
+
+def test_rank_fusion_rewards_agreement():
+    a, b, c = DOCS
+    fused = reciprocal_rank_fusion([[a, b], [b, c]], top_k=3)
+    assert fused[0]["source"] == "building_code"
@@ -0,0 +1,46 @@
+import asyncio
+
+from app.cache import MemoryBackend
+from app.llm_cache import LLMResponseCache
+
+SCOPE = ("deployment", "planner:default", "hash", "surat|south")
+
+
+def _down(text):
+    raise ConnectionError("embedding service unavailable")
+
+
+async def _adown(text):
+    raise ConnectionError("embedding service unavailable")
+
+
+def test_exact_roundtrip_without_embeddings():
+    cache = LLMResponseCache(backend=MemoryBackend())
+    assert cache.get("prompt", SCOPE) is None
+    cache.put("prompt", SCOPE, "plan")
+    assert cache.get("prompt", SCOPE) == "plan"
+    assert cache.status()["exact_hits"] == 1 and cache.status()["misses"] == 1
+
+
+def test_embedding_outage_is_a_miss_and_a_dropped_store():
+    cache = LLMResponseCache(similarity_threshold=0.9, embed_fn=_down, aembed_fn=_adown, backend=MemoryBackend())
+    assert cache.get("prompt", SCOPE) is None
+    cache.put("prompt", SCOPE, "plan")
+    assert asyncio.run(cache.aget("prompt", SCOPE)) is None
+    asyncio.run(cache.aput("prompt", SCOPE, "plan"))
+    assert cache.status()["errors"] == 4
+
+
+class _BrokenBackend(MemoryBackend):
+    def _get(self, namespace, key):
+        raise OSError("disk I/O error")
+
+    def _set(self, namespace, key, raw, expires_at, max_entries):
+        raise OSError("disk I/O error")
+
+
+def test_backend_errors_are_a_miss():
+    cache = LLMResponseCache(backend=_BrokenBackend())
+    cache.put("prompt", SCOPE, "plan")
+    assert cache.get("prompt", SCOPE) is None
+    assert cache.status()["misses"] == 1
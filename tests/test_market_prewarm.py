@@ -0,0 +1,131 @@
+import asyncio
+import time
+
+import pytest
+
+from app.agents import market_prewarm
+from app.agents.market_prewarm import (
+    PrewarmScheduler, RequestHistory, TrendsBudget, _in_window, signal_key,
+)
+from app.cache import MemoryBackend, NamespaceCache
+from app.tools.run_market_analyst import _sent
+
+
+def _cache():
+    return NamespaceCache("prewarm", 3600, 16, MemoryBackend())
+
+
+class _Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(market_prewarm.time, "time", clock.time)
+    return clock
+
+
+def test_request_history_ranks_by_decayed_hits(clock):
+    history = RequestHistory(half_life_s=3600)
+    old, new = signal_key(["Laptops"], "IN", "IN-GJ"), signal_key(["phones"], "IN", "IN-MH")
+    for _ in range(3):
+        history.record(old, ["Laptops"])
+    clock.now += 3 * 3600  # three half-lives: 3 hits decay to 0.375
+    history.record(new, ["phones"])
+    assert history.top(2) == [new, old]
+    assert history.top(1) == [new]
+    assert history.keywords(old) == ["Laptops"]
+
+
+def test_signal_key_ignores_order_and_case():
+    assert signal_key(["Phones", "laptops"], "IN", "IN-GJ") == signal_key(["LAPTOPS", "phones "], "IN", "IN-GJ")
+
+
+def test_budget_spends_refills_and_caps(clock):
+    budget = TrendsBudget(60, _cache())
+    assert budget.try_spend(50)
+    assert not budget.try_spend(20)
+    clock.now += 600  # 10 minutes refill 10 requests
+    assert budget.tokens == pytest.approx(20)
+    clock.now += 10 * 3600
+    assert budget.tokens == pytest.approx(60)
+
+
+def test_budget_is_shared_through_the_cache(clock):
+    cache = _cache()
+    first, second = TrendsBudget(6, cache), TrendsBudget(6, cache)
+    assert first.try_spend(3) and second.try_spend(3)
+    assert not first.try_spend(1) and not second.try_spend(1)
+
+
+def test_budget_settles_to_requests_sent(clock):
+    budget = TrendsBudget(10, _cache())
+    assert budget.try_spend(3)
+    budget.settle(3, 1)  # history came from the trend store
+    assert budget.tokens == pytest.approx(9)
+    assert budget.try_spend(3)
+    budget.settle(3, 12)  # retries: the bucket goes into debt
+    assert budget.tokens == pytest.approx(-3)
+    assert not budget.try_spend(1)
+
+
+@pytest.mark.parametrize("hour, window, inside", [
+    (0, "0-7", True), (6, "0-7", True), (7, "0-7", False), (12, "0-7", False),
+    (23, "22-6", True), (3, "22-6", True), (6, "22-6", False), (21, "22-6", False),
+])
+def test_in_window(hour, window, inside):
+    assert _in_window(hour, window) is inside
+
+
+class _Store:
+    def __init__(self, ages):
+        self.ages = ages
+        self.put = {}
+
+    def age(self, key):
+        return self.ages.get(key)
+
+    def keywords(self, key):
+        return None
+
+    async def aput(self, key, result, keywords=None):
+        self.put[key] = (result, keywords)
+
+
+def test_due_picks_hot_keys_that_are_missing_or_stale(monkeypatch):
+    history = RequestHistory()
+    keys = [signal_key([kw], "IN", "IN-GJ") for kw in ("a", "b", "c")]
+    for key in keys:
+        history.record(key)
+    store = _Store({keys[0]: 60.0, keys[1]: 7 * 3600.0})
+    monkeypatch.setattr(market_prewarm, "request_history", history)
+    monkeypatch.setattr(market_prewarm, "signal_store", store)
+    scheduler = PrewarmScheduler(top_n=3, refresh_age_s=6 * 3600, budget_per_hour=60)
+    assert sorted(scheduler.due()) == sorted(keys[1:])
+
+
+def test_run_once_charges_the_budget_for_requests_sent(monkeypatch):
+    history = RequestHistory()
+    keys = [signal_key([kw], "IN", "IN-GJ") for kw in ("a", "b")]
+    for key in keys:
+        history.record(key, [key[2][0]])
+    store = _Store({})
+    monkeypatch.setattr(market_prewarm, "request_history", history)
+    monkeypatch.setattr(market_prewarm, "signal_store", store)
+
+    def analyst(keywords, **kwargs):
+        # One request per call, as if the stored history covered the rest
+        _sent.get()[0] += 1
+        return {"payload": {"keywords": keywords}}
+
+    monkeypatch.setattr(market_prewarm, "run_market_analyst", analyst)
+    scheduler = PrewarmScheduler(top_n=2, budget_per_hour=4)
+    scheduler.budget = TrendsBudget(4, _cache())
+    assert asyncio.run(scheduler.run_once()) == 2  # 3 reserved, 1 charged each
+    assert set(store.put) == set(keys)
+    assert scheduler.budget.tokens == pytest.approx(2, abs=0.01)
@@ -0,0 +1,41 @@
+import asyncio
+import tracemalloc
+
+from app import profiling
+
+
+def test_atrack_request_reports_survivors_and_node_memory(monkeypatch):
+    monkeypatch.setattr(profiling, "MEMORY_PROFILING", True)
+    monkeypatch.setattr(profiling, "SAMPLE_RATE", 1.0)
+    kept = []
+
+    async def node(state):
+        kept.append(bytearray(512 * 1024))
+        return state
+
+    runnable = profiling.instrumented_node("grow", lambda s: s, node)
+
+    async def request():
+        async with profiling.atrack_request("r1") as record:
+            await runnable.ainvoke({})
+        return record
+
+    try:
+        record = asyncio.run(request())
+    finally:
+        tracemalloc.stop()
+    assert [n.node for n in record.nodes] == ["grow"]
+    assert record.nodes[0].traced_delta_mb >= 0.5
+    assert record.summary["survived_mb"] >= 0.5
+    assert record.summary["leak_suspects"]
+
+
+def test_unsampled_requests_are_not_tracked(monkeypatch):
+    monkeypatch.setattr(profiling, "MEMORY_PROFILING", True)
+    monkeypatch.setattr(profiling, "SAMPLE_RATE", 0.0)
+
+    async def request():
+        async with profiling.atrack_request("r2") as record:
+            return record, profiling._current.get()
+
+    assert asyncio.run(request()) == (None, None)
@@ -0,0 +1,78 @@
+import pytest
+
+from app.prompt_loader import compile_prompt, compile_sources, load_bundle, write_bundle
+
+TEMPLATES = [
+    "Plan a store in {city} facing {entrance_side}.",
+    "Score: {score:.2f} / {total:>5d}",
+    "{{literal braces}} around {city!r} and {city!s} and {city!a}",
+    "No fields at all",
+    "{city}{city}{keywords}",
+]
+VALUES = {"city": "Surat", "entrance_side": "south", "score": 7.256, "total": 10, "keywords": ["a", "b"]}
+
+
+@pytest.mark.parametrize("template", TEMPLATES)
+def test_render_matches_str_format(template):
+    compiled = compile_prompt("p", "default", template)
+    assert compiled.segments is not None
+    assert compiled.render(**VALUES) == template.format(**VALUES)
+
+
+def test_attribute_and_index_fields_fall_back_to_str_format():
+    compiled = compile_prompt("p", "default", "{plan[name]} at {plan[city]}")
+    assert compiled.segments is None
+    assert compiled.fields == ("plan",)
+    assert compiled.render(plan={"name": "Blue", "city": "Pune"}) == "Blue at Pune"
+
+
+def test_missing_field_names_the_prompt():
+    compiled = compile_prompt("planner", "v2", "{city} {keywords}")
+    with pytest.raises(KeyError, match="planner:v2 needs keywords"):
+        compiled.render(city="Surat")
+
+
+def test_malformed_template_is_rejected_at_compile_time():
+    with pytest.raises(ValueError, match="not a valid template"):
+        compile_prompt("p", "default", "unclosed {city")
+
+
+def test_version_defaults_to_content_hash():
+    a = compile_prompt("p", "default", "{city}")
+    assert a.version == a.hash
+    assert compile_prompt("p", "default", "{city}", 3).version == "3"
+    assert compile_prompt("p", "default", "{city}!").hash != a.hash
+
+
+def test_bundle_roundtrip(tmp_path):
+    (tmp_path / "planner.yaml").write_text(
+        "version: 2\nvariants:\n  default:\n    prompt: 'Plan {city}'\n  short:\n    version: 5\n    prompt: '{city}'\n",
+        encoding="utf-8",
+    )
+    bundle = compile_sources(tmp_path)
+    path = tmp_path / "bundle.json"
+    write_bundle(bundle, path)
+    loaded = load_bundle(path)
+    assert loaded.digest == bundle.digest
+    assert loaded.prompts[("planner", "default")].version == "2"
+    assert loaded.prompts[("planner", "short")].render(city="Surat") == "Surat"
+
+
+def test_sources_edited_after_the_bundle_win(tmp_path):
+    import os
+
+    from app.prompt_loader import _build
+
+    source = tmp_path / "planner.yaml"
+    source.write_text("variants:\n  default:\n    prompt: 'Plan {city}'\n", encoding="utf-8")
+    bundle_path = tmp_path / "bundle.json"
+    write_bundle(compile_sources(tmp_path), bundle_path)
+    built = bundle_path.stat().st_mtime_ns
+    os.utime(source, ns=(built - 10**9, built - 10**9))
+    assert _build(bundle_path, tmp_path).source == str(bundle_path)
+
+    source.write_text("variants:\n  default:\n    prompt: 'Plan {city} now'\n", encoding="utf-8")
+    os.utime(source, ns=(built + 10**9, built + 10**9))
+    rebuilt = _build(bundle_path, tmp_path)
+    assert rebuilt.source == str(tmp_path)
+    assert rebuilt.prompts[("planner", "default")].render(city="Surat") == "Plan Surat now"
@@ -0,0 +1,47 @@
+import asyncio
+
+from app.rate_limiter import BATCH, INTERACTIVE, RateLimiter, llm_priority
+
+
+def _drained_limiter():
+    # 20 requests/s with room for one: grants are spaced 50 ms apart once the bucket is empty
+    limiter = RateLimiter("test", rpm=1200, burst_s=0.05)
+    limiter.throttled()
+    return limiter
+
+
+def test_interactive_callers_go_before_batch_fifo_within_a_level():
+    limiter = _drained_limiter()
+    granted = []
+
+    async def call(name, level):
+        with llm_priority(level):
+            await limiter.aacquire(10)
+        granted.append(name)
+
+    async def run():
+        await asyncio.gather(*(
+            call(name, level)
+            for name, level in [("b1", BATCH), ("b2", BATCH), ("i1", INTERACTIVE), ("b3", BATCH), ("i2", INTERACTIVE)]
+        ))
+
+    asyncio.run(run())
+    assert granted == ["i1", "i2", "b1", "b2", "b3"]
+    assert limiter.stats.granted == 5
+
+
+def test_cancelled_head_hands_over_to_the_next_waiter():
+    limiter = _drained_limiter()
+
+    async def run():
+        head = asyncio.ensure_future(limiter.aacquire(10))
+        await asyncio.sleep(0)
+        nxt = asyncio.ensure_future(limiter.aacquire(10))
+        await asyncio.sleep(0)
+        head.cancel()
+        await asyncio.wait_for(nxt, timeout=1.0)
+        return head.cancelled()
+
+    assert asyncio.run(run())
+    assert limiter.stats.granted == 1
+    assert not limiter._queue
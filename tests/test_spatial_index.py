@@ -0,0 +1,79 @@
+import time
+
+import numpy as np
+import pytest
+
+from app.agents.spatial_index import SpatialIndex
+
+
+def _random_rects(rng, n, extent=100.0, size=(0.5, 6.0)):
+    xy = rng.uniform(0, extent, size=(n, 2))
+    wh = rng.uniform(*size, size=(n, 2))
+    return np.column_stack([xy, wh])
+
+
+def _brute_pairs(rects, levels, tol=1e-6):
+    x0, y0, w, h = rects.T
+    x1, y1 = x0 + w, y0 + h
+    pairs = []
+    for i in range(len(rects)):
+        for j in range(i + 1, len(rects)):
+            ix = min(x1[i], x1[j]) - max(x0[i], x0[j])
+            iy = min(y1[i], y1[j]) - max(y0[i], y0[j])
+            if levels[i] == levels[j] and ix > tol and iy > tol:
+                pairs.append((i, j))
+    return pairs
+
+
+def _brute_query(rects, levels, level, box, pad=0.0):
+    x0, y0, w, h = rects.T
+    ix = np.minimum(x0 + w, box[2]) - np.maximum(x0, box[0])
+    iy = np.minimum(y0 + h, box[3]) - np.maximum(y0, box[1])
+    return np.flatnonzero((levels == level) & (ix >= -pad - 1e-6) & (iy >= -pad - 1e-6))
+
+
+@pytest.fixture(params=[0, 1, 2])
+def layout(request):
+    rng = np.random.default_rng(request.param)
+    rects = _random_rects(rng, 300)
+    if request.param == 2:
+        # One sales floor covering most of the plate among small items
+        rects = np.vstack([rects, [[5.0, 5.0, 90.0, 80.0]]])
+    levels = rng.integers(0, 2, size=len(rects))
+    return rects, levels, SpatialIndex(rects, levels)
+
+
+def test_overlapping_pairs_match_brute_force(layout):
+    rects, levels, index = layout
+    assert sorted(index.overlapping_pairs()) == _brute_pairs(rects, levels)
+
+
+def test_queries_match_brute_force(layout):
+    rects, levels, index = layout
+    rng = np.random.default_rng(7)
+    for _ in range(50):
+        level = int(rng.integers(0, 2))
+        x, y = rng.uniform(0, 100, size=2)
+        w, h = rng.uniform(0, 30, size=2)
+        box = (x, y, x + w, y + h)
+        assert index.query(level, *box, pad=0.5).tolist() == _brute_query(rects, levels, level, box, 0.5).tolist()
+        assert index.at_point(level, x, y).tolist() == _brute_query(rects, levels, level, (x, y, x, y)).tolist()
+
+
+def test_neighbours_match_brute_force(layout):
+    rects, levels, index = layout
+    for i in range(0, len(rects), 17):
+        x0, y0, w, h = rects[i]
+        expected = _brute_query(rects, levels, levels[i], (x0, y0, x0 + w, y0 + h), 1.0)
+        assert index.neighbours(i, gap=1.0).tolist() == expected[expected != i].tolist()
+
+
+def test_one_large_zone_among_small_items_builds_fast():
+    rng = np.random.default_rng(3)
+    rects = np.vstack([[[0.0, 0.0, 2000.0, 1500.0]], _random_rects(rng, 5000, extent=1400.0, size=(0.3, 1.0))])
+    start = time.perf_counter()
+    index = SpatialIndex(rects)
+    pairs = index.overlapping_pairs()
+    assert time.perf_counter() - start < 1.0
+    # The big zone overlaps every small item
+    assert sum(1 for i, _ in pairs if i == 0) == 5000
@@ -0,0 +1,24 @@
+import logging
+
+from app import structured_logging
+from app.structured_logging import NonBlockingQueueHandler, setup_logging, shutdown_logging
+
+
+def test_shutdown_detaches_the_queue_handler():
+    root = logging.getLogger()
+    saved, level = list(root.handlers), root.level
+    try:
+        setup_logging(level="INFO", fmt="text")
+        assert any(isinstance(h, NonBlockingQueueHandler) for h in root.handlers)
+        shutdown_logging()
+        assert not any(isinstance(h, NonBlockingQueueHandler) for h in root.handlers)
+        # Late records go straight to the stream handler instead of a queue nobody drains
+        assert [type(h) for h in root.handlers] == [logging.StreamHandler]
+        assert structured_logging._listener is None
+        shutdown_logging()  # idempotent
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in saved:
+            root.addHandler(handler)
+        root.setLevel(level)
@@ -0,0 +1,113 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from app.agents.structured_planner import StructuredPlanner, _StreamState
+
+ZONES = [
+    {"name": "Entrance", "x": 0, "y": 0, "width": 4, "height": 3},
+    {"name": "Phones {new}", "x": 4, "y": 0, "width": 6, "height": 3, "products": ["iPhone \"15\""],
+     "placements": [{"code": "T1", "x": 4.5, "y": 0.5, "width": 1, "height": 1}]},
+    {"name": "Checkout", "x": 0, "y": 3, "width": 10, "height": 2},
+]
+PLAN = {"dimensions_m": [10, 5], "tags": [{"name": "not a zone"}], "zones": ZONES}
+DEFAULTS = {"store_name": "Test", "city": "Surat", "entrance_side": "south", "dimensions_m": (10, 5), "best_practice_score": 0.0}
+
+
+def _chunks(args: str, size: int = 7):
+    return [
+        AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": args[i:i + size], "id": None, "index": 0}])
+        for i in range(0, len(args), size)
+    ]
+
+
+def test_zones_are_validated_as_they_close():
+    stream = _StreamState(on_zone=lambda i, zone: seen.append((i, zone.name, len(stream.buffer))))
+    seen = []
+    args = json.dumps(PLAN)
+    for chunk in _chunks(args):
+        stream.feed(chunk)
+    # Every zone previewed before the stream ended, in order, and nothing else counted as a zone
+    assert [(i, name) for i, name, _ in seen] == [(0, "Entrance"), (1, "Phones {new}"), (2, "Checkout")]
+    assert all(pos < len(args) for _, _, pos in seen)
+    data = stream.finish()
+    assert data["dimensions_m"] == [10, 5]
+    assert sorted(stream.zones) == [0, 1, 2] and not stream.errors
+
+
+def test_truncated_stream_validates_the_last_zone_on_finish():
+    stream = _StreamState()
+    args = json.dumps({"zones": ZONES[:1]})[:-2]  # cut after the zone's closing brace
+    args = args[:args.rindex("}")]  # ... and before it
+    for chunk in _chunks(args):
+        stream.feed(chunk)
+    assert not stream.zones
+    stream.finish()
+    assert stream.zones[0].name == "Entrance"
+
+
+def test_invalid_zone_is_recorded_by_index():
+    stream = _StreamState()
+    zones = [ZONES[0], {"name": "No geometry"}, ZONES[2]]
+    for chunk in _chunks(json.dumps({"zones": zones})):
+        stream.feed(chunk)
+    stream.finish()
+    assert sorted(stream.zones) == [0, 2]
+    assert list(stream.errors) == [1]
+
+
+class _FakeLLM:
+    """Streams a fixed `LayoutPlan` tool call; answers repairs with a fixed `ZoneRepair`."""
+
+    def __init__(self, plan_args: str, repair_args: dict):
+        self.plan_args = plan_args
+        self.repair_args = repair_args
+        self.tool = None
+
+    def bind_tools(self, tools, tool_choice=None):
+        bound = _FakeLLM(self.plan_args, self.repair_args)
+        bound.tool = tool_choice
+        return bound
+
+    def stream(self, messages):
+        return iter(_chunks(self.plan_args))
+
+    async def astream(self, messages):
+        for chunk in _chunks(self.plan_args):
+            yield chunk
+
+    def _repair(self):
+        return AIMessage(content="", tool_calls=[{"name": "ZoneRepair", "args": self.repair_args, "id": "r1"}])
+
+    def invoke(self, messages):
+        return self._repair()
+
+    async def ainvoke(self, messages):
+        return self._repair()
+
+
+def test_repairs_go_through_the_guard():
+    plan_args = json.dumps({"zones": [ZONES[0], {"name": "Phones"}]})
+    llm = _FakeLLM(plan_args, {"zones": [ZONES[1]]})
+    guarded = []
+
+    def guard(call, prompt):
+        guarded.append(prompt)
+        return call(prompt)
+
+    async def aguard(acall, prompt):
+        guarded.append(prompt)
+        return await acall(prompt)
+
+    planner = StructuredPlanner(llm, guard=guard, aguard=aguard)
+    plan = planner.plan("prompt", DEFAULTS)
+    assert [z.name for z in plan.zones] == ["Entrance", "Phones {new}"]
+    plan = asyncio.run(planner.aplan("prompt", DEFAULTS))
+    assert [z.name for z in plan.zones] == ["Entrance", "Phones {new}"]
+    assert len(guarded) == 2 and all('"Phones"' in p for p in guarded)
+
+
+def test_empty_stream_returns_none():
+    planner = StructuredPlanner(_FakeLLM("", {}))
+    assert planner.plan("prompt", DEFAULTS) is None
@@ -0,0 +1,89 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from app.tools.trend_store import TrendHistoryStore, parse_timeframe
+
+pytest.importorskip("pyarrow")
+
+D = date(2025, 3, 31)
+
+
+def _days(start: date, end: date) -> pd.DatetimeIndex:
+    return pd.date_range(pd.Timestamp(start), pd.Timestamp(end), freq="D")
+
+
+def _series(start: date, end: date, value: float = 50.0) -> pd.Series:
+    return pd.Series(value, index=_days(start, end), dtype=float)
+
+
+def test_parse_timeframe():
+    assert parse_timeframe("today 3-m", D) == (D - timedelta(days=90), D)
+    assert parse_timeframe("now 7-d", D) == (D - timedelta(days=7), D)
+    assert parse_timeframe("2025-01-01 2025-02-01") == (date(2025, 1, 1), date(2025, 2, 1))
+
+
+def test_missing_ranges():
+    start, end = date(2025, 1, 1), D
+    missing = TrendHistoryStore._missing
+    assert missing(pd.Series(dtype=float), start, end) == [(start, end)]
+    # Yesterday counts as fresh; the start may be a day short
+    assert missing(_series(start + timedelta(days=1), end - timedelta(days=1)), start, end) == []
+    # Stale tail: refetched from OVERLAP_DAYS before the last stored day
+    assert missing(_series(start, date(2025, 3, 20)), start, end) == [(date(2025, 3, 13), end)]
+    # Missing head: fetched up to OVERLAP_DAYS into what is stored
+    assert missing(_series(date(2025, 2, 1), end), start, end) == [(start, date(2025, 2, 8))]
+
+
+def test_merge_ranges_joins_overlapping_and_adjacent():
+    merge = TrendHistoryStore._merge_ranges
+    d = lambda day: date(2025, 1, day)
+    assert merge([(d(10), d(20)), (d(1), d(5)), (d(6), d(8)), (d(18), d(25))]) == [(d(1), d(8)), (d(10), d(25))]
+    assert merge([]) == []
+
+
+def test_scale_is_the_median_ratio_over_overlapping_days():
+    idx = _days(date(2025, 1, 1), date(2025, 1, 5))
+    stored = {"a": pd.Series([10, 20, 30, 0, 40], index=idx, dtype=float)}
+    fetched = pd.DataFrame({"a": [5, 10, 10, 7, 20], "b": [1, 1, 1, 1, 1]}, index=idx, dtype=float)
+    # Ratios 2, 2, 3, (zero day skipped), 2 -> median 2; "b" has no stored anchor
+    assert TrendHistoryStore._scale(stored, fetched) == 2.0
+    assert TrendHistoryStore._scale({}, fetched) == 1.0
+
+
+class _Fetch:
+    """Trends stand-in: every response is scaled by `scale`, as Trends normalises per window."""
+
+    def __init__(self, truth: pd.Series, scale: float):
+        self.truth = truth
+        self.scale = scale
+        self.calls = []
+
+    def __call__(self, keywords, geo, timeframe, gprop):
+        s, e = (pd.Timestamp(x) for x in timeframe.split())
+        self.calls.append((s.date(), e.date()))
+        window = self.truth[(self.truth.index >= s) & (self.truth.index <= e)] * self.scale
+        return pd.DataFrame({keywords[0]: window, "isPartial": False})
+
+
+def test_delta_fetch_is_rescaled_onto_stored_history_and_today_is_not_stored(tmp_path):
+    store = TrendHistoryStore(tmp_path)
+    truth = pd.Series(range(1, 200), index=_days(date(2024, 10, 1), date(2025, 4, 17)), dtype=float)
+    first = _Fetch(truth, 1.0)
+    store.interest_over_time(first, ["phones"], "IN", "2025-01-01 2025-03-20", "froogle", today=date(2025, 3, 20))
+    assert first.calls == [(date(2025, 1, 1), date(2025, 3, 20))]
+    # The partial day (today) wasn't stored
+    assert store.load("froogle", "IN", "phones").index.max() == pd.Timestamp(2025, 3, 19)
+
+    later = _Fetch(truth, 0.5)  # the new window normalises to half the scale
+    window = store.interest_over_time(later, ["phones"], "IN", "2025-01-01 2025-03-31", "froogle", today=D)
+    assert later.calls == [(date(2025, 3, 12), D)]
+    stored = store.load("froogle", "IN", "phones")
+    # Re-scaled onto the stored series: the stitched history is the truth, without today
+    expected = truth[(truth.index >= pd.Timestamp(2025, 1, 1)) & (truth.index < pd.Timestamp(D))]
+    assert list(stored.index.date) == list(expected.index.date)
+    assert stored.to_numpy() == pytest.approx(expected.to_numpy())
+    assert bool(window["isPartial"].iloc[-1]) and not window["isPartial"].iloc[:-1].any()
+    assert window["phones"].max() == 100
+    assert not list(tmp_path.rglob("*.tmp"))
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from app.agents.zone_packer import pack_zones, try_pack_zones, validate_zones
+
+TRENDS = {
+    "interest_over_time_national": [
+        {"keyword": "iPhone 15", "score": 95},
+        {"keyword": "gaming laptop", "score": 88},
+        {"keyword": "headphones", "score": 40},
+    ]
+}
+
+
+def _rects(zones):
+    return np.array([[z.x, z.y, z.width, z.height] for z in zones])
+
+
+@pytest.mark.parametrize("side", ["north", "south", "east", "west"])
+@pytest.mark.parametrize("dims", [(20.0, 12.0), (12.0, 20.0), (60.0, 40.0), (10.0, 10.0)])
+def test_packed_zones_are_valid(dims, side):
+    zones = pack_zones(dims, side, TRENDS)
+    assert validate_zones(_rects(zones), dims) == []
+    assert {"Checkout", "Entrance Decompression", "Storage", "Iphone 15"} <= {z.name for z in zones}
+
+
+@pytest.mark.parametrize("dims, side", [
+    ((8.0, 6.0), "south"),
+    ((30.0, 6.0), "south"),
+    ((6.0, 30.0), "east"),
+    ((6.0, 30.0), "west"),
+    ((30.0, 6.0), "north"),
+])
+def test_shallow_or_narrow_floorplates_fall_back(dims, side):
+    with pytest.raises(ValueError):
+        pack_zones(dims, side, TRENDS)
+    assert try_pack_zones(dims, side, TRENDS) is None
+
+
+def test_narrow_frontage_deep_store_still_packs():
+    # 6 m of frontage but 30 m deep from a south entrance: plenty of depth to pack
+    zones = try_pack_zones((6.0, 30.0), "south", TRENDS)
+    assert zones is not None
+    assert validate_zones(_rects(zones), (6.0, 30.0)) == []
+
+
+def test_validate_zones_reports_overlap_and_bounds():
+    rects = np.array([[0, 0, 5, 5], [4, 4, 5, 5], [18, 0, 4, 4]], dtype=float)
+    problems = validate_zones(rects, (20.0, 12.0))
+    assert "zones 0 and 1 overlap" in problems
+    assert "zone 2 outside floorplate" in problems